@@ -0,0 +1,253 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from datetime import date, timedelta
+from typing import Optional
+from models import User, Course, CourseVideo, Progress
+from dependencies import get_current_user, get_read_db
+import numpy as np
+import io
+import threading
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+# Reports cover completed days only (date < today), so the progress slice and
+# every computed result can be cached until the date changes. Each tenant (school)
+# has its own slice and results; admins only see their own tenant.
+
+# Upper edges (seconds) of the watch-time distribution buckets
+WATCH_TIME_BUCKETS = [60, 300, 600, 1800, 3600, 7200, 10800]
+
+PROGRESS_SLICE_SQL = """
+    SELECT p.user_id, p.video_id, v.course_id,
+           (p.date - DATE '1970-01-01') AS day,
+           p.watch_seconds
+    FROM progress p
+    JOIN course_video v ON v.id = p.video_id
+    WHERE p.tenant_id = %s AND p.date < CURRENT_DATE
+"""
+
+_cache_lock = threading.Lock()
+_cache = {"day": None, "frames": {}, "results": {}}  # frames: tenant id -> frame; results: (tenant id, key) -> result
+
+def load_progress_frame(db: Session, tenant_id: str) -> dict:
+    """Load a tenant's (user_id, video_id, course_id, day, watch_seconds) for completed days as NumPy columns"""
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql":
+        # COPY streams plain text that NumPy parses in C, far faster than building row tuples
+        buffer = io.BytesIO()
+        raw = bind.raw_connection()
+        try:
+            cursor = raw.cursor()
+            statement = cursor.mogrify(f"COPY ({PROGRESS_SLICE_SQL}) TO STDOUT WITH (FORMAT csv)", (tenant_id,)).decode()
+            cursor.copy_expert(statement, buffer)
+        finally:
+            raw.close()
+        text_rows = buffer.getvalue().replace(b"\n", b",")
+        data = np.fromstring(text_rows, dtype=np.int64, sep=",") if text_rows else np.empty(0, dtype=np.int64)
+        data = data.reshape(-1, 5)
+    else:
+        epoch = date(1970, 1, 1)
+        rows = db.query(
+            Progress.user_id, Progress.video_id, CourseVideo.course_id, Progress.date, Progress.watch_seconds
+        ).join(CourseVideo, CourseVideo.id == Progress.video_id).filter(
+            Progress.tenant_id == tenant_id, Progress.date < date.today()
+        ).all()
+        data = np.array([
+            (user_id, video_id, course_id, (day - epoch).days, watch_seconds or 0)
+            for user_id, video_id, course_id, day, watch_seconds in rows
+        ], dtype=np.int64).reshape(-1, 5)
+
+    return {
+        "user_id": data[:, 0],
+        "video_id": data[:, 1],
+        "course_id": data[:, 2],
+        "day": data[:, 3],
+        "watch_seconds": data[:, 4],
+    }
+
+def cached(tenant_id: str, key: tuple, db: Session, compute):
+    """Return a result computed over a tenant's progress slice for today, computing it once per day"""
+    today = date.today()
+    key = (tenant_id, *key)
+    with _cache_lock:
+        if _cache["day"] != today:
+            _cache.update(day=today, frames={}, results={})
+        if key in _cache["results"]:
+            return _cache["results"][key]
+        if tenant_id not in _cache["frames"]:
+            _cache["frames"][tenant_id] = load_progress_frame(db, tenant_id)
+        frame = _cache["frames"][tenant_id]
+    result = compute(frame)
+    with _cache_lock:
+        if _cache["day"] == today:
+            _cache["results"][key] = result
+    return result
+
+def pair_key(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Combine two non-negative int columns into one int64 group key"""
+    return (first << 32) | second
+
+def require_admin(current_user: User):
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+
+def compute_course_completion(frame: dict, video_counts: dict) -> list:
+    # Distinct (user, video) pairs that were actually watched
+    watched = frame["watch_seconds"] > 0
+    pairs, first_index = np.unique(
+        pair_key(frame["user_id"][watched], frame["video_id"][watched]), return_index=True
+    )
+    courses = frame["course_id"][watched][first_index]
+    users = pairs >> 32
+    # Videos watched per (course, user)
+    course_users, videos_watched = np.unique(pair_key(courses, users), return_counts=True)
+    course_of_group = course_users >> 32
+
+    result = []
+    for course_id, total_videos in video_counts.items():
+        counts = videos_watched[course_of_group == course_id]
+        started = int(counts.size)
+        completed = int(np.count_nonzero(counts >= total_videos)) if total_videos else 0
+        result.append({
+            "course_id": course_id,
+            "videos": total_videos,
+            "students_started": started,
+            "students_completed": completed,
+            "completion_rate": round(completed / started, 4) if started else 0.0,
+            "average_fraction_watched": round(float(np.mean(np.minimum(counts / total_videos, 1.0))), 4) if started and total_videos else 0.0
+        })
+    return result
+
+def compute_drop_off(frame: dict, course_id: int, video_ids: list) -> list:
+    in_course = (frame["course_id"] == course_id) & (frame["watch_seconds"] > 0)
+    pairs = np.unique(pair_key(frame["video_id"][in_course], frame["user_id"][in_course]))
+    videos, viewers = np.unique(pairs >> 32, return_counts=True)
+    viewer_map = dict(zip(videos.tolist(), viewers.tolist()))
+    first_viewers = viewer_map.get(video_ids[0], 0) if video_ids else 0
+    return [
+        {
+            "position": position,
+            "video_id": video_id,
+            "students": viewer_map.get(video_id, 0),
+            "retention": round(viewer_map.get(video_id, 0) / first_viewers, 4) if first_viewers else 0.0
+        }
+        for position, video_id in enumerate(video_ids, start=1)
+    ]
+
+def compute_daily_active(frame: dict, start_day: int, end_day: int) -> list:
+    in_range = (frame["day"] >= start_day) & (frame["day"] <= end_day) & (frame["watch_seconds"] > 0)
+    day_users = np.unique(pair_key(frame["day"][in_range] - start_day, frame["user_id"][in_range]))
+    active = np.bincount(day_users >> 32, minlength=end_day - start_day + 1)
+    epoch = date(1970, 1, 1)
+    return [
+        {"date": (epoch + timedelta(days=start_day + offset)).isoformat(), "active_students": int(count)}
+        for offset, count in enumerate(active)
+    ]
+
+def compute_watch_time_distribution(frame: dict) -> dict:
+    # Total watch time per student-day
+    groups, inverse = np.unique(pair_key(frame["day"], frame["user_id"]), return_inverse=True)
+    totals = np.bincount(inverse, weights=frame["watch_seconds"], minlength=groups.size)
+    edges = [0] + WATCH_TIME_BUCKETS + [np.inf]
+    counts, _ = np.histogram(totals, bins=edges)
+    buckets = [
+        {"min_seconds": int(low), "max_seconds": None if np.isinf(high) else int(high), "student_days": int(count)}
+        for low, high, count in zip(edges[:-1], edges[1:], counts)
+    ]
+    if totals.size == 0:
+        return {"student_days": 0, "mean_seconds": 0, "p50_seconds": 0, "p90_seconds": 0, "p99_seconds": 0, "buckets": buckets}
+    p50, p90, p99 = np.percentile(totals, [50, 90, 99])
+    return {
+        "student_days": int(totals.size),
+        "mean_seconds": round(float(totals.mean()), 1),
+        "p50_seconds": int(p50),
+        "p90_seconds": int(p90),
+        "p99_seconds": int(p99),
+        "buckets": buckets
+    }
+
+@router.get("/courses/completion")
+def get_course_completion(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Per-course completion rates: students who watched every video of the course (admin only)"""
+    require_admin(current_user)
+    video_counts = {
+        course_id: 0 for (course_id,) in db.query(Course.id).filter(Course.tenant_id == current_user.tenant_id).order_by(Course.id)
+    }
+    for course_id, count in db.query(CourseVideo.course_id, func.count(CourseVideo.id)).group_by(CourseVideo.course_id):
+        if course_id in video_counts:
+            video_counts[course_id] = count
+    return cached(
+        current_user.tenant_id,
+        ("completion", tuple(video_counts.items())),
+        db,
+        lambda frame: compute_course_completion(frame, video_counts)
+    )
+
+@router.get("/courses/{course_id}/drop-off")
+def get_course_drop_off(
+    course_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Distinct students per video in playlist order, with retention relative to the first video (admin only)"""
+    require_admin(current_user)
+    if not db.query(Course.id).filter(Course.id == course_id, Course.tenant_id == current_user.tenant_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course not found"
+        )
+    video_ids = [video_id for (video_id,) in db.query(CourseVideo.id).filter(
+        CourseVideo.course_id == course_id
+    ).order_by(CourseVideo.id)]
+    return cached(
+        current_user.tenant_id,
+        ("drop-off", course_id, tuple(video_ids)),
+        db,
+        lambda frame: compute_drop_off(frame, course_id, video_ids)
+    )
+
+@router.get("/daily-active")
+def get_daily_active_students(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Distinct students with watch time per day (default: last 30 completed days, admin only)"""
+    require_admin(current_user)
+    end_date = end_date or date.today() - timedelta(days=1)
+    start_date = start_date or end_date - timedelta(days=29)
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start_date must be on or before end_date"
+        )
+    epoch = date(1970, 1, 1)
+    start_day = (start_date - epoch).days
+    end_day = (end_date - epoch).days
+    return cached(
+        current_user.tenant_id,
+        ("daily-active", start_day, end_day),
+        db,
+        lambda frame: compute_daily_active(frame, start_day, end_day)
+    )
+
+@router.get("/watch-time")
+def get_watch_time_distribution(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Distribution of total watch time per student per day (admin only)"""
+    require_admin(current_user)
+    return cached(current_user.tenant_id, ("watch-time",), db, compute_watch_time_distribution)
+
+@router.get("/health")
+def health_check():
+    return {"status": "healthy", "service": "analytics-service"}
@@ -0,0 +1,181 @@
+from datetime import date
+from sqlalchemy import text
+from database import DEFAULT_TENANT, all_engines, session_for_tenant
+from models import User, Attendance
+from live_events import publish
+import json
+import os
+import select
+import threading
+import time
+
+# Live attendance aggregate for the admin feed, one per tenant.
+# Seeded once from the database, then updated from status transitions on the
+# progress write path. On PostgreSQL transitions are sent through NOTIFY so every
+# instance (e.g. every Cloud Run container) applies them to its own aggregate.
+# Events carry their tenant_id; admins only see their own tenant's students.
+
+ADMIN_CHANNEL = "admin:attendance"
+NOTIFY_CHANNEL = "attendance_changes"
+
+# Re-read the student list this often so new signups show up in "not started"
+RESEED_SECONDS = int(os.getenv("LIVE_ATTENDANCE_RESEED_SECONDS", "600"))
+
+_lock = threading.Lock()
+_states = {}  # tenant id -> aggregate (see _empty_state)
+
+def _empty_state() -> dict:
+    return {
+        "date": None,          # date the aggregate describes (None = not seeded)
+        "seeded_at": 0.0,
+        "student_ids": set(),  # all students
+        "statuses": {},        # user_id -> today's status for students who started
+        "counts": {},          # status -> number of students
+    }
+
+def admin_channel(tenant_id: str) -> str:
+    return f"{ADMIN_CHANNEL}:{tenant_id}"
+
+def user_channel(tenant_id: str, user_id: int) -> str:
+    # User ids are only unique within a tenant's database
+    return f"user:{tenant_id}:{user_id}"
+
+def _seed(db, tenant_id: str):
+    today = date.today()
+    student_ids = {
+        user_id for (user_id,) in db.query(User.id).filter(User.tenant_id == tenant_id, User.role == 'student')
+    }
+    rows = db.query(Attendance.user_id, Attendance.status).filter(
+        Attendance.tenant_id == tenant_id, Attendance.date == today
+    ).all()
+    statuses = {user_id: status for user_id, status in rows if user_id in student_ids}
+    counts = {}
+    for status in statuses.values():
+        counts[status] = counts.get(status, 0) + 1
+    with _lock:
+        _states[tenant_id] = {
+            "date": today,
+            "seeded_at": time.monotonic(),
+            "student_ids": student_ids,
+            "statuses": statuses,
+            "counts": counts
+        }
+
+def _counters(state: dict) -> dict:
+    # Caller holds _lock
+    started = sum(state["counts"].values())
+    return {
+        "in_progress": state["counts"].get("in progress", 0),
+        "present": state["counts"].get("present", 0),
+        "not_started": max(0, len(state["student_ids"]) - started),
+        "students": len(state["student_ids"])
+    }
+
+def snapshot(tenant_id: str = DEFAULT_TENANT) -> dict:
+    """A tenant's current counters and per-student statuses for today (seeds from the database when stale)"""
+    with _lock:
+        state = _states.get(tenant_id) or _empty_state()
+        stale = (
+            state["date"] != date.today()
+            or time.monotonic() - state["seeded_at"] > RESEED_SECONDS
+        )
+    if stale:
+        db = session_for_tenant(tenant_id)
+        try:
+            _seed(db, tenant_id)
+        finally:
+            db.close()
+    with _lock:
+        state = _states[tenant_id]
+        return {
+            "type": "snapshot",
+            "date": state["date"].isoformat(),
+            "counters": _counters(state),
+            "statuses": {str(user_id): status for user_id, status in state["statuses"].items()}
+        }
+
+def dispatch(event: dict):
+    """Apply a status transition to its tenant's aggregate and push it to live subscribers"""
+    tenant_id = event.get("tenant_id", DEFAULT_TENANT)
+    publish(user_channel(tenant_id, event["user_id"]), event)
+
+    with _lock:
+        state = _states.get(tenant_id)
+        if state is None or state["date"] is None or state["date"].isoformat() != event["date"]:
+            # Not seeded yet or a different day; the next snapshot reads it from the database
+            return
+        user_id = event["user_id"]
+        if user_id not in state["student_ids"]:
+            return
+        previous = state["statuses"].get(user_id)
+        if previous == event["status"]:
+            # Already applied (duplicate notification)
+            return
+        if previous is not None:
+            state["counts"][previous] -= 1
+        state["counts"][event["status"]] = state["counts"].get(event["status"], 0) + 1
+        state["statuses"][user_id] = event["status"]
+        transition = {
+            "type": "transition",
+            "date": event["date"],
+            "user_id": user_id,
+            "from": previous,
+            "to": event["status"],
+            "total_seconds": event.get("total_seconds", 0),
+            "counters": _counters(state)
+        }
+    publish(admin_channel(tenant_id), transition)
+
+def broadcast_change(db, event: dict):
+    """Send a committed status transition to every instance (NOTIFY on PostgreSQL, local dispatch otherwise)"""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {
+            "channel": NOTIFY_CHANNEL,
+            "payload": json.dumps(event)
+        })
+        db.commit()
+    else:
+        dispatch(event)
+
+def broadcast_changes(db, events: list):
+    """broadcast_change for many transitions at once (one NOTIFY statement on PostgreSQL)"""
+    if not events:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"), {
+            "channel": NOTIFY_CHANNEL,
+            "payloads": [json.dumps(event) for event in events]
+        })
+        db.commit()
+    else:
+        for event in events:
+            dispatch(event)
+
+def _listen_forever(bind):
+    while True:
+        try:
+            connection = bind.raw_connection()
+            try:
+                listener = connection.dbapi_connection
+                listener.set_isolation_level(0)  # autocommit, required for LISTEN
+                listener.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Transitions may have been missed while disconnected
+                with _lock:
+                    _states.clear()
+                while True:
+                    if select.select([listener], [], [], 30) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        dispatch(json.loads(listener.notifies.pop(0).payload))
+            finally:
+                connection.invalidate()
+        except Exception:
+            # Database unavailable; retry shortly
+            time.sleep(5)
+
+def start_listener():
+    """Start a background LISTEN thread per PostgreSQL database (other databases dispatch locally)"""
+    for bind in all_engines():
+        if bind.dialect.name == "postgresql":
+            threading.Thread(target=_listen_forever, args=(bind,), name="attendance-listener", daemon=True).start()
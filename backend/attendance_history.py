@@ -0,0 +1,160 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from datetime import date, timedelta
+from models import Attendance, AttendanceStreak, AttendanceHistory
+import base64
+
+# Compact per-user attendance history: one bitmap of present days per year plus
+# streak counters, updated when a day becomes (or stops being) "present" so stats are O(1) reads.
+
+BITMAP_BYTES = 46  # 366 bits
+
+def day_bit(day: date) -> int:
+    return day.timetuple().tm_yday - 1
+
+def is_set(bitmap: bytes, bit: int) -> bool:
+    return bool(bitmap[bit // 8] & (1 << (bit % 8)))
+
+def get_history(db: Session, user_id: int, year: int, create: bool = False):
+    history = db.query(AttendanceHistory).filter(
+        AttendanceHistory.user_id == user_id,
+        AttendanceHistory.year == year
+    ).first()
+    if history is None and create:
+        history = AttendanceHistory(user_id=user_id, year=year, present_bitmap=bytes(BITMAP_BYTES), present_days=0)
+        db.add(history)
+    return history
+
+def record_present_day(db: Session, user_id: int, day: date):
+    """Mark a day as present in the user's history and advance streaks (caller commits)"""
+    streak = db.query(AttendanceStreak).filter(AttendanceStreak.user_id == user_id).with_for_update().first()
+    if streak is None:
+        # First tracked day for this user; earlier present days come from the attendance table
+        db.flush()
+        try:
+            with db.begin_nested():
+                rebuild_user_history(db, user_id)
+            return
+        except IntegrityError:
+            # Built concurrently (e.g. by attendance_stats), possibly without this day; add it to that one
+            streak = db.query(AttendanceStreak).filter(AttendanceStreak.user_id == user_id).with_for_update().first()
+
+    history = get_history(db, user_id, day.year, create=True)
+    bit = day_bit(day)
+    if is_set(history.present_bitmap, bit):
+        return
+    bitmap = bytearray(history.present_bitmap)
+    bitmap[bit // 8] |= 1 << (bit % 8)
+    history.present_bitmap = bytes(bitmap)
+    history.present_days = (history.present_days or 0) + 1
+
+    streak.total_present_days = (streak.total_present_days or 0) + 1
+
+    if streak.last_present_date is None or day > streak.last_present_date:
+        if streak.last_present_date == day - timedelta(days=1):
+            streak.current_streak += 1
+        else:
+            streak.current_streak = 1
+        streak.last_present_date = day
+        streak.longest_streak = max(streak.longest_streak, streak.current_streak)
+    else:
+        # A past day was backfilled (e.g. by an admin); recount streaks from the bitmaps
+        db.flush()
+        recompute_streaks(db, streak)
+
+def clear_present_day(db: Session, user_id: int, day: date):
+    """Remove a day that is no longer present from the user's history and recount streaks (caller commits)"""
+    streak = db.query(AttendanceStreak).filter(AttendanceStreak.user_id == user_id).with_for_update().first()
+    if streak is None:
+        # Not tracked yet; the first rebuild reads the attendance table
+        return
+    history = get_history(db, user_id, day.year)
+    bit = day_bit(day)
+    if history is None or not is_set(history.present_bitmap, bit):
+        return
+    bitmap = bytearray(history.present_bitmap)
+    bitmap[bit // 8] &= ~(1 << (bit % 8))
+    history.present_bitmap = bytes(bitmap)
+    history.present_days = max(0, (history.present_days or 0) - 1)
+    streak.total_present_days = max(0, (streak.total_present_days or 0) - 1)
+    db.flush()
+    recompute_streaks(db, streak)
+
+def recompute_streaks(db: Session, streak: AttendanceStreak):
+    """Recount current/longest streaks for a user from their yearly bitmaps"""
+    histories = db.query(AttendanceHistory).filter(
+        AttendanceHistory.user_id == streak.user_id
+    ).order_by(AttendanceHistory.year).all()
+    longest = current = 0
+    previous_day = last_day = None
+    for history in histories:
+        day = date(history.year, 1, 1)
+        while day.year == history.year:
+            if is_set(history.present_bitmap, day_bit(day)):
+                current = current + 1 if previous_day == day - timedelta(days=1) else 1
+                longest = max(longest, current)
+                previous_day = last_day = day
+            day += timedelta(days=1)
+    streak.current_streak = current
+    streak.longest_streak = longest
+    streak.last_present_date = last_day
+
+def rebuild_user_history(db: Session, user_id: int) -> AttendanceStreak:
+    """Build history and streaks from the attendance table (users tracked before history existed)"""
+    bitmaps = {}
+    for (day,) in db.query(Attendance.date).filter(
+        Attendance.user_id == user_id,
+        Attendance.status == "present"
+    ):
+        bitmap = bitmaps.setdefault(day.year, bytearray(BITMAP_BYTES))
+        bitmap[day_bit(day) // 8] |= 1 << (day_bit(day) % 8)
+
+    db.query(AttendanceHistory).filter(AttendanceHistory.user_id == user_id).delete(synchronize_session=False)
+    total_present_days = 0
+    for year, bitmap in bitmaps.items():
+        present_days = sum(bin(byte).count("1") for byte in bitmap)
+        total_present_days += present_days
+        db.add(AttendanceHistory(user_id=user_id, year=year, present_bitmap=bytes(bitmap), present_days=present_days))
+    streak = AttendanceStreak(user_id=user_id, current_streak=0, longest_streak=0, total_present_days=total_present_days)
+    db.add(streak)
+    db.flush()
+    recompute_streaks(db, streak)
+    return streak
+
+def attendance_stats(db: Session, user_id: int, year: int) -> dict:
+    """Streaks and yearly present-day summary for a user"""
+    streak = db.query(AttendanceStreak).filter(AttendanceStreak.user_id == user_id).first()
+    if streak is None:
+        try:
+            streak = rebuild_user_history(db, user_id)
+            db.commit()
+        except IntegrityError:
+            # Built concurrently by another request
+            db.rollback()
+            streak = db.query(AttendanceStreak).filter(AttendanceStreak.user_id == user_id).first()
+
+    history = get_history(db, user_id, year)
+    bitmap = history.present_bitmap if history else bytes(BITMAP_BYTES)
+    monthly = [0] * 12
+    day = date(year, 1, 1)
+    while day.year == year:
+        if is_set(bitmap, day_bit(day)):
+            monthly[day.month - 1] += 1
+        day += timedelta(days=1)
+
+    # A streak only counts as current if it reaches today or yesterday
+    current = streak.current_streak
+    if not streak.last_present_date or streak.last_present_date < date.today() - timedelta(days=1):
+        current = 0
+
+    return {
+        "user_id": user_id,
+        "current_streak": current,
+        "longest_streak": streak.longest_streak,
+        "last_present_date": streak.last_present_date.isoformat() if streak.last_present_date else None,
+        "total_present_days": streak.total_present_days,
+        "year": year,
+        "present_days_in_year": history.present_days if history else 0,
+        "monthly_present_days": monthly,
+        "present_bitmap": base64.b64encode(bitmap).decode()
+    }
@@ -1,12 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from datetime import date, time, datetime, timedelta
-from models import Progress, User, CourseVideo, Attendance
-from schemas import ProgressRequest, ProgressResponse, AttendanceResponse
-from database import get_db
-from dependencies import get_current_user_id, get_current_user
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from datetime import date, time, datetime, timedelta, timezone
+from models import Progress, User, Course, CourseVideo, Attendance, ProgressEvent
+from schemas import ProgressRequest, ProgressResponse, AttendanceResponse, AttendanceStatsResponse
+from database import get_db, mark_recent_write, request_tenant, session_for_tenant, DEFAULT_TENANT
+from dependencies import get_current_user_id, get_current_user, get_read_db, get_user_id_from_token, get_user_from_token
 from typing import Optional
+from watch_intervals import load_intervals, dump_intervals, merge_interval, covered_seconds
+from live_events import subscribe, unsubscribe
+from attendance_feed import admin_channel, user_channel, broadcast_change, snapshot
+from serialization import attendance_dict, progress_dict, trusted_json
+from attendance_history import record_present_day, clear_present_day, attendance_stats
+from cache import cached
+import asyncio
+import json
+import os
 
 router = APIRouter(prefix="/progress", tags=["Progress"])
 attendance_router = APIRouter(prefix="/attendance", tags=["Attendance"])
@@ -14,61 +26,349 @@ attendance_router = APIRouter(prefix="/attendance", tags=["Attendance"])
 # 3 hours in seconds (change back to 10800 for production)
 MINIMUM_ATTENDANCE_SECONDS = 120  # 10800 seconds for production (3 * 60 * 60)
 
+# Per-tenant (school) overrides of MINIMUM_ATTENDANCE_SECONDS:
+# TENANT_MINIMUM_ATTENDANCE_SECONDS="big-school=10800;pilot=60"
+TENANT_MINIMUM_ATTENDANCE_SECONDS = {}
+for entry in filter(None, os.getenv("TENANT_MINIMUM_ATTENDANCE_SECONDS", "").split(";")):
+    tenant, _, seconds = entry.partition("=")
+    TENANT_MINIMUM_ATTENDANCE_SECONDS[tenant.strip()] = int(seconds)
+
+# Columns selected for listings (as plain tuples, no ORM object hydration)
+ATTENDANCE_COLUMNS = (Attendance.id, Attendance.user_id, Attendance.date, Attendance.total_seconds, Attendance.status)
+PROGRESS_COLUMNS = (
+    Progress.id, Progress.user_id, Progress.video_id, Progress.date,
+    Progress.start_time, Progress.end_time, Progress.watch_seconds
+)
+
+# "direct": heartbeats update progress/attendance in the request. "outbox": heartbeats are
+# appended to progress_event (one INSERT) and the aggregator in progress_pipeline.py
+# maintains progress/attendance from the log; POST /progress then answers 202
+PROGRESS_WRITE_MODE = os.getenv("PROGRESS_WRITE_MODE", "direct")
+
+# Slack on the server clock for network and timer jitter: a heartbeat may credit at most the
+# time elapsed since the previous one for the same video, plus this
+HEARTBEAT_GRACE_SECONDS = float(os.getenv("HEARTBEAT_GRACE_SECONDS", "5"))
+
+# How often buffered WebSocket heartbeats are written to the database
+HEARTBEAT_FLUSH_SECONDS = float(os.getenv("HEARTBEAT_FLUSH_SECONDS", "30"))
+# Idle interval between SSE keepalive comments
+SSE_KEEPALIVE_SECONDS = 15
+
+# Today's status is polled by the dashboard; writes invalidate it (relayed to other workers), the TTL is a backstop
+TODAY_ATTENDANCE_CACHE_SECONDS = float(os.getenv("TODAY_ATTENDANCE_CACHE_SECONDS", "30"))
+
+def minimum_attendance_seconds(tenant_id: str) -> int:
+    """Watch time a tenant's students need in a day to be marked present"""
+    return TENANT_MINIMUM_ATTENDANCE_SECONDS.get(tenant_id, MINIMUM_ATTENDANCE_SECONDS)
+
+@cached("attendance:today", ttl=TODAY_ATTENDANCE_CACHE_SECONDS)
+def load_day_attendance(db: Session, tenant_id: str, user_id: int, day: date) -> Optional[dict]:
+    row = db.query(*ATTENDANCE_COLUMNS).filter(
+        Attendance.user_id == user_id,
+        Attendance.date == day
+    ).first()
+    return attendance_dict(*row) if row else None
+
+def ensure_attendance(db: Session, tenant_id: str, user_id: int, today: date) -> Attendance:
+    """Get today's attendance record for a user, creating it on the first video of the day"""
+    attendance = db.query(Attendance).filter(
+        Attendance.user_id == user_id,
+        Attendance.date == today
+    ).first()
+    
+    if not attendance:
+        # First video of the day - create attendance entry
+        try:
+            new_attendance = Attendance(
+                tenant_id=tenant_id,
+                user_id=user_id,
+                date=today,
+                total_seconds=0,
+                status="in progress"
+            )
+            db.add(new_attendance)
+            db.commit()
+            db.refresh(new_attendance)
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to create attendance record: {str(e)}"
+            )
+        # Student moves from "not started" to "in progress" on the live feeds
+        event = attendance_event(new_attendance)
+        event["previous_status"] = None
+        broadcast_change(db, event)
+        return new_attendance
+    return attendance
+
+def as_utc(moment: datetime) -> datetime:
+    """Timezone-aware UTC datetime (SQLite hands back naive UTC timestamps)"""
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+def observed_since(heartbeat_at: datetime, start_time_obj: Optional[time], end_time_obj: Optional[time]) -> Optional[datetime]:
+    """Server time a segment heartbeat's client was first seen, from its server-clock session times"""
+    if start_time_obj is None or end_time_obj is None:
+        return None
+    window = datetime.combine(date.min, end_time_obj) - datetime.combine(date.min, start_time_obj)
+    return as_utc(heartbeat_at) - max(window, timedelta(0))
+
+def apply_heartbeat(
+    progress: Progress,
+    start_time_obj: Optional[time] = None,
+    end_time_obj: Optional[time] = None,
+    watch_seconds_delta: Optional[int] = None,
+    segments: Optional[list] = None,
+    heartbeat_at: Optional[datetime] = None,
+    since: Optional[datetime] = None,
+    duration_seconds: Optional[int] = None
+) -> bool:
+    """Apply one heartbeat to a progress record; returns True if watch time changed.
+    
+    Watch time is the union of the watched segments plus the seconds credited by
+    heartbeats without a segment (`delta_seconds`), so the two kinds never cancel out.
+    Segments are clamped to the video's duration. With the server time of the heartbeat,
+    segments (or a legacy delta) may only credit as many seconds as the record's credit
+    clock (`credited_until`, else `since`, else now) trails it, plus HEARTBEAT_GRACE_SECONDS;
+    the clock then advances by the seconds claimed. A heartbeat without either (playback
+    started) moves the clock up to now, so idle time before it can't be claimed later.
+    Without `heartbeat_at` (seeded history) nothing is limited by time.
+    """
+    if start_time_obj and not progress.start_time:
+        # Set first start_time of the day
+        progress.start_time = start_time_obj
+    if end_time_obj:
+        # Update to latest end_time
+        progress.end_time = end_time_obj
+    
+    if segments and duration_seconds is not None:
+        segments = [(min(start, duration_seconds), min(end, duration_seconds)) for start, end in segments]
+    
+    allowance = None
+    if heartbeat_at is not None:
+        heartbeat_at = as_utc(heartbeat_at)
+        clock = as_utc(progress.credited_until or since or heartbeat_at)
+        allowance = max(0.0, (heartbeat_at - clock).total_seconds() + HEARTBEAT_GRACE_SECONDS)
+        if not segments and not watch_seconds_delta:
+            progress.credited_until = max(clock, heartbeat_at)
+            allowance = None
+    claimed = 0.0
+    
+    changed = False
+    if progress.delta_seconds is None:
+        # Rows written before delta_seconds existed: time beyond the segments came from deltas
+        progress.delta_seconds = max(0, (progress.watch_seconds or 0) - int(covered_seconds(load_intervals(progress.watched_intervals))))
+    if segments:
+        intervals = load_intervals(progress.watched_intervals)
+        for segment_start, segment_end in segments:
+            if allowance is not None:
+                # Trim what the server clock doesn't cover
+                segment_end = min(segment_end, segment_start + max(0.0, allowance - claimed))
+                claimed += max(0.0, segment_end - segment_start)
+            intervals, merged = merge_interval(intervals, segment_start, segment_end)
+            changed = changed or merged
+        if changed:
+            progress.watched_intervals = dump_intervals(intervals)
+            progress.watch_seconds = int(covered_seconds(intervals)) + progress.delta_seconds
+    elif watch_seconds_delta:
+        # Accumulate watch time
+        if allowance is not None:
+            watch_seconds_delta = min(watch_seconds_delta, int(allowance))
+            claimed = watch_seconds_delta
+        if watch_seconds_delta > 0:
+            progress.delta_seconds += watch_seconds_delta
+            progress.watch_seconds = (progress.watch_seconds or 0) + watch_seconds_delta
+            changed = True
+    
+    if allowance is not None:
+        progress.credited_until = clock + timedelta(seconds=claimed)
+    return changed
+
+def updated_status(status: Optional[str], total_seconds: int, day: date, tenant_id: str = DEFAULT_TENANT) -> str:
+    """Attendance status after the day's watch time changed"""
+    # Check if total time >= the tenant's minimum, update status to "present"
+    if total_seconds >= minimum_attendance_seconds(tenant_id):
+        return "present"
+    # Keep as "in progress" if not already "present" (will be finalized at end of day);
+    # past days already finalized as "absent" stay absent
+    if status == "present" or (status == "absent" and day < date.today()):
+        return status
+    return "in progress"
+
+def save_progress(
+    db: Session,
+    tenant_id: str,
+    user_id: int,
+    video_id: int,
+    start_time_obj: Optional[time] = None,
+    end_time_obj: Optional[time] = None,
+    watch_seconds_delta: Optional[int] = None,
+    segments: Optional[list] = None,
+    since: Optional[datetime] = None,
+    duration_seconds: Optional[int] = None
+):
+    """Apply a heartbeat to today's progress record and refresh attendance.
+    
+    Either merges watched segments ([start, end] playhead seconds) or accumulates a
+    legacy watch-time delta in seconds, both limited by the server clock (see
+    apply_heartbeat). Returns (progress, attendance); attendance is None when watch
+    time did not change (e.g. a duplicate heartbeat).
+    """
+    today = date.today()
+    heartbeat_at = datetime.now(timezone.utc)
+    
+    def find_progress():
+        return db.query(Progress).filter(
+            Progress.user_id == user_id,
+            Progress.video_id == video_id,
+            Progress.date == today
+        ).first()
+    
+    def apply_progress(progress):
+        return apply_heartbeat(
+            progress, start_time_obj, end_time_obj, watch_seconds_delta, segments,
+            heartbeat_at=heartbeat_at, since=since, duration_seconds=duration_seconds
+        )
+    
+    # Check if progress record exists for today
+    progress = find_progress()
+    is_new = progress is None
+    if is_new:
+        progress = Progress(
+            tenant_id=tenant_id,
+            user_id=user_id,
+            video_id=video_id,
+            date=today
+        )
+        db.add(progress)
+    watch_time_changed = apply_progress(progress)
+    
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request created today's record concurrently - merge into that one
+        db.rollback()
+        progress = find_progress()
+        is_new = False
+        watch_time_changed = apply_progress(progress)
+        db.commit()
+    db.refresh(progress)
+    mark_recent_write(user_id)
+    
+    # Duplicate heartbeats leave watch time unchanged, so attendance is already up to date
+    if not (is_new or watch_time_changed):
+        return progress, None
+    
+    # Ensure attendance exists (in case it wasn't created earlier)
+    attendance = ensure_attendance(db, tenant_id, user_id, today)
+    previous_status = attendance.status
+    
+    # Update attendance total_seconds - sum all watch_seconds from progress table for this user today
+    total_seconds = db.query(func.coalesce(func.sum(Progress.watch_seconds), 0)).filter(
+        Progress.user_id == user_id,
+        Progress.date == today
+    ).scalar()
+    attendance.total_seconds = total_seconds
+    attendance.status = updated_status(attendance.status, total_seconds, today, tenant_id)
+    
+    # Keep streaks/history current in the same transaction as the status change
+    if attendance.status == "present" and previous_status != "present":
+        record_present_day(db, user_id, today)
+    
+    db.commit()
+    db.refresh(attendance)
+    load_day_attendance.invalidate(tenant_id, user_id, today)
+    
+    # Let live channels (student WebSocket/SSE, admin feed) know the status changed
+    if attendance.status != previous_status:
+        event = attendance_event(attendance)
+        event["previous_status"] = previous_status
+        broadcast_change(db, event)
+    
+    return progress, attendance
+
+def append_progress_events(db: Session, tenant_id: str, user_id: int, events: list) -> Optional[int]:
+    """Append heartbeats to the progress_event log (outbox mode): one INSERT, no reads.
+    
+    Events are dicts of start_time, end_time, watch_seconds (delta) and/or position_start,
+    position_end, dated today. Segment events carry server-clock start_time/end_time whose
+    span is how long the client was seen before the segment (see observed_since).
+    Returns the event id when a single event is appended.
+    """
+    statement = insert(ProgressEvent)
+    if db.get_bind().dialect.name == "postgresql":
+        # The aggregator consumes in (txid, id) order up to the oldest running transaction
+        statement = statement.values(txid=func.txid_current())
+    rows = [{"tenant_id": tenant_id, "user_id": user_id, "date": date.today(), **event} for event in events]
+    if len(rows) == 1:
+        event_id = db.execute(statement.values(**rows[0]).returning(ProgressEvent.id)).scalar()
+    else:
+        db.execute(statement, rows)
+        event_id = None
+    db.commit()
+    return event_id
+
+def find_tenant_video(db: Session, tenant_id: str, video_id: int):
+    """(id, duration_seconds) of a video in one of the tenant's courses, None if there is none"""
+    return db.query(CourseVideo.id, CourseVideo.duration_seconds).join(Course, Course.id == CourseVideo.course_id).filter(
+        CourseVideo.id == video_id,
+        Course.tenant_id == tenant_id
+    ).first()
+
+def attendance_event(attendance: Attendance) -> dict:
+    """Build the attendance status frame pushed to live progress channels"""
+    return {
+        "type": "attendance",
+        "tenant_id": attendance.tenant_id,
+        "user_id": attendance.user_id,
+        "date": attendance.date.isoformat(),
+        "status": attendance.status,
+        "total_seconds": attendance.total_seconds or 0
+    }
+
 @router.post("", response_model=ProgressResponse, status_code=status.HTTP_201_CREATED)
 def track_progress(
     progress_data: ProgressRequest,
+    request: Request,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Track video watchtime progress"""
-    # Verify video exists
-    video = db.query(CourseVideo).filter(CourseVideo.id == progress_data.video_id).first()
-    if not video:
+    tenant_id = request_tenant(request)
+    outbox = PROGRESS_WRITE_MODE == "outbox"
+    # Verify video exists (in outbox mode the aggregator drops events for unknown videos)
+    video = None if outbox else find_tenant_video(db, tenant_id, progress_data.video_id)
+    if not outbox and video is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Video not found"
         )
     
-    today = date.today()
-    
-    # Helper function to ensure attendance exists
-    def ensure_attendance():
-        attendance = db.query(Attendance).filter(
-            Attendance.user_id == user_id,
-            Attendance.date == today
-        ).first()
-        
-        if not attendance:
-            # First video of the day - create attendance entry
-            try:
-                new_attendance = Attendance(
-                    user_id=user_id,
-                    date=today,
-                    total_time=timedelta(0),
-                    status="in progress"
-                )
-                db.add(new_attendance)
-                db.commit()
-                db.refresh(new_attendance)
-                return new_attendance
-            except Exception as e:
-                db.rollback()
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to create attendance record: {str(e)}"
-                )
-        return attendance
+    # Segment mode: the client reports which part of the video was watched and the
+    # server derives watch time from the union of watched segments
+    segment_mode = progress_data.position_start is not None and progress_data.position_end is not None
+    if segment_mode and (progress_data.position_start < 0 or progress_data.position_end < progress_data.position_start):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid watched segment. position_end must be >= position_start >= 0"
+        )
     
     # Check if this is the first video of the day (when start_time is provided)
-    # Create attendance record if it doesn't exist
-    if progress_data.start_time:
-        ensure_attendance()
+    # Create attendance record if it doesn't exist (in outbox mode the aggregator creates it)
+    if progress_data.start_time and not outbox:
+        ensure_attendance(db, tenant_id, user_id, date.today())
     
     # Parse time strings if provided
     start_time_obj = None
     end_time_obj = None
     
-    if progress_data.start_time:
+    if segment_mode:
+        # Session times come from the server clock, not the client
+        now = datetime.now().time().replace(microsecond=0)
+        start_time_obj = now
+        end_time_obj = now
+    
+    if progress_data.start_time and not segment_mode:
         try:
             start_time_obj = datetime.strptime(progress_data.start_time, "%H:%M:%S").time()
         except ValueError:
@@ -77,7 +377,7 @@ def track_progress(
                 detail="Invalid start_time format. Use HH:MM:SS"
             )
     
-    if progress_data.end_time:
+    if progress_data.end_time and not segment_mode:
         try:
             end_time_obj = datetime.strptime(progress_data.end_time, "%H:%M:%S").time()
         except ValueError:
@@ -86,182 +386,290 @@ def track_progress(
                 detail="Invalid end_time format. Use HH:MM:SS"
             )
     
-    # Calculate watch_time from watchtime_seconds if provided
-    watch_time_delta = None
-    if progress_data.watchtime_seconds is not None and progress_data.watchtime_seconds > 0:
-        watch_time_delta = timedelta(seconds=progress_data.watchtime_seconds)
-    
-    # Check if progress record exists for today
-    existing_progress = db.query(Progress).filter(
-        Progress.user_id == user_id,
-        Progress.video_id == progress_data.video_id,
-        Progress.date == today
-    ).first()
-    
-    if existing_progress:
-        # Update existing record - accumulate watch_time
-        if start_time_obj and not existing_progress.start_time:
-            # Set first start_time of the day
-            existing_progress.start_time = start_time_obj
-        if end_time_obj:
-            # Update to latest end_time
-            existing_progress.end_time = end_time_obj
-        
-        # Accumulate watch_time
-        if watch_time_delta:
-            if existing_progress.watch_time:
-                existing_progress.watch_time += watch_time_delta
-            else:
-                existing_progress.watch_time = watch_time_delta
-        
-        db.commit()
-        db.refresh(existing_progress)
-        
-        # Ensure attendance exists (in case it wasn't created earlier)
-        attendance = ensure_attendance()
-        
-        # Update attendance total_time - sum all watch_time from progress table for this user today
-        total_watch_time = db.query(func.sum(Progress.watch_time)).filter(
-            Progress.user_id == user_id,
-            Progress.date == today
-        ).scalar()
-        
-        # Convert to timedelta if it's not already (handles PostgreSQL INTERVAL type)
-        if total_watch_time is None:
-            total_watch_time = timedelta(0)
-        elif not isinstance(total_watch_time, timedelta):
-            # If it's a string or other type, try to convert
-            total_watch_time = timedelta(seconds=float(total_watch_time))
-        
-        attendance.total_time = total_watch_time
-        
-        # Check if total time >= 30 seconds, update status to "present"
-        # During the day, keep as "in progress" if < 30 seconds (will be marked "absent" at end of day)
-        total_seconds = total_watch_time.total_seconds()
-        if total_seconds >= MINIMUM_ATTENDANCE_SECONDS:
-            attendance.status = "present"
-        elif attendance.status != "present":
-            # Keep as "in progress" if not already "present" (will be finalized at end of day)
-            attendance.status = "in progress"
-        
-        db.commit()
-        db.refresh(attendance)
-        
-        # Format watch_time as HH:MM:SS
-        watch_time_str = None
-        if existing_progress.watch_time:
-            total_seconds = int(existing_progress.watch_time.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            watch_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        
-        return {
-            "id": existing_progress.id,
-            "user_id": existing_progress.user_id,
-            "video_id": existing_progress.video_id,
-            "date": existing_progress.date.isoformat(),
-            "start_time": existing_progress.start_time.strftime("%H:%M:%S") if existing_progress.start_time else None,
-            "end_time": existing_progress.end_time.strftime("%H:%M:%S") if existing_progress.end_time else None,
-            "watch_time": watch_time_str
-        }
-    else:
-        # Create new progress record
-        new_progress = Progress(
-            user_id=user_id,
-            video_id=progress_data.video_id,
-            date=today,
-            start_time=start_time_obj,
-            end_time=end_time_obj,
-            watch_time=watch_time_delta
-        )
-        db.add(new_progress)
-        db.commit()
-        db.refresh(new_progress)
-        
-        # Ensure attendance exists (in case it wasn't created earlier)
-        attendance = ensure_attendance()
-        
-        # Update attendance total_time - sum all watch_time from progress table for this user today
-        total_watch_time = db.query(func.sum(Progress.watch_time)).filter(
-            Progress.user_id == user_id,
-            Progress.date == today
-        ).scalar()
-        
-        # Convert to timedelta if it's not already (handles PostgreSQL INTERVAL type)
-        if total_watch_time is None:
-            total_watch_time = timedelta(0)
-        elif not isinstance(total_watch_time, timedelta):
-            # If it's a string or other type, try to convert
-            total_watch_time = timedelta(seconds=float(total_watch_time))
-        
-        attendance.total_time = total_watch_time
-        
-        # Check if total time >= 30 seconds, update status to "present"
-        # During the day, keep as "in progress" if < 30 seconds (will be marked "absent" at end of day)
-        total_seconds = total_watch_time.total_seconds()
-        if total_seconds >= MINIMUM_ATTENDANCE_SECONDS:
-            attendance.status = "present"
-        elif attendance.status != "present":
-            # Keep as "in progress" if not already "present" (will be finalized at end of day)
-            attendance.status = "in progress"
-        
-        db.commit()
-        db.refresh(attendance)
-        
-        # Format watch_time as HH:MM:SS
-        watch_time_str = None
-        if new_progress.watch_time:
-            total_seconds = int(new_progress.watch_time.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            watch_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        
-        return {
-            "id": new_progress.id,
-            "user_id": new_progress.user_id,
-            "video_id": new_progress.video_id,
-            "date": new_progress.date.isoformat(),
-            "start_time": new_progress.start_time.strftime("%H:%M:%S") if new_progress.start_time else None,
-            "end_time": new_progress.end_time.strftime("%H:%M:%S") if new_progress.end_time else None,
-            "watch_time": watch_time_str
-        }
+    # Accumulate watchtime_seconds if provided (legacy clients without segments)
+    watch_seconds_delta = None
+    if not segment_mode and progress_data.watchtime_seconds is not None and progress_data.watchtime_seconds > 0:
+        watch_seconds_delta = progress_data.watchtime_seconds
+    
+    if outbox:
+        event_id = append_progress_events(db, tenant_id, user_id, [{
+            "video_id": progress_data.video_id,
+            "start_time": start_time_obj,
+            "end_time": end_time_obj,
+            "watch_seconds": watch_seconds_delta,
+            "position_start": progress_data.position_start if segment_mode else None,
+            "position_end": progress_data.position_end if segment_mode else None
+        }])
+        return trusted_json({"status": "accepted", "event_id": event_id}, status_code=status.HTTP_202_ACCEPTED)
+    
+    progress, _ = save_progress(
+        db,
+        tenant_id,
+        user_id,
+        progress_data.video_id,
+        start_time_obj=start_time_obj,
+        end_time_obj=end_time_obj,
+        watch_seconds_delta=watch_seconds_delta,
+        segments=[(progress_data.position_start, progress_data.position_end)] if segment_mode else None,
+        duration_seconds=video.duration_seconds
+    )
+    
+    return progress_dict(
+        progress.id,
+        progress.user_id,
+        progress.video_id,
+        progress.date,
+        progress.start_time,
+        progress.end_time,
+        progress.watch_seconds
+    )
 
 @router.get("/video/{video_id}", response_model=list[ProgressResponse])
 def get_video_progress(
     video_id: int,
     user_id: int = Depends(get_current_user_id),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get progress records for a specific video"""
-    progress_records = db.query(Progress).filter(
+    rows = db.query(*PROGRESS_COLUMNS).filter(
         Progress.user_id == user_id,
         Progress.video_id == video_id
     ).order_by(Progress.date.desc()).all()
     
-    result = []
-    for p in progress_records:
-        # Format watch_time as HH:MM:SS
-        watch_time_str = None
-        if p.watch_time:
-            total_seconds = int(p.watch_time.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            watch_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return trusted_json([progress_dict(*row) for row in rows])
+
+# ==================== LIVE PROGRESS CHANNEL ====================
+
+def load_today_attendance_event(tenant_id: str, user_id: int) -> Optional[dict]:
+    """Current attendance status frame for a user (None before the first video of the day)"""
+    db = session_for_tenant(tenant_id)
+    try:
+        attendance = db.query(Attendance).filter(
+            Attendance.user_id == user_id,
+            Attendance.date == date.today()
+        ).first()
+        return attendance_event(attendance) if attendance else None
+    finally:
+        db.close()
+
+def flush_watched_segments(tenant_id: str, user_id: int, pending: dict, known_videos: dict, since: dict) -> list:
+    """Write a connection's buffered segments to the database; returns error frames for unknown videos.
+    
+    `known_videos` caches video_id -> duration_seconds for the connection and `since` holds
+    the server time each video was first seen on it (the credit clock of a new record).
+    """
+    errors = []
+    db = session_for_tenant(tenant_id)
+    try:
+        now = datetime.now()
+        # Session times from the server clock: since the video was first seen today, until now
+        started = {
+            video_id: max(since[video_id].astimezone().replace(tzinfo=None), datetime.combine(now.date(), time.min)).time().replace(microsecond=0)
+            for video_id in pending
+        }
+        now_time = now.time().replace(microsecond=0)
+        if PROGRESS_WRITE_MODE == "outbox":
+            append_progress_events(db, tenant_id, user_id, [
+                {
+                    "video_id": video_id,
+                    "start_time": started[video_id],
+                    "end_time": now_time,
+                    "position_start": start,
+                    "position_end": end
+                }
+                for video_id, intervals in pending.items()
+                for start, end in intervals
+            ])
+            return errors
+        for video_id, intervals in pending.items():
+            if video_id not in known_videos:
+                video = find_tenant_video(db, tenant_id, video_id)
+                if video is None:
+                    errors.append({"type": "error", "video_id": video_id, "detail": "Video not found"})
+                    continue
+                known_videos[video_id] = video.duration_seconds
+            save_progress(
+                db, tenant_id, user_id, video_id,
+                start_time_obj=started[video_id],
+                end_time_obj=now_time,
+                segments=intervals,
+                since=since[video_id],
+                duration_seconds=known_videos[video_id]
+            )
+    finally:
+        db.close()
+    return errors
+
+def parse_heartbeat(frame) -> tuple:
+    """Parse a heartbeat frame {"v": video_id, "s": position_start, "e": position_end}"""
+    video_id = int(frame["v"])
+    position_start = float(frame["s"])
+    position_end = float(frame["e"])
+    if position_start < 0 or position_end < position_start:
+        raise ValueError("position_end must be >= position_start >= 0")
+    return video_id, position_start, position_end
+
+@router.websocket("/ws")
+async def progress_channel(websocket: WebSocket, token: Optional[str] = None):
+    """Persistent progress channel: heartbeats in, attendance status changes out"""
+    user_id = get_user_id_from_token(token)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    
+    tenant_id = request_tenant(websocket)
+    channel = user_channel(tenant_id, user_id)
+    events = subscribe(channel)
+    pending = {}  # video_id -> merged [start, end] segments not yet written
+    known_videos = {}  # video_id -> duration_seconds
+    since = {}  # video_id -> server time the video was first seen on this connection
+    credited = {}  # video_id -> server time the video's frames have claimed up to
+    last_frame_at = datetime.now(timezone.utc)
+    # The forwarder task and the receive loop both write to the socket
+    send_lock = asyncio.Lock()
+    
+    async def send(frame: dict):
+        async with send_lock:
+            await websocket.send_json(frame)
+    
+    async def forward_events():
+        while True:
+            await send(await events.get())
+    
+    async def flush():
+        if not pending:
+            return
+        batch = dict(pending)
+        pending.clear()
+        try:
+            errors = await run_in_threadpool(flush_watched_segments, tenant_id, user_id, batch, known_videos, since)
+        except Exception as e:
+            errors = [{"type": "error", "detail": f"Failed to save progress: {str(e)}"}]
+        for error in errors:
+            await send(error)
+    
+    forwarder = asyncio.create_task(forward_events())
+    try:
+        current = await run_in_threadpool(load_today_attendance_event, tenant_id, user_id)
+        if current:
+            await send(current)
         
-        result.append({
-            "id": p.id,
-            "user_id": p.user_id,
-            "video_id": p.video_id,
-            "date": p.date.isoformat(),
-            "start_time": p.start_time.strftime("%H:%M:%S") if p.start_time else None,
-            "end_time": p.end_time.strftime("%H:%M:%S") if p.end_time else None,
-            "watch_time": watch_time_str
-        })
-    
-    return result
+        loop = asyncio.get_running_loop()
+        next_flush = loop.time() + HEARTBEAT_FLUSH_SECONDS
+        while True:
+            try:
+                frame = await asyncio.wait_for(websocket.receive_json(), timeout=max(0, next_flush - loop.time()))
+            except asyncio.TimeoutError:
+                await flush()
+                next_flush = loop.time() + HEARTBEAT_FLUSH_SECONDS
+                continue
+            except (KeyError, ValueError):
+                # Not JSON (ValueError) or a binary frame (no "text" in the message)
+                await send({"type": "error", "detail": "Invalid heartbeat: frames must be JSON text"})
+                continue
+            
+            try:
+                video_id, position_start, position_end = parse_heartbeat(frame)
+            except (KeyError, TypeError, ValueError) as e:
+                await send({"type": "error", "detail": f"Invalid heartbeat: {str(e)}"})
+                continue
+            # Playhead time can't outrun the server clock since the video's previous frame (a video
+            # new to the connection counts from the previous frame of any video)
+            received_at = datetime.now(timezone.utc)
+            if video_id not in credited:
+                since[video_id] = credited[video_id] = last_frame_at
+            allowance = (received_at - credited[video_id]).total_seconds() + HEARTBEAT_GRACE_SECONDS
+            position_end = min(position_end, position_start + max(0.0, allowance))
+            credited[video_id] += timedelta(seconds=position_end - position_start)
+            last_frame_at = received_at
+            # Aggregate in memory; overlapping heartbeats collapse before reaching the database
+            pending[video_id], _ = merge_interval(pending.get(video_id, []), position_start, position_end)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forwarder.cancel()
+        unsubscribe(channel, events)
+        if pending:
+            # Connection is gone, so write the last segments without reporting errors
+            try:
+                await run_in_threadpool(flush_watched_segments, tenant_id, user_id, dict(pending), known_videos, since)
+            except Exception:
+                pass
+
+@router.get("/events")
+async def progress_events(request: Request, token: Optional[str] = None):
+    """Server-sent attendance status changes (fallback for clients without WebSocket; heartbeats use POST /progress)"""
+    user_id = get_user_id_from_token(token)
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials"
+        )
+    
+    tenant_id = request_tenant(request)
+    channel = user_channel(tenant_id, user_id)
+    events = subscribe(channel)
+    
+    async def stream():
+        try:
+            current = await run_in_threadpool(load_today_attendance_event, tenant_id, user_id)
+            if current:
+                yield f"data: {json.dumps(current)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                    yield f"data: {json.dumps(event)}\n\n"
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+        finally:
+            unsubscribe(channel, events)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def load_admin_from_token(token: Optional[str], tenant_id: str) -> Optional[User]:
+    """Resolve a query-parameter token to an admin user (None if invalid or not an admin)"""
+    db = session_for_tenant(tenant_id)
+    try:
+        user = get_user_from_token(token, db)
+        return user if user and user.role == "admin" else None
+    finally:
+        db.close()
+
+@router.get("/attendance/live")
+@attendance_router.get("/live")
+async def live_attendance(request: Request, token: Optional[str] = None):
+    """Server-sent live attendance counters and per-student status transitions for today (admin only)"""
+    admin = await run_in_threadpool(load_admin_from_token, token, request_tenant(request))
+    if admin is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view live attendance"
+        )
+    
+    # Subscribe before taking the snapshot so no transition falls in between
+    channel = admin_channel(admin.tenant_id)
+    events = subscribe(channel)
+    
+    async def stream():
+        try:
+            current = await run_in_threadpool(snapshot, admin.tenant_id)
+            yield f"data: {json.dumps(current)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                    if event["date"] != current["date"]:
+                        # New day: start over from a fresh snapshot
+                        current = await run_in_threadpool(snapshot, admin.tenant_id)
+                        event = current
+                    yield f"data: {json.dumps(event)}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            unsubscribe(channel, events)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @router.get("/health")
 def health_check():
@@ -273,40 +681,37 @@ def health_check():
 @attendance_router.get("/me", response_model=list[AttendanceResponse])
 def get_my_attendance(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get current user's attendance records"""
-    attendance_records = db.query(Attendance).filter(
+    rows = db.query(*ATTENDANCE_COLUMNS).filter(
         Attendance.user_id == current_user.id
     ).order_by(Attendance.date.desc()).all()
     
-    # Format total_time as HH:MM:SS string
-    result = []
-    for attendance in attendance_records:
-        total_time_str = None
-        if attendance.total_time:
-            total_seconds = int(attendance.total_time.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            total_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        
-        result.append({
-            "id": attendance.id,
-            "user_id": attendance.user_id,
-            "date": attendance.date.isoformat(),
-            "total_time": total_time_str,
-            "status": attendance.status
-        })
-    
-    return result
+    return trusted_json([attendance_dict(*row) for row in rows])
+
+@router.get("/attendance/me/stats", response_model=AttendanceStatsResponse)
+@attendance_router.get("/me/stats", response_model=AttendanceStatsResponse)
+def get_my_attendance_stats(
+    year: Optional[int] = None,
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Get current user's attendance streaks and present days for a year (default: this year)"""
+    year = year or date.today().year
+    if year < 1 or year > 9999:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid year"
+        )
+    return attendance_stats(db, current_user_id, year)
 
 @router.get("/attendance/user/{user_id}", response_model=list[AttendanceResponse])
 @attendance_router.get("/user/{user_id}", response_model=list[AttendanceResponse])
 def get_user_attendance(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get attendance records for a specific user (admin only)"""
     # Only admins can view other users' attendance
@@ -316,37 +721,20 @@ def get_user_attendance(
             detail="Only admins can view other users' attendance"
         )
     
-    attendance_records = db.query(Attendance).filter(
+    rows = db.query(*ATTENDANCE_COLUMNS).filter(
+        Attendance.tenant_id == current_user.tenant_id,
         Attendance.user_id == user_id
     ).order_by(Attendance.date.desc()).all()
     
-    # Format total_time as HH:MM:SS string
-    result = []
-    for attendance in attendance_records:
-        total_time_str = None
-        if attendance.total_time:
-            total_seconds = int(attendance.total_time.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            total_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        
-        result.append({
-            "id": attendance.id,
-            "user_id": attendance.user_id,
-            "date": attendance.date.isoformat(),
-            "total_time": total_time_str,
-            "status": attendance.status
-        })
-    
-    return result
+    return trusted_json([attendance_dict(*row) for row in rows])
 
 @router.get("/attendance/date/{attendance_date}", response_model=list[AttendanceResponse])
 @attendance_router.get("/date/{attendance_date}", response_model=list[AttendanceResponse])
 def get_attendance_by_date(
     attendance_date: date,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db)
 ):
     """Get attendance records for a specific date (admin only)"""
     # Only admins can view attendance by date
@@ -356,126 +744,94 @@ def get_attendance_by_date(
             detail="Only admins can view attendance by date"
         )
     
+    tenant_id = current_user.tenant_id
+    minimum_seconds = minimum_attendance_seconds(tenant_id)
     today = date.today()
     is_past_date = attendance_date < today
     
-    attendance_records = db.query(Attendance).filter(
+    rows = read_db.query(*ATTENDANCE_COLUMNS).filter(
+        Attendance.tenant_id == tenant_id,
         Attendance.date == attendance_date
     ).order_by(Attendance.user_id).all()
+    student_ids = [
+        student_id for (student_id,) in read_db.query(User.id).filter(User.tenant_id == tenant_id, User.role == 'student')
+    ] if is_past_date else []
+    
+    if is_past_date and read_db.get_bind() is not db.get_bind():
+        # A past date that still needs finalizing is read again from the primary before writing
+        recorded_user_ids = {row[1] for row in rows}
+        needs_finalizing = any(
+            status not in ("present", "absent")
+            and (total_seconds or 0) < minimum_seconds
+            for _, _, _, total_seconds, status in rows
+        ) or any(
+            student_id not in recorded_user_ids for student_id in student_ids
+        )
+        if needs_finalizing:
+            rows = db.query(*ATTENDANCE_COLUMNS).filter(
+                Attendance.tenant_id == tenant_id,
+                Attendance.date == attendance_date
+            ).order_by(Attendance.user_id).all()
+            student_ids = [
+                student_id for (student_id,) in db.query(User.id).filter(User.tenant_id == tenant_id, User.role == 'student')
+            ]
     
-    # Get all students to check for missing attendance records
-    all_students = db.query(User).filter(User.role == 'student').all()
-    attendance_map = {att.user_id: att for att in attendance_records}
-    
-    # Format total_time as HH:MM:SS string and update status for past dates
     result = []
-    updated_count = 0
-    new_records_created = False
+    mark_absent_ids = []
     
-    for attendance in attendance_records:
-        total_time_str = None
-        total_seconds = 0
-        if attendance.total_time:
-            total_seconds = int(attendance.total_time.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            total_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    for attendance_id, user_id, day, total_seconds, status in rows:
+        # For past dates, automatically mark as "absent" if below the minimum
+        if is_past_date and status != "present":
+            if (total_seconds or 0) < minimum_seconds:
+                if status != "absent":
+                    mark_absent_ids.append(attendance_id)
+                status = "absent"
+        result.append(attendance_dict(attendance_id, user_id, day, total_seconds, status))
+    
+    if is_past_date:
+        # Update statuses to "absent" in database with a single statement
+        if mark_absent_ids:
+            db.query(Attendance).filter(Attendance.id.in_(mark_absent_ids)).update(
+                {Attendance.status: "absent"}, synchronize_session=False
+            )
         
-        # For past dates, automatically mark as "absent" if < 30 seconds
-        status = attendance.status
-        if is_past_date:
-            if total_seconds < MINIMUM_ATTENDANCE_SECONDS:
-                if status != "present" and status != "absent":
-                    # Update status to "absent" in database
-                    attendance.status = "absent"
-                    status = "absent"
-                    updated_count += 1
-                elif status != "present":
-                    status = "absent"
+        # Create "absent" records for students who never started
+        recorded_user_ids = {row[1] for row in rows}
+        missing_student_ids = [
+            student_id for student_id in student_ids
+            if student_id not in recorded_user_ids
+        ]
+        if missing_student_ids:
+            created = db.execute(
+                insert(Attendance).returning(Attendance.id, Attendance.user_id),
+                [
+                    {"tenant_id": tenant_id, "user_id": student_id, "date": attendance_date, "total_seconds": 0, "status": "absent"}
+                    for student_id in missing_student_ids
+                ]
+            ).all()
+            result.extend(
+                attendance_dict(attendance_id, user_id, attendance_date, None, "absent")
+                for attendance_id, user_id in created
+            )
         
-        result.append({
-            "id": attendance.id,
-            "user_id": attendance.user_id,
-            "date": attendance.date.isoformat(),
-            "total_time": total_time_str,
-            "status": status
-        })
-    
-    # For past dates, create "absent" records for students who never started
-    if is_past_date:
-        for student in all_students:
-            if student.id not in attendance_map:
-                # Student never started - create absent record
-                # Check if record was created by another process (race condition)
-                existing = db.query(Attendance).filter(
-                    Attendance.user_id == student.id,
-                    Attendance.date == attendance_date
-                ).first()
-                
-                if not existing:
-                    new_attendance = Attendance(
-                        user_id=student.id,
-                        date=attendance_date,
-                        total_time=timedelta(0),
-                        status="absent"
-                    )
-                    db.add(new_attendance)
-                    db.flush()  # Get the ID without committing
-                    new_records_created = True
-                    
-                    result.append({
-                        "id": new_attendance.id,
-                        "user_id": student.id,
-                        "date": attendance_date.isoformat(),
-                        "total_time": "0:00:00",
-                        "status": "absent"
-                    })
-                else:
-                    # Record was created by another process, add it to result
-                    total_seconds = 0
-                    if existing.total_time:
-                        total_seconds = int(existing.total_time.total_seconds())
-                    hours = total_seconds // 3600
-                    minutes = (total_seconds % 3600) // 60
-                    seconds = total_seconds % 60
-                    total_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-                    
-                    status = existing.status
-                    if total_seconds < MINIMUM_ATTENDANCE_SECONDS and status != "present":
-                        status = "absent"
-                    
-                    result.append({
-                        "id": existing.id,
-                        "user_id": student.id,
-                        "date": attendance_date.isoformat(),
-                        "total_time": total_time_str,
-                        "status": status
-                    })
-    
-    # Commit any updates
-    if updated_count > 0 or new_records_created:
-        db.commit()
+        # Commit any updates
+        if mark_absent_ids or missing_student_ids:
+            db.commit()
     
     # Sort by user_id for consistent ordering
     result.sort(key=lambda x: x["user_id"])
     
-    return result
+    return trusted_json(result)
 
 @router.get("/attendance/today", response_model=AttendanceResponse)
 @attendance_router.get("/today", response_model=AttendanceResponse)
 def get_today_attendance(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get today's attendance record for current user"""
     today = date.today()
-    attendance = db.query(Attendance).filter(
-        and_(
-            Attendance.user_id == current_user.id,
-            Attendance.date == today
-        )
-    ).first()
+    attendance = load_day_attendance(db, current_user.tenant_id, current_user.id, today)
     
     if not attendance:
         return {
@@ -486,22 +842,7 @@ def get_today_attendance(
             "status": None
         }
     
-    # Format total_time as HH:MM:SS string
-    total_time_str = None
-    if attendance.total_time:
-        total_seconds = int(attendance.total_time.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        total_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-    
-    return {
-        "id": attendance.id,
-        "user_id": attendance.user_id,
-        "date": attendance.date.isoformat(),
-        "total_time": total_time_str,
-        "status": attendance.status
-    }
+    return attendance
 
 @router.post("/attendance/update-status")
 @attendance_router.post("/update-status")
@@ -510,31 +851,42 @@ def update_attendance_status(
     db: Session = Depends(get_db)
 ):
     """Update attendance status based on total watch time (can be called at end of day)"""
+    tenant_id = current_user.tenant_id
+    minimum_seconds = minimum_attendance_seconds(tenant_id)
     today = date.today()
     
-    # Get all users who have attendance records for today
+    # Get all of the tenant's users who have attendance records for today
     attendance_records = db.query(Attendance).filter(
+        Attendance.tenant_id == tenant_id,
         Attendance.date == today
     ).all()
     
     updated_present = 0
     updated_absent = 0
+    changed_user_ids = []
     for attendance in attendance_records:
-        total_seconds = 0
-        if attendance.total_time:
-            total_seconds = attendance.total_time.total_seconds()
+        total_seconds = attendance.total_seconds or 0
         
-        # Mark as "present" if >= 30 seconds
-        if total_seconds >= MINIMUM_ATTENDANCE_SECONDS:
+        # Mark as "present" if >= the minimum
+        if total_seconds >= minimum_seconds:
             if attendance.status != "present":
                 attendance.status = "present"
+                record_present_day(db, attendance.user_id, attendance.date)
+                changed_user_ids.append(attendance.user_id)
                 updated_present += 1
-        # Mark as "absent" if < 30 seconds and status is not already "absent"
-        elif total_seconds < MINIMUM_ATTENDANCE_SECONDS and attendance.status != "absent":
+        # Mark as "absent" if below the minimum and status is not already "absent"
+        elif total_seconds < minimum_seconds and attendance.status != "absent":
+            if attendance.status == "present":
+                # e.g. after the tenant's minimum was raised; the day leaves the streak
+                clear_present_day(db, attendance.user_id, attendance.date)
             attendance.status = "absent"
+            changed_user_ids.append(attendance.user_id)
             updated_absent += 1
     
     db.commit()
+    for user_id in changed_user_ids:
+        load_day_attendance.invalidate(tenant_id, user_id, today)
+    mark_recent_write(current_user.id)
     
     return {
         "message": f"Updated {updated_present} to 'present', {updated_absent} to 'absent'",
@@ -548,7 +900,7 @@ def finalize_daily_attendance(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Finalize daily attendance - marks students as absent if < 30 seconds or not started (admin only)"""
+    """Finalize the admin's tenant's daily attendance - marks students as absent if below the minimum or not started (admin only)"""
     # Only admins can finalize attendance
     if current_user.role != "admin":
         raise HTTPException(
@@ -560,11 +912,15 @@ def finalize_daily_attendance(
     if attendance_date is None:
         attendance_date = date.today() - timedelta(days=1)  # Default to yesterday
     
-    # Get all students
-    all_students = db.query(User).filter(User.role == 'student').all()
+    tenant_id = current_user.tenant_id
+    minimum_seconds = minimum_attendance_seconds(tenant_id)
+    
+    # Get all of the tenant's students
+    all_students = db.query(User).filter(User.tenant_id == tenant_id, User.role == 'student').all()
     
-    # Get all attendance records for the date
+    # Get the tenant's attendance records for the date
     attendance_records = db.query(Attendance).filter(
+        Attendance.tenant_id == tenant_id,
         Attendance.date == attendance_date
     ).all()
     
@@ -573,31 +929,33 @@ def finalize_daily_attendance(
     
     updated_absent = 0
     created_absent = 0
+    changed_user_ids = []
     
     for student in all_students:
         attendance = attendance_map.get(student.id)
         
         if attendance:
             # Student has attendance record - check if should be marked absent
-            total_seconds = 0
-            if attendance.total_time:
-                total_seconds = attendance.total_time.total_seconds()
+            total_seconds = attendance.total_seconds or 0
             
-            # If < 30 seconds and not already "present", mark as "absent"
-            if total_seconds < MINIMUM_ATTENDANCE_SECONDS and attendance.status != "present":
+            # If below the minimum and not already "present", mark as "absent"
+            if total_seconds < minimum_seconds and attendance.status != "present":
                 if attendance.status != "absent":
                     attendance.status = "absent"
+                    changed_user_ids.append(student.id)
                     updated_absent += 1
         else:
             # Student never started - create attendance record with "absent" status
             try:
                 new_attendance = Attendance(
+                    tenant_id=tenant_id,
                     user_id=student.id,
                     date=attendance_date,
-                    total_time=timedelta(0),
+                    total_seconds=0,
                     status="absent"
                 )
                 db.add(new_attendance)
+                changed_user_ids.append(student.id)
                 created_absent += 1
             except Exception as e:
                 db.rollback()
@@ -607,6 +965,9 @@ def finalize_daily_attendance(
                 )
     
     db.commit()
+    mark_recent_write(current_user.id)
+    for user_id in changed_user_ids:
+        load_day_attendance.invalidate(tenant_id, user_id, attendance_date)
     
     return {
         "message": f"Finalized attendance for {attendance_date.isoformat()}. Updated {updated_absent} to 'absent', created {created_absent} new 'absent' records.",
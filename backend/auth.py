@@ -2,10 +2,17 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
+from metrics import PASSWORD_HASH_SECONDS, Timer
 import os
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes below the default cost (e.g. from a bulk import) are upgraded on next login
+BCRYPT_ROUNDS = 12
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__min_rounds=BCRYPT_ROUNDS)
+
+# Lower bcrypt cost for bulk-imported accounts (about 4x faster than 12), so a class roster
+# imports in seconds; these hashes are upgraded to BCRYPT_ROUNDS on first login
+IMPORT_BCRYPT_ROUNDS = int(os.getenv("IMPORT_BCRYPT_ROUNDS", "10"))
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
@@ -15,11 +22,24 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 24 * 60  # 24 hours = 1440 minutes
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    with Timer(PASSWORD_HASH_SECONDS.labels("verify")):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    with Timer(PASSWORD_HASH_SECONDS.labels("hash")):
+        return pwd_context.hash(password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Verify a password and return (valid, new_hash) where new_hash is set if the hash needs upgrading"""
+    with Timer(PASSWORD_HASH_SECONDS.labels("verify")):
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+
+def get_import_password_hash(password: str) -> str:
+    """Hash a password for bulk import (module level so it can run in a process pool)"""
+    if IMPORT_BCRYPT_ROUNDS == BCRYPT_ROUNDS:
+        return pwd_context.hash(password)
+    return pwd_context.handler("bcrypt").using(rounds=IMPORT_BCRYPT_ROUNDS, relaxed=True).hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
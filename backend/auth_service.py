@@ -1,38 +1,118 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File
 from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, or_
+from pydantic import ValidationError
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import timedelta
 from models import User
-from schemas import UserSignup, UserLogin, UserResponse, Token
-from database import get_db
-from auth import verify_password, get_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
-from dependencies import get_current_user
+from schemas import UserSignup, UserLogin, UserResponse, Token, UserImportResponse
+from database import get_db, request_tenant
+from auth import verify_and_update_password, get_password_hash, get_import_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from dependencies import get_current_user, get_read_db
+from serialization import columns, trusted_json
+import csv
+import io
+import json
+import multiprocessing
+import os
+import threading
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+# Rows inserted per INSERT statement during bulk import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Shared by all import requests in this process; created on first use
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+USER_LISTING_FIELDS = ("id", "name", "email", "user_name", "role", "created_at")
+
+def user_listing(query, compact: bool):
+    """UserResponse-shaped rows, or columns ({"id": [...], "name": [...], ...}) with compact"""
+    rows = [
+        (id, name, email, user_name, role, created_at.isoformat() if created_at else None)
+        for id, name, email, user_name, role, created_at in query.order_by(User.id)
+    ]
+    if compact:
+        return trusted_json(columns(rows, USER_LISTING_FIELDS))
+    return trusted_json([dict(zip(USER_LISTING_FIELDS, row)) for row in rows])
+
+def detect_role(email: str, role: str = None) -> str:
+    """Resolve the stored role for a new user (emails containing 'admin' become admins)"""
+    if not role or role == "student":
+        return "admin" if "admin" in email.lower() else "student"
+    return role
+
+def hash_pool() -> ProcessPoolExecutor:
+    """Process pool for bcrypt during imports (one per worker process, not per request)"""
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            # Spawned, not forked: forking a server process with running threads can deadlock the child
+            _hash_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+        return _hash_pool
+
+def hash_import_passwords(passwords: list[str]) -> list[str]:
+    """Hash passwords across the shared process pool, falling back to this thread"""
+    global _hash_pool
+    workers = min(os.cpu_count() or 1, len(passwords))
+    if workers > 1:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        try:
+            return list(hash_pool().map(get_import_password_hash, passwords, chunksize=chunksize))
+        except BrokenProcessPool:
+            # A pool worker died; start a fresh pool for the next import
+            with _hash_pool_lock:
+                _hash_pool = None
+    return [get_import_password_hash(password) for password in passwords]
+
+def parse_import_rows(raw: bytes, filename: str = "", content_type: str = "") -> list[dict]:
+    """Parse an uploaded CSV or NDJSON file into a list of row dicts"""
+    text = raw.decode("utf-8-sig")
+    is_ndjson = (
+        filename.lower().endswith((".ndjson", ".jsonl"))
+        or "ndjson" in (content_type or "")
+        or "json" in (content_type or "")
+    )
+    if is_ndjson:
+        rows = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # Keep the row slot so the error report lines up with the file
+                rows.append(None)
+        return rows
+    return list(csv.DictReader(io.StringIO(text)))
+
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def signup(user_data: UserSignup, db: Session = Depends(get_db)):
-    """Register a new user"""
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+def signup(user_data: UserSignup, request: Request, db: Session = Depends(get_db)):
+    """Register a new user in the request's tenant"""
+    tenant_id = request_tenant(request)
+    existing_user = db.query(User).filter(User.tenant_id == tenant_id, User.email == user_data.email).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    existing_username = db.query(User).filter(User.user_name == user_data.user_name).first()
+    existing_username = db.query(User).filter(User.tenant_id == tenant_id, User.user_name == user_data.user_name).first()
     if existing_username:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
     
-    if not user_data.role or user_data.role == "student":
-        detected_role = "admin" if "admin" in user_data.email.lower() else "student"
-    else:
-        detected_role = user_data.role
+    detected_role = detect_role(user_data.email, user_data.role)
     
     hashed_password = get_password_hash(user_data.password)
     new_user = User(
+        tenant_id=tenant_id,
         name=user_data.name,
         email=user_data.email,
         user_name=user_data.user_name,
@@ -47,9 +127,10 @@ def signup(user_data: UserSignup, db: Session = Depends(get_db)):
     return new_user
 
 @router.post("/login", response_model=Token)
-def login(credentials: UserLogin, db: Session = Depends(get_db)):
+def login(credentials: UserLogin, request: Request, db: Session = Depends(get_db)):
     """Authenticate user and return access token"""
-    user = db.query(User).filter(User.user_name == credentials.user_name).first()
+    tenant_id = request_tenant(request)
+    user = db.query(User).filter(User.tenant_id == tenant_id, User.user_name == credentials.user_name).first()
     
     if not user:
         raise HTTPException(
@@ -57,15 +138,22 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
             detail="Incorrect username or password"
         )
     
-    if not verify_password(credentials.password, user.password):
+    password_valid, upgraded_hash = verify_and_update_password(credentials.password, user.password)
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     
+    # Re-hash at full cost if this account was imported with a cheaper hash
+    if upgraded_hash:
+        user.password = upgraded_hash
+        db.commit()
+        db.refresh(user)
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.user_name, "user_id": user.id},
+        data={"sub": user.user_name, "user_id": user.id, "tenant": user.tenant_id},
         expires_delta=access_token_expires
     )
     
@@ -77,26 +165,140 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
 
 @router.get("/users/students", response_model=list[UserResponse])
 def get_all_students(
+    compact: bool = False,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """Get all students (requires authentication)"""
-    students = db.query(User).filter(User.role == 'student').all()
-    return students
+    """Get all students (requires authentication; `compact=1` returns columns)"""
+    return user_listing(
+        db.query(User.id, User.name, User.email, User.user_name, User.role, User.created_at).filter(
+            User.tenant_id == current_user.tenant_id, User.role == 'student'
+        ),
+        compact
+    )
 
 @router.get("/users", response_model=list[UserResponse])
 def get_all_users(
+    compact: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Get all users (admin only; `compact=1` returns columns)"""
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return user_listing(
+        db.query(User.id, User.name, User.email, User.user_name, User.role, User.created_at).filter(
+            User.tenant_id == current_user.tenant_id
+        ),
+        compact
+    )
+
+@router.post("/users/import", response_model=UserImportResponse)
+def import_users(
+    file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all users (admin only)"""
+    """Bulk import users from a CSV or NDJSON file into the admin's tenant (admin only)"""
     if current_user.role != 'admin':
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin access required"
         )
-    users = db.query(User).all()
-    return users
+    
+    try:
+        rows = parse_import_rows(file.file.read(), file.filename or "", file.content_type or "")
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Could not parse import file: {str(e)}"
+        )
+    
+    errors = []
+    candidates = []  # (row number, validated UserSignup)
+    seen_emails = set()
+    seen_user_names = set()
+    
+    # Validate every row and reject duplicates inside the file itself
+    for row_number, row in enumerate(rows, start=1):
+        # csv.DictReader puts surplus cells of a ragged line under a None key
+        if not isinstance(row, dict) or None in row:
+            errors.append({"row": row_number, "detail": "Malformed row"})
+            continue
+        try:
+            user_data = UserSignup(**row)
+        except ValidationError as e:
+            fields = ", ".join(str(err["loc"][0]) for err in e.errors() if err.get("loc"))
+            errors.append({"row": row_number, "user_name": row.get("user_name"), "detail": f"Invalid fields: {fields}"})
+            continue
+        email = user_data.email.lower()
+        if email in seen_emails:
+            errors.append({"row": row_number, "user_name": user_data.user_name, "detail": "Duplicate email in file"})
+            continue
+        if user_data.user_name in seen_user_names:
+            errors.append({"row": row_number, "user_name": user_data.user_name, "detail": "Duplicate username in file"})
+            continue
+        seen_emails.add(email)
+        seen_user_names.add(user_data.user_name)
+        candidates.append((row_number, user_data))
+    
+    # Check uniqueness against the database with a single set query
+    existing_emails = set()
+    existing_user_names = set()
+    if candidates:
+        emails = [user_data.email.lower() for _, user_data in candidates]
+        user_names = [user_data.user_name for _, user_data in candidates]
+        existing = db.query(User.email, User.user_name).filter(
+            User.tenant_id == current_user.tenant_id,
+            or_(func.lower(User.email).in_(emails), User.user_name.in_(user_names))
+        ).all()
+        existing_emails = {email.lower() for email, _ in existing}
+        existing_user_names = {user_name for _, user_name in existing}
+    
+    to_create = []
+    for row_number, user_data in candidates:
+        if user_data.email.lower() in existing_emails:
+            errors.append({"row": row_number, "user_name": user_data.user_name, "detail": "Email already registered"})
+        elif user_data.user_name in existing_user_names:
+            errors.append({"row": row_number, "user_name": user_data.user_name, "detail": "Username already taken"})
+        else:
+            to_create.append(user_data)
+    
+    # bcrypt is CPU bound, so spread hashing across all cores
+    hashed_passwords = hash_import_passwords([user_data.password for user_data in to_create]) if to_create else []
+    
+    new_users = [
+        {
+            "tenant_id": current_user.tenant_id,
+            "name": user_data.name,
+            "email": user_data.email,
+            "user_name": user_data.user_name,
+            "password": hashed_password,
+            "role": detect_role(user_data.email, user_data.role)
+        }
+        for user_data, hashed_password in zip(to_create, hashed_passwords)
+    ]
+    
+    try:
+        for start in range(0, len(new_users), IMPORT_BATCH_SIZE):
+            db.execute(insert(User), new_users[start:start + IMPORT_BATCH_SIZE])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error importing users: {str(e)}"
+        )
+    
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "total_rows": len(rows),
+        "created": len(new_users),
+        "errors": errors
+    }
 
 @router.get("/users/me", response_model=UserResponse)
 def get_current_user_endpoint(current_user: User = Depends(get_current_user)):
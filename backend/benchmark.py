@@ -0,0 +1,510 @@
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import insert, text
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+# Load-testing harness for the API.
+#   python benchmark.py seed --students 2000 --courses 20 --videos 15 --days 30 --truncate
+#   python benchmark.py serve --port 8000              (API with a fake YouTube extractor)
+#   python benchmark.py run --base-url http://127.0.0.1:8000 --output run.json
+#   python benchmark.py compare baseline.json run.json
+#   python benchmark.py scale --max-workers 4        (throughput with 1..N worker processes)
+# Seeding and token minting use DATABASE_URL/SECRET_KEY from the environment, so run
+# every command with the same environment as the server under test.
+
+BENCH_PASSWORD = "benchmark-password"
+BENCH_ADMIN = "bench_admin"
+BENCH_STUDENT_PREFIX = "bench_student_"
+SCENARIOS = ("login", "heartbeat", "admin", "playlist", "search")
+
+# Words for generated course/video titles (and search queries)
+TITLE_WORDS = (
+    "python", "data", "machine", "learning", "web", "design", "calculus", "algebra", "physics",
+    "chemistry", "history", "economics", "statistics", "networks", "databases", "security", "cloud",
+    "mobile", "javascript", "react", "biology", "writing", "music", "finance", "marketing", "robotics",
+    "graphics", "linux", "testing", "algorithms", "geometry", "astronomy", "philosophy", "literature",
+)
+
+# ==================== SEEDING ====================
+
+def seed(students: int, courses: int, videos_per_course: int, days: int, videos_per_day: int = 3, truncate: bool = False):
+    """Insert benchmark users, courses, videos and `days` days of progress/attendance history"""
+    from database import engine, Base
+    from models import User, Course, CourseVideo, Progress, Attendance
+    from partitions import create_partitioned_tables, ensure_partitions, add_months
+    from course_service import ensure_course_counters, reconcile_course_counters
+    from auth import get_password_hash
+
+    create_partitioned_tables(engine)
+    Base.metadata.create_all(bind=engine)
+    ensure_course_counters(engine)
+    today = date.today()
+    first_day = today - timedelta(days=days)
+    months = (today.year - first_day.year) * 12 + today.month - first_day.month
+    ensure_partitions(engine, months_ahead=months + 1, start=add_months(first_day, 0))
+
+    started = time.monotonic()
+    with engine.begin() as connection:
+        if truncate:
+            tables = ", ".join(f'"{table.name}"' for table in reversed(Base.metadata.sorted_tables))
+            if engine.dialect.name == "postgresql":
+                connection.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+            else:
+                for table in reversed(Base.metadata.sorted_tables):
+                    connection.execute(table.delete())
+
+        # One hash for every benchmark account; logins still pay the full bcrypt verification
+        password_hash = get_password_hash(BENCH_PASSWORD)
+        connection.execute(insert(User), [
+            {"name": "Bench Admin", "email": "bench_admin@admin.com", "user_name": BENCH_ADMIN,
+             "password": password_hash, "role": "admin"}
+        ] + [
+            {"name": f"Student {index}", "email": f"{BENCH_STUDENT_PREFIX}{index}@bench.test",
+             "user_name": f"{BENCH_STUDENT_PREFIX}{index}", "password": password_hash, "role": "student"}
+            for index in range(students)
+        ])
+        student_ids = connection.execute(text(
+            f"SELECT id FROM \"user\" WHERE user_name LIKE '{BENCH_STUDENT_PREFIX}%' ORDER BY id"
+        )).scalars().all()
+
+        rng = random.Random(42)
+        course_ids = connection.execute(insert(Course).returning(Course.id), [
+            {"course_title": f"{rng.choice(TITLE_WORDS).title()} and {rng.choice(TITLE_WORDS).title()} {index}",
+             "link": f"https://www.youtube.com/playlist?list=BENCH{index:04d}"}
+            for index in range(courses)
+        ]).scalars().all()
+        video_ids = connection.execute(insert(CourseVideo).returning(CourseVideo.id), [
+            {"course_id": course_id,
+             "title": f"Lecture {position + 1}: {' '.join(rng.sample(TITLE_WORDS, 3)).capitalize()}",
+             "video_link": f"bench{course_id:04d}{position:03d}", "duration_seconds": rng.randint(60, 3600)}
+            for course_id in course_ids for position in range(videos_per_course)
+        ]).scalars().all()
+
+        progress_rows = 0
+        for offset in range(days, 0, -1):
+            day = today - timedelta(days=offset)
+            progress_batch = []
+            attendance_batch = []
+            for student_id in student_ids:
+                if rng.random() < 0.2:
+                    continue  # Skipped the day
+                total = 0
+                for video_id in rng.sample(video_ids, min(videos_per_day, len(video_ids))):
+                    seconds = rng.randint(10, 900)
+                    total += seconds
+                    progress_batch.append({
+                        "user_id": student_id, "video_id": video_id, "date": day,
+                        "watch_seconds": seconds
+                    })
+                attendance_batch.append({
+                    "user_id": student_id, "date": day, "total_seconds": total,
+                    "status": "present" if total >= 120 else "absent"
+                })
+            if progress_batch:
+                connection.execute(insert(Progress), progress_batch)
+                connection.execute(insert(Attendance), attendance_batch)
+                progress_rows += len(progress_batch)
+    reconcile_course_counters(engine)
+
+    return {
+        "students": len(student_ids),
+        "courses": len(course_ids),
+        "videos": len(video_ids),
+        "progress_rows": progress_rows,
+        "seconds": round(time.monotonic() - started, 2)
+    }
+
+# ==================== FAKE EXTRACTOR / SERVER ====================
+
+class FakeYoutubeDL:
+    """Stands in for yt_dlp.YoutubeDL: returns a synthetic playlist after a simulated network delay"""
+    videos = int(os.getenv("BENCH_FAKE_PLAYLIST_VIDEOS", "25"))
+    delay = float(os.getenv("BENCH_FAKE_EXTRACT_SECONDS", "0.2"))
+
+    def __init__(self, options=None):
+        self.options = options
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def extract_info(self, url, download=False):
+        time.sleep(self.delay)
+        playlist_id = url.rsplit("list=", 1)[-1]
+        return {
+            "title": f"Fake playlist {playlist_id}",
+            "entries": [
+                {"id": f"{playlist_id[-6:]}{index:05d}", "title": f"Fake video {index}", "duration": 120 + index * 7}
+                for index in range(self.videos)
+            ]
+        }
+
+def _install_fake_extractor():
+    import yt_dlp
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+
+def serve(host: str, port: int, workers: int = 1):
+    """Run the API with the fake extractor so playlist imports don't hit YouTube"""
+    # All load comes from one address; measure the API rather than the rate limiter
+    os.environ.setdefault("RATE_LIMIT_URL", "none://")
+    # Saturation is the point of a benchmark; report latency instead of shedding it as 503s
+    os.environ.setdefault("LOAD_SHEDDING", "0")
+    if workers > 1:
+        # Same server as production (serve.py); the extractor is patched in the master before forking
+        import serve as production_server
+        production_server.run(host, port, workers, before_load=_install_fake_extractor)
+        return
+    import uvicorn
+    _install_fake_extractor()
+    import main
+    uvicorn.run(main.app, host=host, port=port, log_level="warning")
+
+def spawn_server(port: int, workers: int = 1) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", "--port", str(port), "--workers", str(workers)],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    import requests
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                return process
+        except requests.RequestException:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Benchmark server did not start")
+
+# ==================== LOAD GENERATION ====================
+
+class Recorder:
+    """Latencies and failures per endpoint label"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, label: str, seconds: float, ok: bool):
+        with self._lock:
+            self.samples.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+_local = threading.local()
+
+def http_session():
+    import requests
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+def timed_request(recorder: Recorder, base_url: str, label: str, method: str, path: str, token: str = None, body: dict = None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    started = time.perf_counter()
+    try:
+        response = http_session().request(method, base_url + path, json=body, headers=headers, timeout=60)
+        ok = response.status_code < 400
+    except Exception:
+        ok = False
+    recorder.record(label, time.perf_counter() - started, ok)
+
+def run_tasks(tasks: list, concurrency: int) -> float:
+    """Run callables on `concurrency` client threads; returns wall-clock seconds"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(task) for task in tasks]:
+            future.result()
+    return time.perf_counter() - started
+
+def load_fixtures() -> dict:
+    """Benchmark accounts (with locally minted tokens) and videos from the seeded database"""
+    from database import SessionLocal
+    from models import User, CourseVideo
+    from auth import create_access_token
+    db = SessionLocal()
+    try:
+        users = db.query(User.id, User.user_name, User.role).filter(
+            User.user_name.like(f"{BENCH_STUDENT_PREFIX}%") | (User.user_name == BENCH_ADMIN)
+        ).all()
+        video_ids = [video_id for (video_id,) in db.query(CourseVideo.id).limit(500)]
+    finally:
+        db.close()
+    if not users or not video_ids:
+        raise RuntimeError("No benchmark data found; run `python benchmark.py seed` first")
+    tokens = {user_name: create_access_token({"sub": user_name, "user_id": user_id}) for user_id, user_name, role in users}
+    students = [(user_id, user_name) for user_id, user_name, role in users if role == "student"]
+    return {"tokens": tokens, "students": students, "student_ids": [user_id for user_id, _ in students], "video_ids": video_ids}
+
+def scenario_login(recorder, base_url, fixtures, args):
+    """Class start: many students log in at once"""
+    students = fixtures["students"][:args.logins]
+    return [
+        lambda user_name=user_name: timed_request(
+            recorder, base_url, "POST /auth/login", "POST", "/auth/login",
+            body={"user_name": user_name, "password": BENCH_PASSWORD}
+        )
+        for _, user_name in students
+    ]
+
+def scenario_heartbeat(recorder, base_url, fixtures, args):
+    """Heartbeat storm: every active student reports a watched segment every few seconds"""
+    rng = random.Random(7)
+    tasks = []
+    students = fixtures["students"][:args.heartbeat_students]
+    for beat in range(args.heartbeats):
+        for _, user_name in students:
+            video_id = rng.choice(fixtures["video_ids"])
+            body = {"video_id": video_id, "position_start": beat * 15.0, "position_end": (beat + 1) * 15.0}
+            tasks.append(lambda token=fixtures["tokens"][user_name], body=body: timed_request(
+                recorder, base_url, "POST /progress", "POST", "/progress", token=token, body=body
+            ))
+    return tasks
+
+def scenario_admin(recorder, base_url, fixtures, args):
+    """Admin dashboard: attendance listings, user lists and analytics reports"""
+    token = fixtures["tokens"][BENCH_ADMIN]
+    rng = random.Random(11)
+    reads = []
+    for _ in range(args.admin_rounds):
+        day = date.today() - timedelta(days=rng.randint(1, 7))
+        reads += [
+            ("GET /attendance/date/{date}", f"/attendance/date/{day.isoformat()}"),
+            ("GET /attendance/user/{id}", f"/attendance/user/{rng.choice(fixtures['student_ids'])}"),
+            ("GET /auth/users", "/auth/users"),
+            ("GET /courses", "/courses"),
+            ("GET /analytics/daily-active", "/analytics/daily-active"),
+            ("GET /analytics/courses/completion", "/analytics/courses/completion"),
+        ]
+    return [
+        lambda label=label, path=path: timed_request(recorder, base_url, label, "GET", path, token=token)
+        for label, path in reads
+    ]
+
+def scenario_playlist(recorder, base_url, fixtures, args):
+    """Admins importing playlists (server must run with the fake extractor: `benchmark.py serve`)"""
+    token = fixtures["tokens"][BENCH_ADMIN]
+    run_id = datetime.now().strftime("%H%M%S")
+    return [
+        lambda index=index: timed_request(
+            recorder, base_url, "POST /videos/youtube-playlist", "POST", "/videos/youtube-playlist", token=token,
+            body={"playlist_url": f"https://www.youtube.com/playlist?list=PLBENCH{run_id}{index:04d}"}
+        )
+        for index in range(args.playlists)
+    ]
+
+def scenario_search(recorder, base_url, fixtures, args):
+    """Catalog search as students type: one- and two-word prefix queries"""
+    rng = random.Random(13)
+    queries = []
+    for _ in range(args.searches):
+        words = rng.sample(TITLE_WORDS, rng.choice((1, 2)))
+        queries.append(" ".join(word[:rng.randint(3, len(word))] for word in words))
+    return [
+        lambda query=query: timed_request(recorder, base_url, "GET /search", "GET", f"/search?q={query.replace(' ', '+')}")
+        for query in queries
+    ]
+
+SCENARIO_BUILDERS = {
+    "login": scenario_login,
+    "heartbeat": scenario_heartbeat,
+    "admin": scenario_admin,
+    "playlist": scenario_playlist,
+    "search": scenario_search,
+}
+
+def summarize(recorder: Recorder, wall_seconds: float) -> dict:
+    import numpy as np
+    endpoints = {}
+    for label, samples in sorted(recorder.samples.items()):
+        latencies = np.array(samples) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        endpoints[label] = {
+            "requests": len(samples),
+            "errors": recorder.errors.get(label, 0),
+            "throughput_rps": round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+            "mean_ms": round(float(latencies.mean()), 2),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(latencies.max()), 2),
+        }
+    return endpoints
+
+def run(args) -> dict:
+    server = spawn_server(args.port, args.workers) if args.spawn_server else None
+    base_url = f"http://127.0.0.1:{args.port}" if args.spawn_server else args.base_url.rstrip("/")
+    try:
+        fixtures = load_fixtures()
+        results = {}
+        for name in args.scenarios.split(","):
+            recorder = Recorder()
+            tasks = SCENARIO_BUILDERS[name](recorder, base_url, fixtures, args)
+            wall_seconds = run_tasks(tasks, args.concurrency)
+            results[name] = {
+                "wall_seconds": round(wall_seconds, 3),
+                "requests": len(tasks),
+                "throughput_rps": round(len(tasks) / wall_seconds, 2) if wall_seconds else 0.0,
+                "endpoints": summarize(recorder, wall_seconds)
+            }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "base_url": base_url,
+        "parameters": {name: getattr(args, name) for name in (
+            "scenarios", "workers", "concurrency", "logins", "heartbeat_students", "heartbeats", "admin_rounds", "playlists"
+        )},
+        "scenarios": results
+    }
+
+def scale(args) -> list:
+    """Run the scenarios against spawned servers with 1..max_workers processes and report the speedup"""
+    rows = []
+    for workers in range(1, args.max_workers + 1):
+        args.workers = workers
+        args.spawn_server = True
+        report = run(args)
+        throughput = {name: result["throughput_rps"] for name, result in report["scenarios"].items()}
+        rows.append({"workers": workers, "throughput_rps": throughput})
+        print(f"{workers} worker(s): " + ", ".join(f"{name} {rps} req/s" for name, rps in throughput.items()), flush=True)
+    baseline = rows[0]["throughput_rps"]
+    for row in rows:
+        row["speedup"] = {
+            name: round(rps / baseline[name], 2) if baseline.get(name) else None
+            for name, rps in row["throughput_rps"].items()
+        }
+    return rows
+
+def print_report(report: dict):
+    for name, result in report["scenarios"].items():
+        print(f"\n{name}: {result['requests']} requests in {result['wall_seconds']}s ({result['throughput_rps']} req/s)")
+        print(f"  {'endpoint':<36} {'reqs':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for label, stats in result["endpoints"].items():
+            print(
+                f"  {label:<36} {stats['requests']:>6} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+                f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}"
+            )
+
+def compare(baseline_path: str, current_path: str, threshold: float) -> list:
+    """Endpoints whose p95 latency grew, or throughput dropped, by more than `threshold` (fraction)"""
+    with open(baseline_path) as baseline_file, open(current_path) as current_file:
+        baseline = json.load(baseline_file)
+        current = json.load(current_file)
+    regressions = []
+    for name, result in current["scenarios"].items():
+        for label, stats in result["endpoints"].items():
+            before = baseline["scenarios"].get(name, {}).get("endpoints", {}).get(label)
+            if not before:
+                continue
+            if before["p95_ms"] and stats["p95_ms"] > before["p95_ms"] * (1 + threshold):
+                regressions.append(f"{name} {label}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms")
+            if before["throughput_rps"] and stats["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+                regressions.append(f"{name} {label}: throughput {before['throughput_rps']} -> {stats['throughput_rps']} req/s")
+            if stats["errors"] > before["errors"]:
+                regressions.append(f"{name} {label}: errors {before['errors']} -> {stats['errors']}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed benchmark data, serve the API with a fake extractor and run load scenarios")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Insert benchmark users, courses, videos and history")
+    seed_parser.add_argument("--students", type=int, default=1000)
+    seed_parser.add_argument("--courses", type=int, default=10)
+    seed_parser.add_argument("--videos", type=int, default=15, help="Videos per course")
+    seed_parser.add_argument("--days", type=int, default=30, help="Days of progress history")
+    seed_parser.add_argument("--videos-per-day", type=int, default=3)
+    seed_parser.add_argument("--truncate", action="store_true", help="Empty all tables first")
+
+    serve_parser = commands.add_parser("serve", help="Run the API with the fake YouTube extractor")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--workers", type=int, default=1)
+
+    run_parser = commands.add_parser("run", help="Run load scenarios and report latency percentiles")
+    run_parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--spawn-server", action="store_true", help="Start `serve` in a subprocess for the run")
+    run_parser.add_argument("--port", type=int, default=8765, help="Port for --spawn-server")
+    run_parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--logins", type=int, default=100)
+    run_parser.add_argument("--heartbeat-students", type=int, default=200)
+    run_parser.add_argument("--heartbeats", type=int, default=5, help="Heartbeats per student")
+    run_parser.add_argument("--admin-rounds", type=int, default=10)
+    run_parser.add_argument("--playlists", type=int, default=5)
+    run_parser.add_argument("--searches", type=int, default=200)
+    run_parser.add_argument("--workers", type=int, default=1, help="Worker processes for --spawn-server")
+    run_parser.add_argument("--output", help="Write the report as JSON")
+
+    scale_parser = commands.add_parser("scale", help="Measure throughput with 1..N server worker processes")
+    scale_parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    scale_parser.add_argument("--port", type=int, default=8765)
+    scale_parser.add_argument("--scenarios", default="login,heartbeat,admin")
+    scale_parser.add_argument("--concurrency", type=int, default=32)
+    scale_parser.add_argument("--logins", type=int, default=100)
+    scale_parser.add_argument("--heartbeat-students", type=int, default=200)
+    scale_parser.add_argument("--heartbeats", type=int, default=5, help="Heartbeats per student")
+    scale_parser.add_argument("--admin-rounds", type=int, default=10)
+    scale_parser.add_argument("--playlists", type=int, default=5)
+    scale_parser.add_argument("--searches", type=int, default=200)
+    scale_parser.add_argument("--output", help="Write the results as JSON")
+
+    compare_parser = commands.add_parser("compare", help="Compare two JSON reports and list regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative change (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        print(f"Seeded: {seed(args.students, args.courses, args.videos, args.days, args.videos_per_day, args.truncate)}")
+    elif args.command == "serve":
+        serve(args.host, args.port, args.workers)
+    elif args.command == "run":
+        unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+        if unknown:
+            parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        report = run(args)
+        print_report(report)
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump(report, output, indent=2)
+            print(f"\nWrote {args.output}")
+    elif args.command == "scale":
+        unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+        if unknown:
+            parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        rows = scale(args)
+        print(f"\n{'workers':>7}  " + "  ".join(f"{name:>18}" for name in rows[0]["speedup"]))
+        for row in rows:
+            print(f"{row['workers']:>7}  " + "  ".join(
+                f"{row['throughput_rps'][name]:>9} ({row['speedup'][name]}x)".rjust(18) for name in row["speedup"]
+            ))
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump({"cpus": os.cpu_count(), "results": rows}, output, indent=2)
+            print(f"\nWrote {args.output}")
+    elif args.command == "compare":
+        regressions = compare(args.baseline, args.current, args.threshold)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
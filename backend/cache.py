@@ -0,0 +1,376 @@
+from collections import OrderedDict
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from urllib.parse import urlparse
+from database import engine
+import functools
+import json
+import math
+import os
+import select
+import threading
+import time
+import uuid
+
+# Small cache layer shared by the services.
+# CACHE_URL selects the backend:
+#   memory://            in-process TTL/LRU cache (default; each instance has its own)
+#   redis://host:6379/0  shared Redis (or Redis-compatible) server, requires the `redis` package
+#   fake://              in-process stand-in for Redis (same serialization path, no server; for local testing)
+#   none://              caching disabled
+# Values must be JSON-serializable so every backend behaves the same.
+# With the memory backend on PostgreSQL, invalidations are also relayed to the other
+# worker processes/instances through NOTIFY so their copies don't outlive a write.
+
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+
+# Entries kept by the in-process cache before least recently used ones are evicted
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+# TTL used when a caller doesn't pass one
+CACHE_DEFAULT_TTL_SECONDS = float(os.getenv("CACHE_DEFAULT_TTL_SECONDS", "300"))
+
+# Prefix for keys on shared servers
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "edutrack:")
+
+# Relay invalidations of the memory backend to other processes (PostgreSQL only)
+CACHE_INVALIDATION_BROADCAST = os.getenv("CACHE_INVALIDATION_BROADCAST", "1") == "1"
+
+# Invalidations are batched for this long, so write bursts cost one NOTIFY per process
+CACHE_INVALIDATION_BATCH_SECONDS = float(os.getenv("CACHE_INVALIDATION_BATCH_SECONDS", "0.05"))
+
+INVALIDATION_CHANNEL = "cache_invalidations"
+NOTIFY_PAYLOAD_BYTES = 7000  # PostgreSQL rejects payloads over 8000 bytes
+
+MISSING = object()
+
+class MemoryCache:
+    """Thread-safe in-process cache with per-entry TTL and LRU eviction by entry count"""
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+class FakeRedis:
+    """Minimal in-process stand-in for a Redis client (get/set with expiry/delete)"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[0] is not None and entry[0] <= time.monotonic()):
+                self._data.pop(key, None)
+                return None
+            return entry[1]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ex if ex else None, value.encode() if isinstance(value, str) else value)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+    def dbsize(self):
+        with self._lock:
+            return len(self._data)
+
+class RedisCache:
+    """Cache on a shared Redis-compatible server; server errors count as misses so requests keep working"""
+    name = "redis"
+
+    def __init__(self, client, prefix: str = CACHE_KEY_PREFIX):
+        self.client = client
+        self.prefix = prefix
+        self.errors = 0
+
+    def get(self, key: str):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception:
+            self.errors += 1
+            return MISSING
+        return MISSING if raw is None else json.loads(raw)
+
+    def set(self, key: str, value, ttl: float):
+        try:
+            self.client.set(self.prefix + key, json.dumps(value, separators=(",", ":")), ex=max(1, math.ceil(ttl)))
+        except Exception:
+            self.errors += 1
+
+    def delete(self, *keys: str):
+        if not keys:
+            return
+        try:
+            self.client.delete(*(self.prefix + key for key in keys))
+        except Exception:
+            self.errors += 1
+
+    def clear(self):
+        self.client.flushdb()
+
+    def stats(self) -> dict:
+        try:
+            entries = self.client.dbsize()
+        except Exception:
+            entries = None
+        return {"entries": entries, "errors": self.errors}
+
+class NullCache:
+    """Backend that stores nothing (caching disabled)"""
+    name = "none"
+
+    def get(self, key: str):
+        return MISSING
+
+    def set(self, key: str, value, ttl: float):
+        pass
+
+    def delete(self, *keys: str):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"entries": 0}
+
+def create_backend(url: str):
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryCache()
+    if scheme in ("redis", "rediss"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL points to Redis but the `redis` package is not installed")
+        return RedisCache(redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5))
+    if scheme == "fake":
+        backend = RedisCache(FakeRedis())
+        backend.name = "fake"
+        return backend
+    if scheme == "none":
+        return NullCache()
+    raise RuntimeError(f"Unsupported CACHE_URL scheme: {scheme!r}")
+
+backend = create_backend(CACHE_URL)
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+_flights = {}  # key -> _Flight for loads in progress
+_flights_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "coalesced": 0, "load_errors": 0}
+
+def _count(counter: str):
+    with _flights_lock:
+        _counters[counter] += 1
+
+def get_or_load(key: str, loader, ttl: float = None):
+    """Return the cached value for key, or call loader() once (even under concurrent misses) and cache it.
+
+    None results are not cached, so lookups for rows that don't exist yet are retried.
+    """
+    value = backend.get(key)
+    if value is not MISSING:
+        _count("hits")
+        return value
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            _counters["misses"] += 1
+        else:
+            _counters["coalesced"] += 1
+
+    if not leader:
+        # Another thread is already loading this key; share its result
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    try:
+        value = loader()
+        if value is not None:
+            backend.set(key, value, CACHE_DEFAULT_TTL_SECONDS if ttl is None else ttl)
+        flight.value = value
+        return value
+    except Exception as e:
+        flight.error = e
+        _count("load_errors")
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+def cache_key(namespace: str, *parts) -> str:
+    return ":".join([namespace, *(str(part) for part in parts)])
+
+_relay = {"origin": uuid.uuid4().hex, "running": False, "pending": set()}
+_relay_lock = threading.Lock()
+_relay_wakeup = threading.Event()
+
+def invalidate(*keys: str):
+    """Drop cached entries (call after the underlying rows change)"""
+    backend.delete(*keys)
+    if _relay["running"] and keys:
+        with _relay_lock:
+            _relay["pending"].update(keys)
+        _relay_wakeup.set()
+
+def _payloads(keys) -> list:
+    batches = [[]]
+    size = 0
+    for key in keys:
+        if batches[-1] and size + len(key) + 3 > NOTIFY_PAYLOAD_BYTES:
+            batches.append([])
+            size = 0
+        batches[-1].append(key)
+        size += len(key) + 3
+    return [json.dumps({"origin": _relay["origin"], "keys": batch}) for batch in batches if batch]
+
+def _send_forever():
+    while True:
+        _relay_wakeup.wait()
+        time.sleep(CACHE_INVALIDATION_BATCH_SECONDS)
+        _relay_wakeup.clear()
+        with _relay_lock:
+            keys, _relay["pending"] = _relay["pending"], set()
+        if not keys:
+            continue
+        try:
+            with engine.connect() as connection:
+                for payload in _payloads(sorted(keys)):
+                    connection.execute(text("SELECT pg_notify(:channel, :payload)"), {
+                        "channel": INVALIDATION_CHANNEL,
+                        "payload": payload
+                    })
+                connection.commit()
+        except Exception:
+            # Database unavailable; the other processes' TTLs bound how stale these keys get
+            pass
+
+def _listen_forever():
+    while True:
+        try:
+            connection = engine.raw_connection()
+            try:
+                listener = connection.dbapi_connection
+                listener.set_isolation_level(0)  # autocommit, required for LISTEN
+                listener.cursor().execute(f"LISTEN {INVALIDATION_CHANNEL}")
+                # Invalidations may have been missed while disconnected
+                backend.clear()
+                while True:
+                    if select.select([listener], [], [], 30) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        message = json.loads(listener.notifies.pop(0).payload)
+                        if message["origin"] != _relay["origin"]:
+                            backend.delete(*message["keys"])
+            finally:
+                connection.invalidate()
+        except Exception:
+            # Database unavailable; retry shortly
+            time.sleep(5)
+
+def start_invalidation_relay():
+    """Relay invalidations between processes (memory backend on PostgreSQL; shared backends need no relay)"""
+    if not CACHE_INVALIDATION_BROADCAST or backend.name != "memory" or engine.dialect.name != "postgresql":
+        return
+    _relay["running"] = True
+    threading.Thread(target=_send_forever, name="cache-invalidation-sender", daemon=True).start()
+    threading.Thread(target=_listen_forever, name="cache-invalidation-listener", daemon=True).start()
+
+def _reset_after_fork():
+    # Each forked worker needs its own origin so it ignores only its own notifications
+    _relay.update(origin=uuid.uuid4().hex, running=False, pending=set())
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def cached(namespace: str, ttl: float = None):
+    """Cache a loader function's result, keyed by its arguments (database sessions are ignored).
+
+    The wrapped function gets `invalidate(*args)` to drop the entry for the same arguments.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parts = [arg for arg in args if not isinstance(arg, Session)]
+            parts += [f"{name}={value}" for name, value in sorted(kwargs.items()) if not isinstance(value, Session)]
+            return get_or_load(cache_key(namespace, *parts), lambda: func(*args, **kwargs), ttl)
+
+        wrapper.invalidate = lambda *parts: invalidate(cache_key(namespace, *parts))
+        return wrapper
+    return decorator
+
+def cache_stats() -> dict:
+    """Hit/miss counters of this instance plus the backend's own statistics"""
+    with _flights_lock:
+        counters = dict(_counters)
+    lookups = counters["hits"] + counters["misses"] + counters["coalesced"]
+    return {
+        "backend": backend.name,
+        **counters,
+        "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        "invalidation_relay": _relay["running"],
+        **backend.stats()
+    }
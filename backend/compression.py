@@ -0,0 +1,101 @@
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+import gzip
+import os
+
+# Response compression (Brotli when the `brotli` package is installed, otherwise gzip).
+# Only complete bodies above COMPRESSION_MIN_BYTES are compressed; streamed responses
+# (SSE, chunked downloads) pass through untouched so events are not held back.
+
+# Smaller bodies are sent as-is (compression overhead outweighs the savings)
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+# Brotli 4 / gzip 6 compress well at a CPU cost suited to per-request dynamic responses
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+# Bodies larger than this are compressed in the threadpool instead of on the event loop
+THREADPOOL_COMPRESSION_BYTES = 256 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv", "application/javascript")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def negotiate(accept_encoding: str):
+    """Preferred supported encoding from an Accept-Encoding header (None = identity)"""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, parameters = part.strip().partition(";")
+        quality = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith("q="):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=lambda encoding: offered.get(encoding, offered.get("*", 0.0)))
+    return best if offered.get(best, offered.get("*", 0.0)) > 0 else None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower() in COMPRESSIBLE_TYPES
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete compressible responses for clients that accept it"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Hold the headers until the body shows whether it is worth compressing
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            eligible = "content-encoding" not in headers and is_compressible(headers.get("content-type", ""))
+            if message.get("more_body", False) or not eligible or len(body) < self.minimum_size:
+                if eligible and not message.get("more_body", False):
+                    headers.add_vary_header("Accept-Encoding")
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) > THREADPOOL_COMPRESSION_BYTES:
+                body = await run_in_threadpool(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
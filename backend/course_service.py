@@ -1,20 +1,144 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import bindparam, func, inspect, select, text, update
 from sqlalchemy.orm import Session
 from models import Course, CourseVideo, User, CourseStatus
 from schemas import CourseResponse, CourseVideoResponse, CourseRegistrationResponse
-from database import get_db
+from database import get_db, engine, all_engines, request_tenant
 from dependencies import get_current_user, get_current_user_optional, get_current_user_id
+from cache import cached
+from search_service import invalidate_search_index
+from serialization import columns, trusted_json, youtube_url, youtube_video_id
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/courses", tags=["Courses"])
 
+# The catalog and video lists change only when an admin imports or deletes a course
+CATALOG_CACHE_SECONDS = float(os.getenv("CATALOG_CACHE_SECONDS", "300"))
+
+# How often course counters are recomputed from course_video and course_status
+COURSE_COUNTER_RECONCILE_SECONDS = float(os.getenv("COURSE_COUNTER_RECONCILE_SECONDS", "3600"))
+
+CATALOG_FIELDS = ("id", "course_title", "link", "video_count", "enrolled_count", "total_duration_seconds")
+COUNTER_FIELDS = ("video_count", "enrolled_count", "total_duration_seconds")
+
+# Serializes the counter DDL across instances starting at the same time
+ADVISORY_LOCK_ID = 7_202_045
+
+@cached("courses:catalog", ttl=CATALOG_CACHE_SECONDS)
+def load_catalog(db: Session, tenant_id: str) -> list:
+    return [
+        dict(zip(CATALOG_FIELDS, row))
+        for row in db.query(*(getattr(Course, field) for field in CATALOG_FIELDS))
+        .filter(Course.tenant_id == tenant_id).order_by(Course.id)
+    ]
+
+@cached("courses:video-columns", ttl=CATALOG_CACHE_SECONDS)
+def load_course_videos(db: Session, tenant_id: str, course_id: int) -> dict:
+    """A course's videos as columns (id, title, video_id, duration_seconds); video_link stores the YouTube id"""
+    rows = [
+        (id, title, youtube_video_id(video_link) or video_link, duration_seconds)
+        for id, title, video_link, duration_seconds in db.query(
+            CourseVideo.id, CourseVideo.title, CourseVideo.video_link, CourseVideo.duration_seconds
+        ).join(Course, Course.id == CourseVideo.course_id)
+        .filter(CourseVideo.course_id == course_id, Course.tenant_id == tenant_id).order_by(CourseVideo.id)
+    ]
+    return columns(rows, ("id", "title", "video_id", "duration_seconds"))
+
+def ensure_course_counters(bind=engine):
+    """Add the counter and duration columns to databases created before them, then reconcile"""
+    with bind.begin() as connection:
+        if bind.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        # Inspected under the lock, so an instance that waited sees the columns the other one added
+        existing = {
+            table: {column["name"] for column in inspect(connection).get_columns(table)}
+            for table in ("course", "course_video")
+        }
+        for table, column, definition in (
+            ("course", "video_count", "INTEGER NOT NULL DEFAULT 0"),
+            ("course", "enrolled_count", "INTEGER NOT NULL DEFAULT 0"),
+            ("course", "total_duration_seconds", "INTEGER NOT NULL DEFAULT 0"),
+            ("course_video", "duration_seconds", "INTEGER"),
+        ):
+            if column not in existing[table]:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+    reconcile_course_counters(bind)
+
+def reconcile_course_counters(bind=engine) -> int:
+    """Recompute course counters from course_video and course_status; returns the number of courses corrected.
+
+    Each correction only applies if the stored counters still hold the values read before
+    counting, so an increment committed meanwhile is never overwritten (it is left for the next pass).
+    """
+    with bind.connect() as connection:
+        tenants = {}
+        stored = {}
+        for id, tenant_id, *counters in connection.execute(
+            select(Course.id, Course.tenant_id, *(getattr(Course, field) for field in COUNTER_FIELDS))
+        ):
+            tenants[id] = tenant_id
+            stored[id] = counters
+        videos = dict(
+            (course_id, (count, duration)) for course_id, count, duration in connection.execute(
+                select(CourseVideo.course_id, func.count(), func.coalesce(func.sum(CourseVideo.duration_seconds), 0))
+                .group_by(CourseVideo.course_id)
+            )
+        )
+        enrolled = dict(connection.execute(
+            select(CourseStatus.course_id, func.count()).where(CourseStatus.enrolled.is_(True)).group_by(CourseStatus.course_id)
+        ).all())
+    changes = []
+    for id, (video_count, enrolled_count, total_duration_seconds) in stored.items():
+        actual_videos, actual_duration = videos.get(id, (0, 0))
+        actual = (actual_videos, enrolled.get(id, 0), int(actual_duration))
+        if actual != (video_count, enrolled_count, total_duration_seconds):
+            changes.append({
+                "row_id": id,
+                **dict(zip(COUNTER_FIELDS, actual)),
+                **{f"seen_{field}": value for field, value in zip(COUNTER_FIELDS, (video_count, enrolled_count, total_duration_seconds))},
+            })
+    if not changes:
+        return 0
+    table = Course.__table__
+    with bind.begin() as connection:
+        corrected = connection.execute(
+            update(table)
+            .where(table.c.id == bindparam("row_id"), *(table.c[field] == bindparam(f"seen_{field}") for field in COUNTER_FIELDS))
+            .values({field: bindparam(field) for field in COUNTER_FIELDS}),
+            changes
+        ).rowcount
+    if corrected:
+        logger.warning("Corrected counters of %d course(s)", corrected)
+        for tenant_id in {tenants[change["row_id"]] for change in changes}:
+            load_catalog.invalidate(tenant_id)
+    return corrected
+
+def _reconcile_forever():
+    while True:
+        time.sleep(COURSE_COUNTER_RECONCILE_SECONDS)
+        for bind in all_engines():
+            try:
+                reconcile_course_counters(bind)
+            except Exception:
+                logger.exception("Course counter reconciliation failed")
+
+def start_counter_reconciler():
+    """Reconcile course counters every COURSE_COUNTER_RECONCILE_SECONDS in a daemon thread"""
+    threading.Thread(target=_reconcile_forever, name="course-counter-reconciler", daemon=True).start()
+
 @router.get("", response_model=list[CourseResponse])
 def get_courses(
+    request: Request,
     current_user: User = Depends(get_current_user_optional),
     db: Session = Depends(get_db)
 ):
     """Get all courses for the catalog (public, but tracks authenticated users)"""
-    courses = db.query(Course).all()
-    return courses
+    return load_catalog(db, request_tenant(request))
 
 @router.get("/{course_id}", response_model=CourseResponse)
 def get_course(
@@ -23,7 +147,7 @@ def get_course(
     db: Session = Depends(get_db)
 ):
     """Get a specific course by ID (requires authentication)"""
-    course = db.query(Course).filter(Course.id == course_id).first()
+    course = db.query(Course).filter(Course.id == course_id, Course.tenant_id == current_user.tenant_id).first()
     if not course:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -34,12 +158,23 @@ def get_course(
 @router.get("/{course_id}/videos", response_model=list[CourseVideoResponse])
 def get_course_videos(
     course_id: int,
+    request: Request,
+    compact: bool = False,
     current_user: User = Depends(get_current_user_optional),
     db: Session = Depends(get_db)
 ):
-    """Get all videos for a specific course (public, but tracks authenticated users)"""
-    videos = db.query(CourseVideo).filter(CourseVideo.course_id == course_id).all()
-    return videos
+    """Get all videos for a specific course (public, but tracks authenticated users).
+
+    With `compact=1` the response is {"course_id", "id": [...], "title": [...], "video_id": [...], "duration_seconds": [...]}
+    and clients build watch URLs from the YouTube ids.
+    """
+    videos = load_course_videos(db, request_tenant(request), course_id)
+    if compact:
+        return trusted_json({"course_id": course_id, **videos})
+    return trusted_json([
+        {"id": id, "course_id": course_id, "title": title, "video_link": youtube_url(video_id), "duration_seconds": duration_seconds}
+        for id, title, video_id, duration_seconds in zip(videos["id"], videos["title"], videos["video_id"], videos["duration_seconds"])
+    ])
 
 @router.delete("/{course_id}")
 def delete_course(
@@ -54,7 +189,7 @@ def delete_course(
             detail="Admin access required"
         )
     
-    course = db.query(Course).filter(Course.id == course_id).first()
+    course = db.query(Course).filter(Course.id == course_id, Course.tenant_id == current_user.tenant_id).first()
     if not course:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -68,6 +203,9 @@ def delete_course(
         # Delete the course
         db.delete(course)
         db.commit()
+        load_catalog.invalidate(current_user.tenant_id)
+        load_course_videos.invalidate(current_user.tenant_id, course_id)
+        invalidate_search_index(current_user.tenant_id)
         
         return {"message": "Course deleted successfully", "course_id": course_id}
     except Exception as e:
@@ -80,11 +218,12 @@ def delete_course(
 @router.get("/{course_id}/registration", response_model=CourseRegistrationResponse)
 def get_course_registration(
     course_id: int,
+    request: Request,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Check if user is registered for a course"""
-    course = db.query(Course).filter(Course.id == course_id).first()
+    course = db.query(Course).filter(Course.id == course_id, Course.tenant_id == request_tenant(request)).first()
     if not course:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -109,14 +248,20 @@ def get_course_registration(
             "created_at": None
         }
 
+def increment_enrolled_count(db: Session, course_id: int):
+    """Count a new enrollment in the same transaction as its course_status row"""
+    db.execute(update(Course).where(Course.id == course_id).values(enrolled_count=Course.enrolled_count + 1))
+
 @router.post("/{course_id}/register", response_model=CourseRegistrationResponse)
 def register_for_course(
     course_id: int,
+    request: Request,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Register user for a course"""
-    course = db.query(Course).filter(Course.id == course_id).first()
+    tenant_id = request_tenant(request)
+    course = db.query(Course).filter(Course.id == course_id, Course.tenant_id == tenant_id).first()
     if not course:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -138,8 +283,10 @@ def register_for_course(
         else:
             # Update existing record
             existing_registration.enrolled = True
+            increment_enrolled_count(db, course_id)
             db.commit()
             db.refresh(existing_registration)
+            load_catalog.invalidate(tenant_id)
             return {
                 "course_id": course_id,
                 "enrolled": True,
@@ -149,13 +296,16 @@ def register_for_course(
         # Create new registration
         try:
             new_registration = CourseStatus(
+                tenant_id=tenant_id,
                 user_id=user_id,
                 course_id=course_id,
                 enrolled=True
             )
             db.add(new_registration)
+            increment_enrolled_count(db, course_id)
             db.commit()
             db.refresh(new_registration)
+            load_catalog.invalidate(tenant_id)
             return {
                 "course_id": course_id,
                 "enrolled": True,
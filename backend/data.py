@@ -0,0 +1,278 @@
+from datetime import date, datetime, timezone
+from database import engine
+from models import User, Course, CourseVideo, CourseStatus, Progress, Attendance
+from partitions import add_months, ensure_partitions
+from course_service import reconcile_course_counters
+import argparse
+import gzip
+import json
+import os
+import time
+
+# Snapshot and restore of the core tables with PostgreSQL COPY.
+#   python data.py export snapshots/2024-05 [--tables progress,attendance] [--start-date 2024-05-01 --end-date 2024-05-31]
+#   python data.py import snapshots/2024-05 [--replace]
+# A snapshot is a directory with one compressed COPY stream per table and a manifest.json.
+# Tables are exported in one repeatable-read transaction (a consistent snapshot) and
+# imported in one transaction, so a failed import leaves the target untouched. Rows
+# stream through the compressor in COPY-sized chunks; no table is held in memory.
+# Attendance streaks/history are cleared after an attendance import and rebuilt on demand.
+# Running API processes keep cached catalog/profile entries until their TTLs expire.
+
+# In import order (referenced tables first)
+TABLES = {model.__tablename__: model for model in (User, Course, CourseVideo, CourseStatus, Progress, Attendance)}
+
+# Time-series tables: --start-date/--end-date filter these on `date`
+DATED_TABLES = ("progress", "attendance")
+
+FORMATS = ("binary", "csv")
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+# Bytes per read/write between COPY and the compressed file
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# Fast levels: COPY output is repetitive, so even these shrink it several times
+DEFAULT_LEVELS = {"gzip": 1, "zstd": 3}
+
+EXTENSIONS = {"binary": "bin", "csv": "csv"}
+COMPRESSED_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+MANIFEST = "manifest.json"
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def open_stream(path: str, mode: str, compression: str, level: int = None):
+    """Binary file object that (de)compresses on the fly"""
+    if compression == "gzip":
+        return gzip.open(path, mode + "b", compresslevel=level or DEFAULT_LEVELS["gzip"])
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the `zstandard` package")
+        raw = open(path, mode + "b")
+        if mode == "w":
+            return zstandard.ZstdCompressor(level=level or DEFAULT_LEVELS["zstd"]).stream_writer(raw, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    return open(path, mode + "b", buffering=COPY_CHUNK_BYTES)
+
+class CountingStream:
+    """Passes COPY data through to a file object, counting the uncompressed bytes"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes = 0
+
+    def write(self, chunk):
+        self.bytes += len(chunk)
+        return self.stream.write(chunk)
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.bytes += len(chunk)
+        return chunk
+
+def table_columns(table: str) -> list:
+    return [column.name for column in TABLES[table].__table__.columns]
+
+def copy_options(format: str) -> str:
+    return "FORMAT binary" if format == "binary" else "FORMAT csv, HEADER true"
+
+def quote(name: str) -> str:
+    return f'"{name}"'
+
+def _require_postgres(bind):
+    if bind.dialect.name != "postgresql":
+        raise RuntimeError("Snapshots use COPY and require PostgreSQL")
+
+def _report(table: str, rows: int, size: int, seconds: float) -> dict:
+    return {
+        "table": table,
+        "rows": rows,
+        "bytes": size,
+        "seconds": round(seconds, 2),
+        "rows_per_second": round(rows / seconds) if seconds > 0 else rows,
+    }
+
+def export_snapshot(directory: str, tables: list = None, start_date: date = None, end_date: date = None,
+                    format: str = "binary", compression: str = "gzip", level: int = None, bind=engine, progress=None) -> dict:
+    """Write the tables to `directory`; progress(entry) is called after each table"""
+    _require_postgres(bind)
+    tables = [table for table in TABLES if table in (tables or TABLES)]
+    os.makedirs(directory, exist_ok=True)
+    manifest = {
+        "version": 1,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "format": format,
+        "compression": compression,
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "tables": {},
+    }
+    raw = bind.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        for table in tables:
+            columns = table_columns(table)
+            source = f"SELECT {', '.join(map(quote, columns))} FROM {quote(table)}"
+            conditions, parameters = [], []
+            if table in DATED_TABLES:
+                if start_date:
+                    conditions.append("date >= %s")
+                    parameters.append(start_date)
+                if end_date:
+                    conditions.append("date <= %s")
+                    parameters.append(end_date)
+            where = " WHERE " + " AND ".join(conditions) if conditions else ""
+            source += where
+            if table in DATED_TABLES:
+                # Lets the import create the monthly partitions the rows need
+                cursor.execute(f"SELECT min(date), max(date) FROM {quote(table)}{where}", parameters)
+                first_date, last_date = cursor.fetchone()
+            statement = cursor.mogrify(f"COPY ({source}) TO STDOUT WITH ({copy_options(format)})", parameters).decode()
+
+            filename = f"{table}.{EXTENSIONS[format]}{COMPRESSED_EXTENSIONS[compression]}"
+            started = time.monotonic()
+            with open_stream(os.path.join(directory, filename), "w", compression, level) as stream:
+                counted = CountingStream(stream)
+                cursor.copy_expert(statement, counted, size=COPY_CHUNK_BYTES)
+            entry = _report(table, cursor.rowcount, counted.bytes, time.monotonic() - started)
+            manifest["tables"][table] = {"file": filename, "columns": columns, "rows": entry["rows"], "bytes": entry["bytes"]}
+            if table in DATED_TABLES:
+                manifest["tables"][table].update(
+                    first_date=first_date.isoformat() if first_date else None,
+                    last_date=last_date.isoformat() if last_date else None
+                )
+            if progress:
+                progress(entry)
+        raw.rollback()
+    finally:
+        raw.close()
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def import_snapshot(directory: str, tables: list = None, replace: bool = False, bind=engine, progress=None) -> dict:
+    """Load a snapshot in one transaction.
+
+    With `replace`, rows the snapshot covers are deleted first: whole tables, or only the
+    snapshot's date range for progress and attendance when it was exported with one.
+    Without it, rows are appended (conflicting ids abort the import).
+    """
+    _require_postgres(bind)
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    tables = [table for table in TABLES if table in manifest["tables"] and table in (tables or TABLES)]
+    dated = manifest["start_date"] or manifest["end_date"]
+
+    for table in tables:
+        first_date = manifest["tables"][table].get("first_date")
+        if first_date:
+            first_month = add_months(date.fromisoformat(first_date), 0)
+            last_month = add_months(date.fromisoformat(manifest["tables"][table]["last_date"]), 0)
+            months = (last_month.year - first_month.year) * 12 + last_month.month - first_month.month
+            ensure_partitions(bind, months_ahead=months, start=first_month)
+
+    raw = bind.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if replace:
+            truncated = [table for table in tables if not (dated and table in DATED_TABLES)]
+            if truncated:
+                # CASCADE would silently empty tables outside the snapshot, so it isn't used
+                cursor.execute(f"TRUNCATE {', '.join(map(quote, truncated))}")
+            for table in tables:
+                if dated and table in DATED_TABLES:
+                    cursor.execute(
+                        f"DELETE FROM {quote(table)} WHERE date >= COALESCE(%s::date, '-infinity') AND date <= COALESCE(%s::date, 'infinity')",
+                        (manifest["start_date"], manifest["end_date"])
+                    )
+
+        report = {"tables": []}
+        for table in tables:
+            entry = manifest["tables"][table]
+            columns = ", ".join(map(quote, entry["columns"]))
+            started = time.monotonic()
+            with open_stream(os.path.join(directory, entry["file"]), "r", manifest["compression"]) as stream:
+                counted = CountingStream(stream)
+                cursor.copy_expert(
+                    f"COPY {quote(table)} ({columns}) FROM STDIN WITH ({copy_options(manifest['format'])})",
+                    counted, size=COPY_CHUNK_BYTES
+                )
+            result = _report(table, cursor.rowcount, counted.bytes, time.monotonic() - started)
+            report["tables"].append(result)
+            if progress:
+                progress(result)
+
+        if "attendance" in tables:
+            # Derived from attendance; rebuilt per user on the next stats request
+            cursor.execute("DELETE FROM attendance_streak")
+            cursor.execute("DELETE FROM attendance_history")
+
+        # Serial sequences continue after the imported ids
+        for table in tables:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT MAX(id) FROM {quote(table)}), 0) + 1, false)",
+                (quote(table),)
+            )
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    if {"course", "course_video", "course_status"} & set(tables):
+        reconcile_course_counters(bind)
+    return report
+
+def _print_entry(entry: dict):
+    print(
+        f"{entry['table']:<14} {entry['rows']:>12,} rows {entry['bytes'] / 1e6:>10.1f} MB "
+        f"{entry['seconds']:>8.2f}s {entry['rows_per_second'] * 60:>14,} rows/min"
+    )
+
+def _print_total(entries: list, seconds: float):
+    rows = sum(entry["rows"] for entry in entries)
+    size = sum(entry["bytes"] for entry in entries)
+    print(f"{'total':<14} {rows:>12,} rows {size / 1e6:>10.1f} MB {seconds:>8.2f}s {round(rows / seconds * 60) if seconds > 0 else rows:>14,} rows/min")
+
+def _table_list(value: str) -> list:
+    tables = [table.strip() for table in value.split(",") if table.strip()]
+    unknown = set(tables) - set(TABLES)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown tables: {', '.join(sorted(unknown))} (choose from {', '.join(TABLES)})")
+    return tables
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and import snapshots of the core tables with COPY")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write tables to a snapshot directory")
+    export_parser.add_argument("directory")
+    export_parser.add_argument("--tables", type=_table_list, help=f"Comma-separated subset of {','.join(TABLES)}")
+    export_parser.add_argument("--start-date", type=date.fromisoformat, help="First day of progress/attendance to export")
+    export_parser.add_argument("--end-date", type=date.fromisoformat, help="Last day of progress/attendance to export")
+    export_parser.add_argument("--format", choices=FORMATS, default="binary", help="binary is fastest; csv is portable")
+    export_parser.add_argument("--compression", choices=COMPRESSIONS, default="gzip")
+    export_parser.add_argument("--level", type=int, help="Compression level (default: gzip 1, zstd 3)")
+    import_parser = commands.add_parser("import", help="Load a snapshot directory")
+    import_parser.add_argument("directory")
+    import_parser.add_argument("--tables", type=_table_list, help="Only load these tables from the snapshot")
+    import_parser.add_argument("--replace", action="store_true",
+                               help="Delete the rows the snapshot covers first (whole tables, or its date range for progress/attendance)")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    entries = []
+
+    def progress(entry):
+        entries.append(entry)
+        _print_entry(entry)
+
+    if args.command == "export":
+        export_snapshot(args.directory, args.tables, args.start_date, args.end_date,
+                        args.format, args.compression, args.level, progress=progress)
+    elif args.command == "import":
+        import_snapshot(args.directory, args.tables, args.replace, progress=progress)
+    _print_total(entries, time.monotonic() - started)
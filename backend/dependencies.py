@@ -1,14 +1,48 @@
-from fastapi import Depends, HTTPException, status, Header
+from fastapi import Depends, HTTPException, status, Header, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from typing import Optional
 from auth import verify_token
 from models import User
-from database import get_db
+from database import get_db, read_session, request_tenant, DEFAULT_TENANT
+from cache import cached
+from datetime import datetime
+import query_budget
+import os
 
 security = HTTPBearer()
 security_optional = HTTPBearer(auto_error=False)
 
+# Every authenticated request resolves its user; cache the profile briefly (never the password hash)
+USER_CACHE_SECONDS = float(os.getenv("USER_CACHE_SECONDS", "60"))
+
+@cached("users:by-name", ttl=USER_CACHE_SECONDS)
+def load_user_profile(db: Session, tenant_id: str, user_name: str) -> Optional[dict]:
+    row = db.query(User.id, User.name, User.email, User.user_name, User.role, User.created_at).filter(
+        User.tenant_id == tenant_id,
+        User.user_name == user_name
+    ).first()
+    if row is None:
+        return None
+    user_id, name, email, user_name, role, created_at = row
+    return {
+        "id": user_id,
+        "tenant_id": tenant_id,
+        "name": name,
+        "email": email,
+        "user_name": user_name,
+        "role": role,
+        "created_at": created_at.isoformat() if created_at else None
+    }
+
+def find_user(db: Session, user_name: str, tenant_id: str = DEFAULT_TENANT) -> Optional[User]:
+    """Look up a user by user name through the profile cache (returns a detached User without the password)"""
+    profile = load_user_profile(db, tenant_id, user_name)
+    if profile is None:
+        return None
+    created_at = datetime.fromisoformat(profile["created_at"]) if profile["created_at"] else None
+    return User(**{**profile, "created_at": created_at})
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -32,7 +66,7 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = db.query(User).filter(User.user_name == user_name).first()
+    user = find_user(db, user_name, payload.get("tenant", DEFAULT_TENANT))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -42,6 +76,23 @@ def get_current_user(
     
     return user
 
+def get_read_db(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_optional)
+):
+    """DB session for read-only endpoints (read replica when configured and caught up, otherwise the primary)"""
+    user_id = None
+    if credentials is not None:
+        payload = verify_token(credentials.credentials)
+        user_id = payload.get("user_id") if payload else None
+    db = read_session(user_id, request_tenant(request))
+    query_budget.attach(db, request)
+    try:
+        yield db
+    finally:
+        db.close()
+        query_budget.finish(db, request)
+
 def get_current_user_id(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -67,6 +118,24 @@ def get_current_user_id(
     
     return user_id
 
+def get_user_id_from_token(token: Optional[str]) -> Optional[int]:
+    """Get user ID from a raw JWT (for WebSocket/SSE clients that pass the token as a query parameter)"""
+    if not token:
+        return None
+    payload = verify_token(token)
+    if not payload:
+        return None
+    return payload.get("user_id")
+
+def get_user_from_token(token: Optional[str], db: Session) -> Optional[User]:
+    """Get the user for a raw JWT (for WebSocket/SSE clients that pass the token as a query parameter)"""
+    if not token:
+        return None
+    payload = verify_token(token)
+    if not payload or payload.get("sub") is None:
+        return None
+    return find_user(db, payload.get("sub"), payload.get("tenant", DEFAULT_TENANT))
+
 def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_optional),
     db: Session = Depends(get_db)
@@ -86,7 +155,7 @@ def get_current_user_optional(
         if user_name is None:
             return None
         
-        user = db.query(User).filter(User.user_name == user_name).first()
+        user = find_user(db, user_name, payload.get("tenant", DEFAULT_TENANT))
         return user
     except Exception:
         return None
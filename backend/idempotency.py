@@ -0,0 +1,283 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from database import SessionLocal, DEFAULT_TENANT
+from models import IdempotencyKey
+from rate_limit import RouteTable, token_user_id
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Idempotency-Key support for retried writes.
+# The first request with a key claims it in the idempotency_key table, runs, and its
+# response (status, content type, body) is stored; retries with the same key and body
+# get that response back without running the handler again. A retry that arrives while
+# the original is still running waits for it in the same process, or gets 409 when the
+# original runs in another worker. A claim is first held for IDEMPOTENCY_LEASE_SECONDS, so
+# a worker that dies mid-request doesn't block retries for long; a completed response is
+# kept for the route's TTL. Keys are scoped per user and route; a background thread
+# purges expired keys.
+
+# Routes honoring Idempotency-Key -> seconds a key (and its stored response) is kept.
+# POST /progress is not listed: a replayed heartbeat merges the same segment again and
+# its credit is capped by the server clock, so a key would only add two writes per heartbeat.
+ROUTE_IDEMPOTENCY_TTLS = {
+    "POST /courses/{course_id}/register": 86400,
+    "POST /videos/youtube-playlist": 86400,
+}
+
+# Stored responses kept in memory (replays within a process skip the database)
+IDEMPOTENCY_CACHE_ENTRIES = int(os.getenv("IDEMPOTENCY_CACHE_ENTRIES", "10000"))
+
+# How long a claim whose request is still running holds its key; a retry after that runs again
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "300"))
+
+# How often expired keys are deleted from the table
+IDEMPOTENCY_PURGE_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_SECONDS", "300"))
+
+# A concurrent retry waits this long for the original request in the same process
+IDEMPOTENCY_WAIT_SECONDS = 30
+
+MAX_KEY_LENGTH = 255
+MAX_STORED_BODY_BYTES = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+_routes = RouteTable(ROUTE_IDEMPOTENCY_TTLS)
+
+# Only touched from the event loop thread
+_responses = OrderedDict()  # key -> (request_hash, status_code, content_type, body, expires_at monotonic)
+_in_flight = {}  # key -> future resolved with the stored response (None if it wasn't stored)
+
+def _remember(key: bytes, stored: tuple, ttl: float):
+    _responses[key] = (*stored, time.monotonic() + ttl)
+    _responses.move_to_end(key)
+    while len(_responses) > IDEMPOTENCY_CACHE_ENTRIES:
+        _responses.popitem(last=False)
+
+def _recall(key: bytes):
+    entry = _responses.get(key)
+    if entry is None:
+        return None
+    if entry[4] <= time.monotonic():
+        del _responses[key]
+        return None
+    _responses.move_to_end(key)
+    return entry[:4]
+
+def purge_expired(db) -> int:
+    """Delete expired keys"""
+    result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.now(timezone.utc)))
+    db.commit()
+    return result.rowcount
+
+def _purge_expired_forever():
+    while True:
+        time.sleep(IDEMPOTENCY_PURGE_SECONDS)
+        db = SessionLocal()
+        try:
+            purge_expired(db)
+        except Exception:
+            logger.exception("Idempotency key purge failed")
+        finally:
+            db.close()
+
+def start_idempotency_purger():
+    """Delete expired keys every IDEMPOTENCY_PURGE_SECONDS in a daemon thread"""
+    threading.Thread(target=_purge_expired_forever, name="idempotency-purger", daemon=True).start()
+
+def claim(key: bytes, request_hash: bytes):
+    """Claim a key for a new request for IDEMPOTENCY_LEASE_SECONDS; returns None when claimed, else the stored
+    (request_hash, status_code, content_type, body), with status_code None while the original is running"""
+    db = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+        for _ in range(2):
+            try:
+                db.execute(insert(IdempotencyKey).values(key=key, request_hash=request_hash, expires_at=expires_at))
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+            existing = db.execute(
+                select(IdempotencyKey.request_hash, IdempotencyKey.status_code, IdempotencyKey.content_type, IdempotencyKey.body)
+                .where(IdempotencyKey.key == key, IdempotencyKey.expires_at > now)
+            ).first()
+            if existing is not None:
+                return tuple(existing)
+            # Expired (or a stale claim whose lease ran out) but not purged yet: take it over,
+            # or retry the insert if it was just purged
+            result = db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key, IdempotencyKey.expires_at <= now)
+                .values(request_hash=request_hash, status_code=None, content_type=None, body=None, expires_at=expires_at)
+            )
+            db.commit()
+            if result.rowcount == 1:
+                return None
+        # Other requests keep claiming the key: report it as still running
+        return (request_hash, None, None, None)
+    finally:
+        db.close()
+
+def complete(key: bytes, status_code: int, content_type: str, body: bytes, ttl: float):
+    """Store the response of a claimed request and keep it for the route's TTL"""
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(IdempotencyKey).where(IdempotencyKey.key == key)
+            .values(
+                status_code=status_code, content_type=content_type, body=body,
+                expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl)
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def release(key: bytes):
+    """Forget a claim whose request failed, so a retry runs again"""
+    db = SessionLocal()
+    try:
+        db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)))
+        db.commit()
+    finally:
+        db.close()
+
+async def _respond(send, status_code: int, content_type: str, body: bytes, extra_headers: list = ()):
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", (content_type or "application/json").encode("latin-1")),
+            (b"content-length", str(len(body)).encode()),
+            *extra_headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _error(send, status_code: int, detail: str, extra_headers: list = ()):
+    await _respond(send, status_code, "application/json", json.dumps({"detail": detail}).encode(), extra_headers)
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+class IdempotencyMiddleware:
+    """ASGI middleware replaying stored responses for requests that repeat an Idempotency-Key"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        matched = _routes.match(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = authorization = None
+        for name, value in scope["headers"]:
+            if name == b"idempotency-key":
+                idempotency_key = value
+            elif name == b"authorization":
+                authorization = value
+        user_id = None
+        if idempotency_key is not None and authorization is not None and authorization[:7].lower() == b"bearer ":
+            user_id = token_user_id(authorization[7:].decode("latin-1"))
+        if user_id is None:
+            # No key, or a request that will be rejected as unauthenticated before doing any work
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            await _error(send, 400, "Idempotency-Key must be at most 255 characters")
+            return
+
+        route, ttl = matched
+        tenant_id = scope.get("state", {}).get("tenant_id", DEFAULT_TENANT)
+        key = hashlib.sha256(f"{tenant_id}\0{user_id}\0{route}\0".encode() + idempotency_key).digest()[:16]
+        body = await _read_body(receive)
+        request_hash = hashlib.sha256(body).digest()[:16]
+
+        stored = _recall(key)
+        if stored is None and key in _in_flight:
+            try:
+                stored = await asyncio.wait_for(asyncio.shield(_in_flight[key]), IDEMPOTENCY_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                await _error(send, 409, "A request with this Idempotency-Key is still being processed", [(b"retry-after", b"1")])
+                return
+        durable = True
+        if stored is None:
+            try:
+                stored = await run_in_threadpool(claim, key, request_hash)
+            except Exception:
+                # Database unavailable: still deduplicate within this process
+                durable = False
+            if stored is not None and stored[1] is None:
+                await _error(send, 409, "A request with this Idempotency-Key is still being processed", [(b"retry-after", b"1")])
+                return
+            if stored is not None:
+                _remember(key, stored, ttl)
+        if stored is not None:
+            if stored[0] != request_hash:
+                await _error(send, 422, "Idempotency-Key was already used for a different request")
+                return
+            await _respond(send, stored[1], stored[2], stored[3], [(b"idempotent-replayed", b"true")])
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        _in_flight[key] = future
+        response = {"status": 500, "content_type": None, "chunks": [], "size": 0}
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type":
+                        response["content_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                response["size"] += len(chunk)
+                if response["size"] <= MAX_STORED_BODY_BYTES:
+                    response["chunks"].append(chunk)
+            await send(message)
+
+        result = None
+        try:
+            await self.app(scope, replay_receive, capture)
+            # Server errors aren't stored, so a retry gets another chance
+            if response["status"] < 500 and response["size"] <= MAX_STORED_BODY_BYTES:
+                result = (request_hash, response["status"], response["content_type"], b"".join(response["chunks"]))
+        finally:
+            _in_flight.pop(key, None)
+            future.set_result(result)
+            if result is not None:
+                _remember(key, result, ttl)
+            if durable:
+                try:
+                    if result is not None:
+                        await run_in_threadpool(complete, key, *result[1:], ttl)
+                    else:
+                        await run_in_threadpool(release, key)
+                except Exception:
+                    pass
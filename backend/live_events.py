@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+# In-process publish/subscribe for live channels (WebSocket/SSE).
+# Subscribers are asyncio queues; publish() is thread-safe so sync route handlers
+# running in the threadpool can push events to connections on the event loop.
+
+# Events buffered per subscriber before the oldest ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+_subscribers = {}  # channel -> set of (loop, queue)
+_lock = threading.Lock()
+
+def subscribe(channel: str) -> asyncio.Queue:
+    """Subscribe the running event loop to a channel and return the queue events arrive on"""
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(channel, set()).add((asyncio.get_running_loop(), queue))
+    return queue
+
+def unsubscribe(channel: str, queue: asyncio.Queue):
+    """Remove a subscriber queue from a channel"""
+    with _lock:
+        subscribers = _subscribers.get(channel)
+        if not subscribers:
+            return
+        subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+        if not subscribers:
+            del _subscribers[channel]
+
+def has_subscribers(channel: str) -> bool:
+    """Check whether anyone is listening on a channel"""
+    return channel in _subscribers
+
+def publish(channel: str, event: dict):
+    """Send an event to every subscriber of a channel (safe to call from any thread)"""
+    with _lock:
+        subscribers = list(_subscribers.get(channel, ()))
+    for loop, queue in subscribers:
+        try:
+            loop.call_soon_threadsafe(_offer, queue, event)
+        except RuntimeError:
+            # Subscriber's event loop has been closed
+            unsubscribe(channel, queue)
+
+def _offer(queue: asyncio.Queue, event: dict):
+    # Slow consumers lose their oldest events rather than blocking publishers
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
@@ -0,0 +1,243 @@
+from prometheus_client import Counter, Gauge
+from starlette.responses import Response
+from rate_limit import RouteTable
+import json
+import math
+import os
+import time
+
+# Adaptive concurrency limiting (load shedding) for database-backed routes.
+# Each process admits at most `limit` requests at a time. The limit follows latency
+# (gradient: it shrinks when recent latency rises above the long-term baseline and grows
+# while it doesn't), so when PostgreSQL slows down the excess gets an immediate 503 with
+# Retry-After instead of queueing for a pool connection until the client gives up.
+# Routes have priorities: low-priority ones (admin reports, user listings, imports) may
+# only use part of the limit and are shed first, critical ones (progress heartbeats,
+# login) may use all of it. Pool checkout timeouts trip a circuit breaker that admits
+# only a few critical requests until it resets. Health checks, metrics and live streams
+# are not limited.
+
+# "1" (default) to shed load, "0" to admit everything
+LOAD_SHEDDING = os.getenv("LOAD_SHEDDING", "1") == "1"
+
+# Concurrent requests per process: starting point and bounds of the adaptive limit
+CONCURRENCY_LIMIT_INITIAL = int(os.getenv("CONCURRENCY_LIMIT_INITIAL", "20"))
+CONCURRENCY_LIMIT_MIN = int(os.getenv("CONCURRENCY_LIMIT_MIN", "4"))
+CONCURRENCY_LIMIT_MAX = int(os.getenv("CONCURRENCY_LIMIT_MAX", "100"))
+
+# Recent latency may reach this multiple of the long-term baseline before the limit shrinks
+LATENCY_TOLERANCE = 2.0
+
+# Share of the limit each priority may fill
+PRIORITY_SHARES = {"critical": 1.0, "normal": 0.8, "low": 0.5}
+
+# "METHOD /route/template" -> priority (others are "normal").
+# Extend or override with LOAD_SHEDDING_PRIORITIES="GET /courses=critical;GET /search=low"
+ROUTE_PRIORITIES = {
+    "POST /progress": "critical",
+    "POST /auth/login": "critical",
+    "GET /analytics/courses/completion": "low",
+    "GET /analytics/courses/{course_id}/drop-off": "low",
+    "GET /analytics/daily-active": "low",
+    "GET /analytics/watch-time": "low",
+    "GET /attendance/date/{attendance_date}": "low",
+    "GET /progress/attendance/date/{attendance_date}": "low",
+    "GET /attendance/user/{user_id}": "low",
+    "GET /progress/attendance/user/{user_id}": "low",
+    "POST /attendance/finalize-daily": "low",
+    "POST /progress/attendance/finalize-daily": "low",
+    "GET /auth/users": "low",
+    "GET /auth/users/students": "low",
+    "POST /auth/users/import": "low",
+    "GET /profiling/flamegraph": "low",
+}
+for entry in filter(None, os.getenv("LOAD_SHEDDING_PRIORITIES", "").split(";")):
+    route, _, priority = entry.rpartition("=")
+    ROUTE_PRIORITIES[route.strip()] = priority.strip()
+
+# Long-lived streams and routes that don't use the database
+EXEMPT_PATHS = {
+    "/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json",
+    "/progress/events", "/progress/attendance/live", "/attendance/live",
+}
+
+# Pool checkout timeouts within the window that open the breaker, and how long it stays open
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_WINDOW_SECONDS = 10
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "5"))
+
+LOAD_SHED = Counter(
+    "edutrack_load_shed_total", "Requests rejected with 503 to protect the database", ["priority", "reason"]
+)
+CONCURRENCY_LIMIT = Gauge(
+    "edutrack_concurrency_limit", "Adaptive concurrency limit", multiprocess_mode="livesum"
+)
+POOL_TIMEOUTS = Counter(
+    "edutrack_db_pool_timeouts_total", "Requests that found no free database connection in time"
+)
+
+class GradientLimit:
+    """Concurrency limit adjusted from request latency (after Netflix's Gradient2)"""
+
+    SHORT_SMOOTHING = 0.1    # ~ the last 10 requests
+    LONG_SMOOTHING = 0.002   # ~ the last 500 requests
+    LIMIT_SMOOTHING = 0.2
+
+    def __init__(self, initial: int = CONCURRENCY_LIMIT_INITIAL,
+                 minimum: int = CONCURRENCY_LIMIT_MIN, maximum: int = CONCURRENCY_LIMIT_MAX):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(initial)
+        self.short_latency = None
+        self.long_latency = None
+
+    def sample(self, latency: float, in_flight: int):
+        """Record a completed request's latency and the concurrency it ran at"""
+        latency = max(latency, 1e-4)
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+            return
+        self.short_latency += (latency - self.short_latency) * self.SHORT_SMOOTHING
+        self.long_latency += (latency - self.long_latency) * self.LONG_SMOOTHING
+        # Load dropped well below the baseline: let the baseline follow so the limit can grow again
+        if self.long_latency > 2 * self.short_latency:
+            self.long_latency *= 0.95
+        # A limit that isn't being used says nothing about capacity
+        if in_flight < self.limit / 2:
+            return
+        gradient = max(0.5, min(1.0, LATENCY_TOLERANCE * self.long_latency / self.short_latency))
+        # sqrt(limit) is the allowance for growth while latency holds
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = self._bounded(self.limit * (1 - self.LIMIT_SMOOTHING) + target * self.LIMIT_SMOOTHING)
+
+    def back_off(self):
+        """Halve the limit (the database ran out of connections)"""
+        self.limit = self._bounded(self.limit / 2)
+
+    def _bounded(self, limit: float) -> float:
+        return max(self.minimum, min(self.maximum, limit))
+
+class CircuitBreaker:
+    """Opens after repeated pool timeouts; while open only a few critical requests are admitted"""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, window: float = BREAKER_WINDOW_SECONDS,
+                 open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.failures = failures
+        self.window = window
+        self.open_seconds = open_seconds
+        self.recent = []  # monotonic times of recent failures
+        self.open_until = 0.0
+
+    def record_failure(self) -> bool:
+        """Returns True when this failure opened the breaker"""
+        now = time.monotonic()
+        self.recent = [at for at in self.recent if now - at < self.window]
+        self.recent.append(now)
+        if len(self.recent) >= self.failures or self.is_open():
+            # Failures while open (from probes) keep it open
+            opened = not self.is_open()
+            self.open_until = now + self.open_seconds
+            self.recent.clear()
+            return opened
+        return False
+
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    def seconds_left(self) -> float:
+        return max(0.0, self.open_until - time.monotonic())
+
+# Only touched from the event loop thread
+limiter = GradientLimit()
+breaker = CircuitBreaker()
+_state = {"in_flight": 0}
+_routes = RouteTable(ROUTE_PRIORITIES)
+
+def route_priority(method: str, path: str):
+    """Priority of a request, or None when it isn't limited"""
+    if path in EXEMPT_PATHS or path.endswith("/health"):
+        return None
+    matched = _routes.match(method, path)
+    return matched[1] if matched else "normal"
+
+def admit(priority: str):
+    """None when admitted, else the reason the request is shed"""
+    in_flight = _state["in_flight"]
+    if breaker.is_open():
+        # Probe with a trickle of critical requests until the breaker resets
+        if priority == "critical" and in_flight < limiter.minimum:
+            return None
+        return "circuit_open"
+    if in_flight < limiter.limit * PRIORITY_SHARES.get(priority, PRIORITY_SHARES["normal"]):
+        return None
+    return "limit"
+
+def record_pool_timeout():
+    """A request found no free pooled connection within DB_POOL_TIMEOUT_SECONDS"""
+    POOL_TIMEOUTS.inc()
+    limiter.back_off()
+    if breaker.record_failure():
+        # Start over from the minimum once the breaker resets
+        limiter.limit = float(limiter.minimum)
+    CONCURRENCY_LIMIT.set(limiter.limit)
+
+def load_shedding_stats() -> dict:
+    return {
+        "enabled": LOAD_SHEDDING,
+        "limit": round(limiter.limit, 1),
+        "in_flight": _state["in_flight"],
+        "circuit_open": breaker.is_open(),
+        "latency_ms": round(limiter.short_latency * 1000, 1) if limiter.short_latency else None,
+        "baseline_latency_ms": round(limiter.long_latency * 1000, 1) if limiter.long_latency else None,
+    }
+
+def _unavailable_body() -> bytes:
+    return json.dumps({"detail": "Service is busy, please retry shortly"}).encode()
+
+def _retry_after() -> str:
+    return str(max(1, math.ceil(breaker.seconds_left())))
+
+async def pool_timeout_handler(request, exc):
+    """Exception handler for pool checkout timeouts: 503 instead of 500, and back off"""
+    record_pool_timeout()
+    return Response(_unavailable_body(), status_code=503, media_type="application/json",
+                    headers={"Retry-After": _retry_after()})
+
+class LoadSheddingMiddleware:
+    """ASGI middleware answering 503 with Retry-After when a request would exceed its share of the limit"""
+
+    def __init__(self, app):
+        self.app = app
+        CONCURRENCY_LIMIT.set(limiter.limit)
+
+    async def __call__(self, scope, receive, send):
+        priority = route_priority(scope["method"], scope["path"]) if LOAD_SHEDDING and scope["type"] == "http" else None
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = admit(priority)
+        if reason is not None:
+            LOAD_SHED.labels(priority, reason).inc()
+            body = _unavailable_body()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", _retry_after().encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        _state["in_flight"] += 1
+        in_flight = _state["in_flight"]
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _state["in_flight"] -= 1
+            limiter.sample(time.perf_counter() - started, in_flight)
+            CONCURRENCY_LIMIT.set(limiter.limit)
@@ -1,20 +1,59 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base
-from models import User, Course, CourseVideo, CourseStatus, Progress, Attendance  # Import models to ensure tables are created
+from database import Base, all_engines, replica_status
+from cache import cache_stats, start_invalidation_relay
+from metrics import MetricsMiddleware, render_metrics
+from compression import CompressionMiddleware
+from rate_limit import RateLimitMiddleware
+from idempotency import IdempotencyMiddleware, start_idempotency_purger
+from load_shedding import LoadSheddingMiddleware, load_shedding_stats, pool_timeout_handler
+from tenancy import TenantMiddleware, ensure_tenant_columns
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from models import User, Course, CourseVideo, CourseStatus, Progress, Attendance, IdempotencyKey, ProgressEvent, ProjectionCheckpoint  # Import models to ensure tables are created
 from auth_service import router as auth_router
-from course_service import router as course_router
-from video_service import router as video_router
+from course_service import router as course_router, ensure_course_counters, start_counter_reconciler
+from video_service import router as video_router, shorten_video_links
 from attendance_service import router as progress_router, attendance_router
+from analytics_service import router as analytics_router
+from profiling_service import router as profiling_router, ProfilingMiddleware
+from search_service import router as search_router, ensure_search_index
+from attendance_feed import start_listener
+from progress_pipeline import start_aggregator
+from partitions import create_partitioned_tables, migrate_interval_columns, ensure_progress_columns, ensure_progress_unique, ensure_partitions, start_partition_maintainer
 import os
-# Create tables
-Base.metadata.create_all(bind=engine)
+# The primary and every dedicated tenant database get the same schema
+for bind in all_engines():
+    # tenant_id columns and per-tenant indexes on databases that predate tenants
+    ensure_tenant_columns(bind)
+    # Create tables (progress and attendance are range-partitioned by month on PostgreSQL)
+    create_partitioned_tables(bind)
+    # Watch time used to be stored as INTERVAL; it is integer seconds now
+    migrate_interval_columns(bind)
+    Base.metadata.create_all(bind=bind)
+    # Segment and credit-clock columns on progress tables that predate them
+    ensure_progress_columns(bind)
+    # One progress row per (user, video, day) on tables created before the constraint
+    ensure_progress_unique(bind)
+    ensure_partitions(bind)
+    # Video links imported before only YouTube ids were stored
+    shorten_video_links(bind)
+    ensure_search_index(bind)
+    # Course counter columns (added to older databases) and a reconciliation pass
+    ensure_course_counters(bind)
 
 app = FastAPI(title="EduTrack API Gateway", version="1.0.0")
 
 # CORS middleware
 # Allow both local development and production frontend URLs
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
+# Innermost, so stored responses are the uncompressed handler output
+app.add_middleware(IdempotencyMiddleware)
+# Added before CORS so it runs inside it and 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
+# Outside idempotency (its key claim uses the database), inside CORS so 503 responses carry CORS headers
+app.add_middleware(LoadSheddingMiddleware)
+# Resolves each request's tenant (school) before anything touches the database; inside CORS so 400s carry CORS headers
+app.add_middleware(TenantMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -26,13 +65,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=600,  # Let browsers cache preflight responses instead of preflighting every heartbeat
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+# No pooled connection became free in time: 503 with Retry-After, and the limiter backs off
+app.add_exception_handler(PoolTimeoutError, pool_timeout_handler)
 # Include service routers
 app.include_router(auth_router)
 app.include_router(course_router)
 app.include_router(video_router)
 app.include_router(progress_router)
 app.include_router(attendance_router)  # Backward compatibility for /attendance/* routes
+app.include_router(analytics_router)
+app.include_router(profiling_router)
+app.include_router(search_router)
+
+@app.on_event("startup")
+def start_background_listeners():
+    # Receive attendance status changes from other instances for the live admin feed
+    start_listener()
+    # Keep per-process caches consistent with writes handled by other workers/instances
+    start_invalidation_relay()
+    # Correct course counters that drifted (e.g. rows changed outside the API)
+    start_counter_reconciler()
+    # Keep monthly partitions ahead of the calendar in long-running processes
+    start_partition_maintainer()
+    # Delete expired Idempotency-Key rows off the request path
+    start_idempotency_purger()
+    # Apply progress events to progress/attendance (outbox mode only)
+    start_aggregator()
 
 @app.get("/")
 def read_root():
@@ -43,16 +106,28 @@ def read_root():
             "courses": "/courses",
             "videos": "/videos",
             "progress": "/progress",
-            "attendance": "/attendance (also available at /progress/attendance)"
+            "attendance": "/attendance (also available at /progress/attendance)",
+            "analytics": "/analytics",
+            "profiling": "/profiling",
+            "search": "/search?q="
         },
         "health": {
             "auth": "/auth/health",
             "courses": "/courses/health",
             "videos": "/videos/health",
-            "progress": "/progress/health"
+            "progress": "/progress/health",
+            "analytics": "/analytics/health",
+            "profiling": "/profiling/health",
+            "search": "/search/health"
         }
     }
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "gateway": "running"}
+    return {"status": "healthy", "gateway": "running", "read_replica": replica_status(), "cache": cache_stats(), "load_shedding": load_shedding_stats()}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,156 @@
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from database import engine, replica_engine, tenant_engines
+import os
+import time
+
+# Prometheus metrics for the API: per-route request counts and latency, in-flight
+# requests, database queries per request (from engine cursor events), connection
+# pool usage and the slow external work (password hashing, playlist extraction).
+# Everything is recorded in-process and rendered only when /metrics is scraped.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+REQUESTS = Counter(
+    "edutrack_http_requests_total", "HTTP requests", ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "edutrack_http_request_duration_seconds", "HTTP request latency", ["method", "route"], buckets=LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "edutrack_http_requests_in_flight", "HTTP requests being handled", multiprocess_mode="livesum"
+)
+REQUEST_QUERIES = Histogram(
+    "edutrack_db_queries_per_request", "Database queries issued per HTTP request", ["route"], buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    "edutrack_db_seconds_per_request", "Time spent in database queries per HTTP request", ["route"], buckets=LATENCY_BUCKETS
+)
+DB_QUERIES = Counter(
+    "edutrack_db_queries_total", "Database queries", ["database"]
+)
+DB_QUERY_SECONDS = Counter(
+    "edutrack_db_query_seconds_total", "Time spent in database queries", ["database"]
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "edutrack_password_hash_seconds", "bcrypt hashing/verification time", ["operation"], buckets=LATENCY_BUCKETS
+)
+PLAYLIST_EXTRACT_SECONDS = Histogram(
+    "edutrack_playlist_extract_seconds", "yt_dlp playlist extraction time", ["outcome"], buckets=LATENCY_BUCKETS
+)
+
+# Per-request database counters, set by the middleware and filled in by the cursor events
+# (the dict is shared with threadpool workers, which run with a copy of the request context)
+request_db_stats: ContextVar = ContextVar("request_db_stats", default=None)
+
+def _track_queries(bind, database: str):
+    queries = DB_QUERIES.labels(database)
+    query_seconds = DB_QUERY_SECONDS.labels(database)
+
+    @event.listens_for(bind, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(bind, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        queries.inc()
+        query_seconds.inc(elapsed)
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats["queries"] += 1
+            stats["seconds"] += elapsed
+
+_track_queries(engine, "primary")
+if replica_engine is not None:
+    _track_queries(replica_engine, "replica")
+for _tenant, _bind in tenant_engines.items():
+    _track_queries(_bind, f"tenant:{_tenant}")
+
+class PoolCollector:
+    """Connection pool usage, read at scrape time"""
+
+    def collect(self):
+        metrics = {
+            "size": GaugeMetricFamily("edutrack_db_pool_size", "Configured pool size", labels=["database"]),
+            "checkedout": GaugeMetricFamily("edutrack_db_pool_checked_out", "Connections in use", labels=["database"]),
+            "checkedin": GaugeMetricFamily("edutrack_db_pool_checked_in", "Idle connections in the pool", labels=["database"]),
+            "overflow": GaugeMetricFamily("edutrack_db_pool_overflow", "Connections opened beyond the pool size", labels=["database"]),
+        }
+        binds = [("primary", engine), ("replica", replica_engine)]
+        binds += [(f"tenant:{tenant}", bind) for tenant, bind in tenant_engines.items()]
+        for database, bind in binds:
+            if bind is None:
+                continue
+            for attribute, metric in metrics.items():
+                # Not every pool class (e.g. SQLite's) reports every figure
+                reader = getattr(bind.pool, attribute, None)
+                if reader is not None:
+                    metric.add_metric([database], reader())
+        return list(metrics.values())
+
+REGISTRY.register(PoolCollector())
+
+class Timer:
+    """Context manager observing the elapsed time on a histogram child"""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+class MetricsMiddleware:
+    """ASGI middleware recording request count, latency and database usage per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = {"queries": 0, "seconds": 0.0}
+        token = request_db_stats.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            request_db_stats.reset(token)
+            # Label by route template so path parameters don't create new series
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            REQUESTS.labels(method, route_label, str(status_code)).inc()
+            REQUEST_LATENCY.labels(method, route_label).observe(time.perf_counter() - started)
+            REQUEST_QUERIES.labels(route_label).observe(stats["queries"])
+            REQUEST_DB_SECONDS.labels(route_label).observe(stats["seconds"])
+
+def render_metrics() -> tuple:
+    """Exposition body and content type (aggregated across workers when PROMETHEUS_MULTIPROC_DIR is set)"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(PoolCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,14 +1,21 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Date, Time, Interval
+from sqlalchemy import Column, Integer, SmallInteger, BigInteger, String, DateTime, Boolean, Text, Date, Time, Float, UniqueConstraint, LargeBinary, Index
 from sqlalchemy.sql import func
-from database import Base
+from database import Base, DEFAULT_TENANT
 
 class User(Base):
     __tablename__ = "user"
+    __table_args__ = (
+        # Email and user name are unique within a tenant (school)
+        Index("uq_user_tenant_email", "tenant_id", "email", unique=True),
+        Index("uq_user_tenant_user_name", "tenant_id", "user_name", unique=True),
+        Index("idx_user_tenant_role", "tenant_id", "role"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
     name = Column(String(255), nullable=False)
-    email = Column(String(255), unique=True, nullable=False, index=True)
-    user_name = Column(String(100), unique=True, nullable=False, index=True)
+    email = Column(String(255), nullable=False)
+    user_name = Column(String(100), nullable=False)
     password = Column(String(255), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     role = Column(String(50), default='student')
@@ -17,8 +24,13 @@ class Course(Base):
     __tablename__ = "course"
     
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT, index=True)
     course_title = Column(String(255), nullable=False)
     link = Column(Text)
+    # Denormalized counters, kept current by import/registration and reconciled periodically
+    video_count = Column(Integer, nullable=False, default=0, server_default="0")
+    enrolled_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total_duration_seconds = Column(Integer, nullable=False, default=0, server_default="0")
 
 class CourseVideo(Base):
     __tablename__ = "course_video"
@@ -26,12 +38,14 @@ class CourseVideo(Base):
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, nullable=False, index=True)
     title = Column(String(255), nullable=False)
-    video_link = Column(Text)
+    video_link = Column(Text)  # YouTube video id; responses rebuild the watch URL
+    duration_seconds = Column(Integer, nullable=True)  # From the playlist metadata; NULL when YouTube didn't report it
 
 class CourseStatus(Base):
     __tablename__ = "course_status"
     
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT, index=True)
     user_id = Column(Integer, nullable=False, index=True)
     course_id = Column(Integer, nullable=False, index=True)  # Changed from course_ID to course_id
     enrolled = Column(Boolean, default=False)
@@ -39,20 +53,88 @@ class CourseStatus(Base):
 
 class Progress(Base):
     __tablename__ = "progress"
+    __table_args__ = (
+        # One record per user, video and day; heartbeats merge into it
+        UniqueConstraint("user_id", "video_id", "date", name="unique_progress_user_video_date"),
+        Index("idx_progress_tenant_date", "tenant_id", "date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
     user_id = Column(Integer, nullable=False, index=True)
     video_id = Column(Integer, nullable=False, index=True)
     date = Column(Date, nullable=False, index=True)
     start_time = Column(Time, nullable=True)
     end_time = Column(Time, nullable=True)
-    watch_time = Column(Interval, nullable=True)
+    watch_seconds = Column(Integer, nullable=False, default=0, server_default="0")  # Responses format it as watch_time HH:MM:SS
+    watched_intervals = Column(Text, nullable=True)  # JSON [[start, end], ...] of watched video seconds
+    credited_until = Column(DateTime(timezone=True), nullable=True)  # Server time watch credit has reached; heartbeats can't outrun it
+    delta_seconds = Column(Integer, nullable=True)  # Watch time credited by heartbeats without a segment; added to the segment union
 
 class Attendance(Base):
     __tablename__ = "attendance"
+    __table_args__ = (
+        Index("idx_attendance_tenant_date", "tenant_id", "date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
     user_id = Column(Integer, nullable=False, index=True)
     date = Column(Date, nullable=False, index=True)
-    total_time = Column(Interval, nullable=True)
-    status = Column(String(50), nullable=True)
\ No newline at end of file
+    total_seconds = Column(Integer, nullable=False, default=0, server_default="0")  # Sum of the day's watch_seconds
+    status = Column(String(50), nullable=True)
+
+class AttendanceStreak(Base):
+    __tablename__ = "attendance_streak"
+    
+    user_id = Column(Integer, primary_key=True)
+    current_streak = Column(Integer, nullable=False, default=0)  # Consecutive present days ending at last_present_date
+    longest_streak = Column(Integer, nullable=False, default=0)
+    last_present_date = Column(Date, nullable=True)
+    total_present_days = Column(Integer, nullable=False, default=0)
+
+class AttendanceHistory(Base):
+    __tablename__ = "attendance_history"
+    
+    user_id = Column(Integer, primary_key=True)
+    year = Column(Integer, primary_key=True)
+    present_bitmap = Column(LargeBinary, nullable=False)  # Bit (day_of_year - 1) set when present
+    present_days = Column(Integer, nullable=False, default=0)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_key"
+    
+    key = Column(LargeBinary(16), primary_key=True)  # Hash of user, route and Idempotency-Key header
+    request_hash = Column(LargeBinary(16), nullable=False)  # Hash of the request body
+    status_code = Column(SmallInteger, nullable=True)  # NULL while the first request is still running
+    content_type = Column(String(100), nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class ProgressEvent(Base):
+    __tablename__ = "progress_event"
+    __table_args__ = (
+        # Consumption order of the aggregator
+        Index("idx_progress_event_txid_id", "txid", "id"),
+    )
+    
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    txid = Column(BigInteger, nullable=False, default=0)  # Writing transaction on PostgreSQL (0 elsewhere)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+    user_id = Column(Integer, nullable=False)
+    video_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    start_time = Column(Time, nullable=True)
+    end_time = Column(Time, nullable=True)
+    watch_seconds = Column(Integer, nullable=True)  # Legacy watch-time delta
+    position_start = Column(Float, nullable=True)  # Watched segment in video seconds
+    position_end = Column(Float, nullable=True)
+    recorded_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ProjectionCheckpoint(Base):
+    __tablename__ = "projection_checkpoint"
+    
+    name = Column(String(50), primary_key=True)
+    txid = Column(BigInteger, nullable=False, default=0)  # Last applied event, in (txid, id) order
+    event_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,379 @@
+from datetime import date
+from sqlalchemy import inspect, text
+from database import engine, all_engines
+import argparse
+import gzip
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Monthly range partitioning of the time-series tables (PostgreSQL only).
+# progress and attendance are partitioned by `date`, partitions are created ahead
+# of time and old partitions can be detached, exported to gzip and dropped. A DEFAULT
+# partition catches rows no monthly partition covers yet, and each API process creates
+# upcoming partitions periodically (rows stranded in DEFAULT move into them).
+
+# Months of partitions kept ready after the current one
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+# How often each API process creates upcoming monthly partitions
+PARTITION_MAINTENANCE_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_SECONDS", "86400"))
+
+PARTITIONED_TABLES = {
+    "progress": {
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS progress (
+                id SERIAL,
+                tenant_id VARCHAR(50) NOT NULL DEFAULT 'default',
+                user_id INTEGER NOT NULL,
+                video_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                start_time TIME,
+                end_time TIME,
+                watch_seconds INTEGER NOT NULL DEFAULT 0,
+                watched_intervals TEXT,
+                credited_until TIMESTAMPTZ,
+                delta_seconds INTEGER,
+                PRIMARY KEY (id, date),
+                CONSTRAINT unique_progress_user_video_date UNIQUE (user_id, video_id, date)
+            ) PARTITION BY RANGE (date)
+        """,
+        "indexes": [
+            "CREATE INDEX IF NOT EXISTS idx_progress_user_id ON progress(user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_progress_video_id ON progress(video_id)",
+            "CREATE INDEX IF NOT EXISTS idx_progress_date ON progress(date)",
+            "CREATE INDEX IF NOT EXISTS idx_progress_tenant_date ON progress(tenant_id, date)",
+        ],
+        "columns": ["id", "tenant_id", "user_id", "video_id", "date", "start_time", "end_time", "watch_seconds", "watched_intervals", "credited_until", "delta_seconds"],
+    },
+    "attendance": {
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS attendance (
+                id SERIAL,
+                tenant_id VARCHAR(50) NOT NULL DEFAULT 'default',
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                total_seconds INTEGER NOT NULL DEFAULT 0,
+                status VARCHAR(50),
+                PRIMARY KEY (id, date)
+            ) PARTITION BY RANGE (date)
+        """,
+        "indexes": [
+            "CREATE INDEX IF NOT EXISTS idx_attendance_user_id ON attendance(user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)",
+            "CREATE INDEX IF NOT EXISTS idx_attendance_tenant_date ON attendance(tenant_id, date)",
+        ],
+        "columns": ["id", "tenant_id", "user_id", "date", "total_seconds", "status"],
+    },
+}
+
+# Serializes partition DDL across instances starting at the same time
+ADVISORY_LOCK_ID = 7_202_030
+
+def is_postgres(bind=engine) -> bool:
+    return bind.dialect.name == "postgresql"
+
+def add_months(day: date, months: int) -> date:
+    """First day of the month `months` after the month containing `day`"""
+    month_index = day.year * 12 + (day.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_name(table: str, month_start: date) -> str:
+    return f"{table}_{month_start.year:04d}_{month_start.month:02d}"
+
+def is_partitioned(connection, table: str) -> bool:
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = :table AND relnamespace = 'public'::regnamespace"),
+        {"table": table}
+    ).scalar()
+    return relkind == "p"
+
+def list_partitions(connection, table: str) -> list:
+    """Monthly partitions of a table as (name, month_start), oldest first"""
+    names = connection.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+    """), {"table": table}).scalars().all()
+    partitions = []
+    for name in names:
+        match = re.fullmatch(rf"{table}_(\d{{4}})_(\d{{2}})", name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+def create_default_partition(connection, table: str):
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {default_partition_name(table)} PARTITION OF {table} DEFAULT"))
+
+def create_partition(connection, table: str, month_start: date):
+    """Create a monthly partition, first moving that month's rows out of the DEFAULT partition"""
+    name = partition_name(table, month_start)
+    bounds = f"FOR VALUES FROM ('{month_start.isoformat()}') TO ('{add_months(month_start, 1).isoformat()}')"
+    default = default_partition_name(table)
+    in_month = {"start": month_start, "end": add_months(month_start, 1)}
+    stranded = connection.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": default}).scalar() and connection.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE date >= :start AND date < :end)"), in_month
+    ).scalar()
+    if not stranded:
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} {bounds}"))
+        return
+    # A partition can't be added while DEFAULT holds rows in its range, so fill it first and attach it
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE date >= :start AND date < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), in_month)
+    connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} {bounds}"))
+
+def create_partitioned_tables(bind=engine):
+    """Create progress and attendance as partitioned tables if they don't exist yet (before create_all)"""
+    if not is_postgres(bind):
+        return
+    with bind.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        for table, spec in PARTITIONED_TABLES.items():
+            connection.execute(text(spec["ddl"]))
+            if is_partitioned(connection, table):
+                for index in spec["indexes"]:
+                    connection.execute(text(index))
+                create_default_partition(connection, table)
+
+def ensure_partitions(bind=engine, months_ahead: int = PARTITION_MONTHS_AHEAD, start: date = None):
+    """Create monthly partitions from `start` (default: this month) through `months_ahead` months ahead (and DEFAULT)"""
+    if not is_postgres(bind):
+        return []
+    first_month = add_months(start or date.today(), 0)
+    created = []
+    with bind.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(connection, table):
+                continue
+            create_default_partition(connection, table)
+            existing = {name for name, _ in list_partitions(connection, table)}
+            for offset in range(months_ahead + 1):
+                month_start = add_months(first_month, offset)
+                if partition_name(table, month_start) not in existing:
+                    create_partition(connection, table, month_start)
+                    created.append(partition_name(table, month_start))
+    return created
+
+def _maintain_partitions_forever():
+    while True:
+        time.sleep(PARTITION_MAINTENANCE_SECONDS)
+        for bind in all_engines():
+            try:
+                created = ensure_partitions(bind)
+                if created:
+                    logger.info("Created partitions %s", ", ".join(created))
+            except Exception:
+                logger.exception("Partition maintenance failed")
+
+def start_partition_maintainer():
+    """Create upcoming partitions every PARTITION_MAINTENANCE_SECONDS in a daemon thread (PostgreSQL only)"""
+    if any(is_postgres(bind) for bind in all_engines()):
+        threading.Thread(target=_maintain_partitions_forever, name="partition-maintainer", daemon=True).start()
+
+# Watch-time columns older databases store as INTERVAL: table -> (old column, integer seconds column)
+INTERVAL_COLUMNS = {"progress": ("watch_time", "watch_seconds"), "attendance": ("total_time", "total_seconds")}
+
+def migrate_interval_columns(bind=engine) -> list:
+    """Convert INTERVAL watch-time columns to integer seconds in place (before create_all and migrate_to_partitioned)"""
+    if not is_postgres(bind):
+        return []
+    migrated = []
+    with bind.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        for table, (old, new) in INTERVAL_COLUMNS.items():
+            data_type = connection.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_schema = 'public' AND table_name = :table AND column_name = :column"
+            ), {"table": table, "column": old}).scalar()
+            if data_type != "interval":
+                continue
+            # On a partitioned table this rewrites every partition
+            connection.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {old} TYPE INTEGER USING COALESCE(ROUND(EXTRACT(EPOCH FROM {old})), 0)::integer"
+            ))
+            connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {old} SET DEFAULT 0, ALTER COLUMN {old} SET NOT NULL"))
+            connection.execute(text(f"ALTER TABLE {table} RENAME COLUMN {old} TO {new}"))
+            migrated.append(f"{table}.{old} -> {new}")
+    return migrated
+
+# Progress columns added after the table was first created: column -> type (PostgreSQL, SQLite)
+PROGRESS_COLUMNS = {"watched_intervals": ("TEXT", "TEXT"), "credited_until": ("TIMESTAMPTZ", "DATETIME"), "delta_seconds": ("INTEGER", "INTEGER")}
+
+def ensure_progress_columns(bind=engine) -> list:
+    """Add progress columns missing from older databases (after create_all; partitions inherit them)"""
+    with bind.begin() as connection:
+        if is_postgres(bind):
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        existing = {column["name"] for column in inspect(connection).get_columns("progress")}
+        added = [column for column in PROGRESS_COLUMNS if column not in existing]
+        for column in added:
+            column_type = PROGRESS_COLUMNS[column][0 if is_postgres(bind) else 1]
+            connection.execute(text(f"ALTER TABLE progress ADD COLUMN {column} {column_type}"))
+    return added
+
+def merge_duplicate_progress(connection, table: str = "progress") -> int:
+    """Fold rows sharing (user_id, video_id, date) into the lowest id, summing their watch time.
+
+    Tables created before the unique constraint could get two rows from concurrent first
+    heartbeats. Returns the number of rows removed.
+    """
+    columns = {column["name"] for column in inspect(connection).get_columns(table)}
+    same_key = f"p.user_id = {table}.user_id AND p.video_id = {table}.video_id AND p.date = {table}.date"
+    assignments = [
+        f"watch_seconds = (SELECT SUM(p.watch_seconds) FROM {table} p WHERE {same_key})",
+        f"start_time = (SELECT MIN(p.start_time) FROM {table} p WHERE {same_key})",
+        f"end_time = (SELECT MAX(p.end_time) FROM {table} p WHERE {same_key})",
+    ]
+    if "delta_seconds" in columns:
+        # Re-derived from watch_seconds minus the kept row's segments on the next heartbeat
+        assignments.append("delta_seconds = NULL")
+    connection.execute(text(
+        f"UPDATE {table} SET {', '.join(assignments)} WHERE id IN "
+        f"(SELECT MIN(id) FROM {table} GROUP BY user_id, video_id, date HAVING COUNT(*) > 1)"
+    ))
+    return connection.execute(text(
+        f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY user_id, video_id, date)"
+    )).rowcount
+
+def ensure_progress_unique(bind=engine) -> int:
+    """Add the (user_id, video_id, date) unique constraint to progress tables that predate it.
+
+    Duplicates are merged first; save_progress relies on the constraint to detect a concurrent
+    insert. Returns the number of duplicate rows merged.
+    """
+    with bind.begin() as connection:
+        if is_postgres(bind):
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+            if is_partitioned(connection, "progress"):
+                return 0
+        inspector = inspect(connection)
+        existing = {constraint["name"] for constraint in inspector.get_unique_constraints("progress")}
+        existing |= {index["name"] for index in inspector.get_indexes("progress") if index["unique"]}
+        if "unique_progress_user_video_date" in existing:
+            return 0
+        merged = merge_duplicate_progress(connection)
+        if is_postgres(bind):
+            connection.execute(text("ALTER TABLE progress ADD CONSTRAINT unique_progress_user_video_date UNIQUE (user_id, video_id, date)"))
+        else:
+            connection.execute(text("CREATE UNIQUE INDEX unique_progress_user_video_date ON progress (user_id, video_id, date)"))
+    return merged
+
+def migrate_to_partitioned(bind=engine):
+    """Convert existing (unpartitioned) progress/attendance tables into partitioned ones, copying all rows"""
+    migrated = []
+    with bind.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        for table, spec in PARTITIONED_TABLES.items():
+            if is_partitioned(connection, table):
+                continue
+            legacy = f"{table}_legacy"
+            connection.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+            connection.execute(text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {legacy}_id_seq"))
+            connection.execute(text(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {legacy}_pkey"))
+            # Constraint and index names must be free for the new table; the legacy table's
+            # other indexes go with it once the rows are copied
+            connection.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT IF EXISTS unique_progress_user_video_date"))
+            for index in connection.execute(text("""
+                SELECT indexname FROM pg_indexes
+                WHERE schemaname = 'public' AND tablename = :legacy
+                  AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = CAST(:legacy AS regclass))
+            """), {"legacy": legacy}).scalars():
+                connection.execute(text(f'DROP INDEX IF EXISTS "{index}"'))
+            connection.execute(text(spec["ddl"]))
+            for index in spec["indexes"]:
+                connection.execute(text(index))
+            create_default_partition(connection, table)
+
+            first_day = connection.execute(text(f"SELECT MIN(date) FROM {legacy}")).scalar() or date.today()
+            month_start = add_months(first_day, 0)
+            last_month = add_months(date.today(), PARTITION_MONTHS_AHEAD)
+            max_day = connection.execute(text(f"SELECT MAX(date) FROM {legacy}")).scalar()
+            if max_day and add_months(max_day, 0) > last_month:
+                last_month = add_months(max_day, 0)
+            while month_start <= last_month:
+                create_partition(connection, table, month_start)
+                month_start = add_months(month_start, 1)
+
+            # Older databases may predate some columns
+            legacy_columns = set(connection.execute(text(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = :table"
+            ), {"table": legacy}).scalars().all())
+            columns = ", ".join(column for column in spec["columns"] if column in legacy_columns)
+            if table == "progress":
+                # The new table is unique on (user_id, video_id, date); the legacy one may not be
+                merge_duplicate_progress(connection, legacy)
+            connection.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}"))
+            connection.execute(text(
+                f"SELECT setval('{table}_id_seq', COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+            ))
+            connection.execute(text(f"DROP TABLE {legacy}"))
+            migrated.append(table)
+    return migrated
+
+def archive_partitions(keep_months: int, archive_dir: str, bind=engine) -> list:
+    """Export partitions older than `keep_months` full months to gzip CSV, then detach and drop them"""
+    cutoff = add_months(date.today(), -keep_months)
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    for table in PARTITIONED_TABLES:
+        with bind.connect() as connection:
+            partitions = list_partitions(connection, table) if is_partitioned(connection, table) else []
+        for name, month_start in partitions:
+            if add_months(month_start, 1) > cutoff:
+                continue
+            started = time.monotonic()
+            path = os.path.join(archive_dir, f"{name}.csv.gz")
+            # One transaction: the partition stays attached (and its rows queryable) unless the
+            # export succeeded. SHARE mode blocks writes to it while it is being exported.
+            raw = bind.raw_connection()
+            try:
+                cursor = raw.cursor()
+                cursor.execute(f"LOCK TABLE {name} IN SHARE MODE")
+                with gzip.open(path, "wb") as archive:
+                    cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)", archive)
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                cursor.execute(f"DROP TABLE {name}")
+                raw.commit()
+            except Exception:
+                raw.rollback()
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+            finally:
+                raw.close()
+            archived.append({"partition": name, "file": path, "seconds": round(time.monotonic() - started, 2)})
+    return archived
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of progress and attendance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = commands.add_parser("ensure", help="Create upcoming monthly partitions")
+    ensure_parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    commands.add_parser("migrate", help="Convert existing unpartitioned tables to partitioned tables")
+    archive_parser = commands.add_parser("archive", help="Detach, export and drop old partitions")
+    archive_parser.add_argument("--keep-months", type=int, required=True)
+    archive_parser.add_argument("--archive-dir", required=True)
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        print(f"Created partitions: {ensure_partitions(months_ahead=args.months_ahead) or 'none'}")
+    elif args.command == "migrate":
+        print(f"Converted columns: {migrate_interval_columns() or 'none'}")
+        print(f"Migrated tables: {migrate_to_partitioned() or 'none'}")
+        print(f"Created partitions: {ensure_partitions() or 'none'}")
+    elif args.command == "archive":
+        for entry in archive_partitions(args.keep_months, args.archive_dir):
+            print(f"Archived {entry['partition']} to {entry['file']} in {entry['seconds']}s")
@@ -0,0 +1,234 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from typing import Optional
+from datetime import timedelta
+from collections import Counter
+from models import User
+from dependencies import get_current_user
+from auth import create_access_token, verify_token
+import os
+import random
+import sys
+import threading
+import time
+
+router = APIRouter(prefix="/profiling", tags=["Profiling"])
+
+# On-demand sampling profiler (admin only).
+# While enabled, a fraction of requests (and requests carrying an X-Profile token
+# issued by an admin) are profiled: a background thread samples the stacks of the
+# threads running their handlers every few milliseconds and aggregates collapsed
+# stacks per route, downloadable as flamegraph input. When disabled the middleware
+# is a single flag check and no sampler thread runs. State is per process.
+
+# Initial sampling fraction (0 = disabled until an admin enables it)
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+
+# Time between stack samples while profiled requests are running
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+
+# Distinct stacks kept per route; further new stacks are counted under "[truncated]"
+MAX_STACKS_PER_ROUTE = 5000
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_TOKEN_MINUTES = 15
+
+_config = {
+    "enabled": PROFILING_SAMPLE_RATE > 0,
+    "sample_rate": PROFILING_SAMPLE_RATE,
+    "interval_ms": PROFILING_INTERVAL_MS,
+}
+_lock = threading.Lock()
+_active = {}         # request id -> scope of profiled requests in flight
+_stacks = {}         # route -> Counter of collapsed stacks
+_requests = Counter()  # route -> profiled requests
+_sampler = {"thread": None}
+
+class ProfilingConfig(BaseModel):
+    enabled: bool
+    sample_rate: float = 0.0
+    interval_ms: Optional[float] = None
+
+def _route_label(scope) -> Optional[str]:
+    route = scope.get("route")
+    return f"{scope['method']} {route.path}" if route is not None else None
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def _sample_once(sampler_ident: int):
+    with _lock:
+        scopes = list(_active.values())
+    # Threadpool workers run the endpoint function itself; the event loop thread runs the
+    # middleware chain (routing, validation, serialization) with this request's scope
+    endpoint_routes = {}
+    for scope in scopes:
+        route = scope.get("route")
+        if route is not None:
+            endpoint_routes[route.endpoint.__code__] = _route_label(scope)
+
+    for ident, frame in sys._current_frames().items():
+        if ident == sampler_ident:
+            continue
+        names = []
+        label = None
+        while frame is not None:
+            code = frame.f_code
+            names.append(_frame_name(code))
+            if label is None:
+                if code in endpoint_routes:
+                    label = endpoint_routes[code]
+                elif code is ProfilingMiddleware.__call__.__code__:
+                    scope = frame.f_locals.get("scope")
+                    label = _route_label(scope) if scope is not None and scope.get("profiled") else None
+            frame = frame.f_back
+        if label is None:
+            continue
+        stack = ";".join(reversed(names))
+        with _lock:
+            stacks = _stacks.setdefault(label, Counter())
+            if stack in stacks or len(stacks) < MAX_STACKS_PER_ROUTE:
+                stacks[stack] += 1
+            else:
+                stacks["[truncated]"] += 1
+
+def _sample_forever():
+    ident = threading.get_ident()
+    while True:
+        with _lock:
+            if not _active:
+                _sampler["thread"] = None
+                return
+        _sample_once(ident)
+        time.sleep(_config["interval_ms"] / 1000)
+
+def _start(request_id: int, scope):
+    with _lock:
+        _active[request_id] = scope
+        if _sampler["thread"] is None:
+            _sampler["thread"] = threading.Thread(target=_sample_forever, name="profiling-sampler", daemon=True)
+            _sampler["thread"].start()
+
+def _stop(request_id: int, scope):
+    with _lock:
+        _active.pop(request_id, None)
+        label = _route_label(scope)
+        if label is not None:
+            _requests[label] += 1
+
+def _has_profile_token(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER:
+            payload = verify_token(value.decode("latin-1"))
+            return bool(payload) and payload.get("scope") == "profile"
+    return False
+
+class ProfilingMiddleware:
+    """Selects requests for profiling; passes everything straight through while profiling is disabled"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not _config["enabled"] or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not (random.random() < _config["sample_rate"] or _has_profile_token(scope)):
+            await self.app(scope, receive, send)
+            return
+        scope["profiled"] = True
+        request_id = id(scope)
+        _start(request_id, scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _stop(request_id, scope)
+
+def require_admin(current_user: User):
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+
+@router.get("/status")
+def get_profiling_status(current_user: User = Depends(get_current_user)):
+    """Profiling configuration and sample counts per route (admin only)"""
+    require_admin(current_user)
+    with _lock:
+        routes = {
+            label: {"requests": _requests.get(label, 0), "samples": sum(stacks.values()), "stacks": len(stacks)}
+            for label, stacks in _stacks.items()
+        }
+        return {**_config, "in_flight": len(_active), "routes": routes}
+
+@router.put("/config")
+def update_profiling_config(config: ProfilingConfig, current_user: User = Depends(get_current_user)):
+    """Enable/disable profiling on this instance and set the sampled fraction of requests (admin only)"""
+    require_admin(current_user)
+    if not 0 <= config.sample_rate <= 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="sample_rate must be between 0 and 1"
+        )
+    if config.interval_ms is not None and config.interval_ms < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="interval_ms must be at least 1"
+        )
+    _config["sample_rate"] = config.sample_rate
+    if config.interval_ms is not None:
+        _config["interval_ms"] = config.interval_ms
+    _config["enabled"] = config.enabled
+    return dict(_config)
+
+@router.post("/token")
+def create_profile_token(current_user: User = Depends(get_current_user)):
+    """Token for the X-Profile header: requests carrying it are always profiled while profiling is enabled (admin only)"""
+    require_admin(current_user)
+    # No sub/user_id claims, so the token can't be used to authenticate API calls
+    token = create_access_token(
+        {"scope": "profile", "issued_by": current_user.user_name},
+        expires_delta=timedelta(minutes=PROFILE_TOKEN_MINUTES)
+    )
+    return {"header": "X-Profile", "token": token, "expires_in_minutes": PROFILE_TOKEN_MINUTES}
+
+@router.get("/flamegraph", response_class=PlainTextResponse)
+def download_flamegraph(route: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Aggregated collapsed stacks ("frame;frame;frame count" per line) for flamegraph.pl or speedscope (admin only).
+
+    Without `route` every route is included, with the route as the root frame.
+    """
+    require_admin(current_user)
+    with _lock:
+        if route is not None:
+            if route not in _stacks:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="No samples for this route"
+                )
+            lines = [f"{stack} {count}" for stack, count in _stacks[route].items()]
+        else:
+            lines = [
+                f"{label};{stack} {count}"
+                for label, stacks in _stacks.items()
+                for stack, count in stacks.items()
+            ]
+    return PlainTextResponse(
+        "\n".join(lines) + "\n" if lines else "",
+        headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'}
+    )
+
+@router.delete("/samples")
+def clear_samples(current_user: User = Depends(get_current_user)):
+    """Discard collected samples (admin only)"""
+    require_admin(current_user)
+    with _lock:
+        _stacks.clear()
+        _requests.clear()
+    return {"message": "Profiling samples cleared"}
+
+@router.get("/health")
+def health_check():
+    return {"status": "healthy", "service": "profiling-service"}
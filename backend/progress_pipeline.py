@@ -0,0 +1,401 @@
+from datetime import date, datetime, timezone
+from sqlalchemy import case, func, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from prometheus_client import Counter, Gauge
+from database import SessionLocal, engine, all_engines, tenant_bind
+from models import Progress, Attendance, AttendanceStreak, AttendanceHistory, Course, CourseVideo, ProgressEvent, ProjectionCheckpoint
+from watch_intervals import load_intervals, covered_seconds
+from attendance_service import PROGRESS_WRITE_MODE, apply_heartbeat, observed_since, updated_status, attendance_event, load_day_attendance
+from attendance_feed import broadcast_changes
+from attendance_history import record_present_day
+import argparse
+import logging
+import os
+import threading
+import time
+
+# Aggregator for the progress_event log (PROGRESS_WRITE_MODE=outbox).
+# Heartbeats are appended to progress_event; this consumes them in order, in batches,
+# and maintains the progress and attendance projections, storing its position in
+# projection_checkpoint in the same transaction as the projection changes (so every
+# event is applied exactly once, also across restarts and concurrent aggregators).
+#   python progress_pipeline.py run               # consume continuously
+#   python progress_pipeline.py rebuild [--since 2024-05-01]
+#   python progress_pipeline.py bootstrap         # seed the log from existing progress rows
+#   python progress_pipeline.py status
+# On PostgreSQL events carry their transaction id and are consumed in (txid, id) order
+# only below the oldest running transaction, so an event committed late by a slow
+# transaction is never skipped. SQLite commits writers one at a time, in id order.
+# Every database (the primary and each dedicated tenant database) has its own log and
+# checkpoint; the in-process aggregator drains them in turn and the CLI takes --tenant
+# to pick the database holding that tenant.
+
+CHECKPOINT = "progress"
+
+# Events applied per transaction
+AGGREGATOR_BATCH_SIZE = int(os.getenv("AGGREGATOR_BATCH_SIZE", "5000"))
+
+# Events replayed per step of a rebuild (larger batches load each progress row fewer times)
+AGGREGATOR_REBUILD_BATCH_SIZE = int(os.getenv("AGGREGATOR_REBUILD_BATCH_SIZE", "20000"))
+
+# Idle wait between polls once the log is drained
+AGGREGATOR_POLL_SECONDS = float(os.getenv("AGGREGATOR_POLL_SECONDS", "1"))
+
+# Run the aggregator in a thread of each API process in outbox mode (set to 0 when
+# `progress_pipeline.py run` is deployed as its own process)
+AGGREGATOR_IN_PROCESS = os.getenv("AGGREGATOR_IN_PROCESS", "1") == "1"
+
+EVENTS_APPLIED = Counter(
+    "edutrack_progress_events_applied_total", "Progress events applied to the projections"
+)
+EVENTS_SKIPPED = Counter(
+    "edutrack_progress_events_skipped_total", "Progress events dropped because the video doesn't exist"
+)
+AGGREGATOR_LAG = Gauge(
+    "edutrack_progress_aggregator_lag_seconds", "Age of the newest applied event when its batch was applied",
+    multiprocess_mode="max"
+)
+
+logger = logging.getLogger("progress_pipeline")
+
+EVENT_COLUMNS = (
+    ProgressEvent.txid, ProgressEvent.id, ProgressEvent.tenant_id, ProgressEvent.user_id, ProgressEvent.video_id, ProgressEvent.date,
+    ProgressEvent.start_time, ProgressEvent.end_time, ProgressEvent.watch_seconds,
+    ProgressEvent.position_start, ProgressEvent.position_end, ProgressEvent.recorded_at
+)
+
+def lock_checkpoint(db: Session) -> tuple:
+    """Take the checkpoint row for this transaction and return its (txid, event_id).
+
+    The row is written before it is read, which blocks other aggregators until commit
+    on PostgreSQL (row lock) and SQLite (database write lock) alike.
+    """
+    for _ in range(2):
+        touched = db.execute(
+            update(ProjectionCheckpoint).where(ProjectionCheckpoint.name == CHECKPOINT)
+            .values(updated_at=func.now())
+        )
+        if touched.rowcount:
+            return tuple(db.execute(
+                select(ProjectionCheckpoint.txid, ProjectionCheckpoint.event_id)
+                .where(ProjectionCheckpoint.name == CHECKPOINT)
+            ).one())
+        try:
+            db.execute(insert(ProjectionCheckpoint).values(name=CHECKPOINT, txid=0, event_id=0))
+            return 0, 0
+        except IntegrityError:
+            # Created concurrently; lock that one
+            db.rollback()
+    raise RuntimeError("Could not lock the projection checkpoint")
+
+def save_checkpoint(db: Session, position: tuple):
+    db.execute(
+        update(ProjectionCheckpoint).where(ProjectionCheckpoint.name == CHECKPOINT)
+        .values(txid=position[0], event_id=position[1], updated_at=func.now())
+    )
+
+def read_events(db: Session, after: tuple, limit: int, through: tuple = None, since: date = None) -> list:
+    """Next events after a (txid, id) position, oldest first"""
+    query = select(*EVENT_COLUMNS).where(tuple_(ProgressEvent.txid, ProgressEvent.id) > tuple_(*after))
+    if through is not None:
+        query = query.where(tuple_(ProgressEvent.txid, ProgressEvent.id) <= tuple_(*through))
+    elif db.get_bind().dialect.name == "postgresql":
+        # Transactions below the snapshot's xmin have all finished, so no earlier event can still appear
+        query = query.where(ProgressEvent.txid < func.txid_snapshot_xmin(func.txid_current_snapshot()))
+    if since is not None:
+        query = query.where(ProgressEvent.date >= since)
+    return db.execute(query.order_by(ProgressEvent.txid, ProgressEvent.id).limit(limit)).all()
+
+def apply_events(db: Session, events: list, track_history: bool = True) -> list:
+    """Apply events to progress and attendance (caller commits).
+
+    Returns the attendance status transitions as live-feed events.
+    """
+    video_ids = {event.video_id for event in events}
+    # (video id, tenant id) -> duration: events for another tenant's videos are dropped like unknown ones
+    known_videos = dict(
+        ((video_id, tenant_id), duration_seconds) for video_id, tenant_id, duration_seconds in
+        db.query(CourseVideo.id, Course.tenant_id, CourseVideo.duration_seconds).join(Course, Course.id == CourseVideo.course_id)
+        .filter(CourseVideo.id.in_(video_ids))
+    )
+
+    # Looked up by the indexed user_id and date columns (composite IN lists aren't index-assisted)
+    keys = {
+        (event.user_id, event.video_id, event.date) for event in events
+        if (event.video_id, event.tenant_id) in known_videos
+    }
+    progress_rows = {}
+    if keys:
+        for progress in db.query(Progress).filter(
+            Progress.user_id.in_({key[0] for key in keys}),
+            Progress.date.in_({key[2] for key in keys})
+        ):
+            key = (progress.user_id, progress.video_id, progress.date)
+            if key in keys:
+                progress_rows[key] = progress
+
+    touched_days = set()
+    tenants = {}  # user_id -> tenant_id
+    skipped = 0
+    for event in events:
+        if (event.video_id, event.tenant_id) not in known_videos:
+            skipped += 1
+            continue
+        tenants[event.user_id] = event.tenant_id
+        key = (event.user_id, event.video_id, event.date)
+        progress = progress_rows.get(key)
+        is_new = progress is None
+        if is_new:
+            progress = progress_rows[key] = Progress(
+                tenant_id=event.tenant_id, user_id=event.user_id, video_id=event.video_id, date=event.date
+            )
+            db.add(progress)
+        segments = [(event.position_start, event.position_end)] if event.position_start is not None else None
+        # recorded_at is the server clock of the append (seeded history has none and isn't limited)
+        since = observed_since(event.recorded_at, event.start_time, event.end_time) if segments and event.recorded_at else None
+        if apply_heartbeat(
+            progress, event.start_time, event.end_time, event.watch_seconds, segments,
+            heartbeat_at=event.recorded_at, since=since, duration_seconds=known_videos[(event.video_id, event.tenant_id)]
+        ) or is_new:
+            touched_days.add((event.user_id, event.date))
+    EVENTS_SKIPPED.inc(skipped)
+    if not touched_days:
+        return []
+    db.flush()
+
+    user_ids = {user_id for user_id, _ in touched_days}
+    days = {day for _, day in touched_days}
+    totals = dict(
+        ((user_id, day), total) for user_id, day, total in db.query(
+            Progress.user_id, Progress.date, func.coalesce(func.sum(Progress.watch_seconds), 0)
+        ).filter(Progress.user_id.in_(user_ids), Progress.date.in_(days)).group_by(Progress.user_id, Progress.date)
+    )
+    attendance_rows = {}
+    for attendance in db.query(Attendance).filter(Attendance.user_id.in_(user_ids), Attendance.date.in_(days)):
+        if (attendance.user_id, attendance.date) in touched_days:
+            attendance_rows.setdefault((attendance.user_id, attendance.date), attendance)
+
+    transitions = []
+    for user_id, day in sorted(touched_days, key=lambda key: (key[1], key[0])):
+        attendance = attendance_rows.get((user_id, day))
+        previous_status = attendance.status if attendance else None
+        if attendance is None:
+            # First video of the day for this user
+            attendance = Attendance(tenant_id=tenants[user_id], user_id=user_id, date=day, total_seconds=0, status="in progress")
+            db.add(attendance)
+        attendance.total_seconds = totals.get((user_id, day), 0)
+        attendance.status = updated_status(attendance.status, attendance.total_seconds, day, tenants[user_id])
+        if track_history and attendance.status == "present" and previous_status != "present":
+            record_present_day(db, user_id, day)
+        if attendance.status != previous_status:
+            transitions.append({**attendance_event(attendance), "previous_status": previous_status})
+    return transitions
+
+def run_batch(batch_size: int = AGGREGATOR_BATCH_SIZE, bind=engine) -> int:
+    """Apply the next batch of a database's events; returns how many were read"""
+    db = SessionLocal(bind=bind)
+    try:
+        position = lock_checkpoint(db)
+        events = read_events(db, position, batch_size)
+        if not events:
+            db.commit()
+            return 0
+        transitions = apply_events(db, events)
+        save_checkpoint(db, (events[-1].txid, events[-1].id))
+        db.commit()
+
+        EVENTS_APPLIED.inc(len(events))
+        recorded_at = events[-1].recorded_at
+        if recorded_at is not None:
+            if recorded_at.tzinfo is None:
+                recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+            AGGREGATOR_LAG.set(max(0.0, (datetime.now(timezone.utc) - recorded_at).total_seconds()))
+        for tenant_id, user_id, day in {(event.tenant_id, event.user_id, event.date) for event in events}:
+            load_day_attendance.invalidate(tenant_id, user_id, day)
+        broadcast_changes(db, transitions)
+        return len(events)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def run_forever(batch_size: int = AGGREGATOR_BATCH_SIZE, poll_seconds: float = AGGREGATOR_POLL_SECONDS, binds: list = None):
+    while True:
+        for bind in binds or all_engines():
+            try:
+                while run_batch(batch_size, bind) >= batch_size:
+                    pass
+            except Exception:
+                logger.exception("Progress aggregation failed; retrying")
+        AGGREGATOR_LAG.set(0)
+        time.sleep(poll_seconds)
+
+_aggregator = {"thread": None}
+
+def start_aggregator():
+    """Start the in-process aggregator thread in outbox mode (once per process)"""
+    if PROGRESS_WRITE_MODE != "outbox" or not AGGREGATOR_IN_PROCESS or _aggregator["thread"] is not None:
+        return
+    _aggregator["thread"] = threading.Thread(target=run_forever, name="progress-aggregator", daemon=True)
+    _aggregator["thread"].start()
+
+def rebuild(since: date = None, batch_size: int = AGGREGATOR_REBUILD_BATCH_SIZE, progress=None, bind=engine) -> int:
+    """Recompute progress and attendance (from `since`, default everything) by replaying the log.
+
+    Runs in one transaction holding the checkpoint, so readers see the old projections
+    until it commits and the aggregator resumes where it left off. Attendance rows in
+    range are kept but reset (past days to absent, today to in progress) before replay,
+    so manual status changes are recomputed from watch time. Streaks and history are
+    cleared and rebuilt per user on their next stats request.
+    """
+    db = SessionLocal(bind=bind)
+    try:
+        through = lock_checkpoint(db)
+        today = date.today()
+        progress_rows = db.query(Progress)
+        attendance_rows = db.query(Attendance)
+        if since is not None:
+            progress_rows = progress_rows.filter(Progress.date >= since)
+            attendance_rows = attendance_rows.filter(Attendance.date >= since)
+        progress_rows.delete(synchronize_session=False)
+        attendance_rows.update({
+            Attendance.total_seconds: 0,
+            Attendance.status: case((Attendance.date < today, "absent"), else_="in progress")
+        }, synchronize_session=False)
+        db.query(AttendanceStreak).delete(synchronize_session=False)
+        db.query(AttendanceHistory).delete(synchronize_session=False)
+
+        applied = 0
+        position = (-1, 0)
+        while True:
+            events = read_events(db, position, batch_size, through=through, since=since)
+            if not events:
+                break
+            apply_events(db, events, track_history=False)
+            db.flush()
+            # Keep the identity map to one batch
+            db.expunge_all()
+            position = (events[-1].txid, events[-1].id)
+            applied += len(events)
+            if progress:
+                progress(applied)
+        db.commit()
+        return applied
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def bootstrap(batch_size: int = AGGREGATOR_BATCH_SIZE, bind=engine) -> int:
+    """Seed an empty log with one set of events per existing progress row and mark them applied.
+
+    Run once before switching to outbox mode, so a later rebuild reproduces the history
+    written in direct mode. Seeded events have txid 0 and sort before every live event.
+    """
+    db = SessionLocal(bind=bind)
+    try:
+        lock_checkpoint(db)
+        if db.query(ProgressEvent.id).first() is not None:
+            raise RuntimeError("progress_event is not empty; bootstrap only seeds a new log")
+        seeded = 0
+        last_id = 0
+        while True:
+            rows = db.query(Progress).filter(Progress.id > last_id).order_by(Progress.id).limit(batch_size).all()
+            if not rows:
+                break
+            events = []
+            for progress in rows:
+                base = {
+                    "txid": 0, "tenant_id": progress.tenant_id, "user_id": progress.user_id, "video_id": progress.video_id, "date": progress.date,
+                    "start_time": progress.start_time, "end_time": progress.end_time,
+                    "watch_seconds": None, "position_start": None, "position_end": None,
+                    # No server time: replays re-credit the history without the wall-clock limit
+                    "recorded_at": None
+                }
+                intervals = load_intervals(progress.watched_intervals)
+                for start, end in intervals:
+                    events.append({**base, "position_start": start, "position_end": end})
+                # Watch time beyond the segments came from heartbeats without one
+                remainder = progress.delta_seconds
+                if remainder is None:
+                    remainder = (progress.watch_seconds or 0) - int(covered_seconds(intervals))
+                if remainder > 0 or not intervals:
+                    events.append({**base, "watch_seconds": remainder if remainder > 0 else None})
+            db.execute(insert(ProgressEvent), events)
+            seeded += len(events)
+            last_id = rows[-1].id
+            db.expunge_all()
+        max_id = db.query(func.max(ProgressEvent.id)).scalar() or 0
+        save_checkpoint(db, (0, max_id))
+        db.commit()
+        return seeded
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def status(bind=engine) -> dict:
+    db = SessionLocal(bind=bind)
+    try:
+        checkpoint = db.query(ProjectionCheckpoint).filter(ProjectionCheckpoint.name == CHECKPOINT).first()
+        position = (checkpoint.txid, checkpoint.event_id) if checkpoint else (0, 0)
+        pending = db.query(func.count(ProgressEvent.id)).filter(
+            tuple_(ProgressEvent.txid, ProgressEvent.id) > tuple_(*position)
+        ).scalar()
+        oldest = db.query(func.min(ProgressEvent.recorded_at)).filter(
+            tuple_(ProgressEvent.txid, ProgressEvent.id) > tuple_(*position)
+        ).scalar()
+        return {
+            "checkpoint": {"txid": position[0], "event_id": position[1],
+                           "updated_at": checkpoint.updated_at.isoformat() if checkpoint and checkpoint.updated_at else None},
+            "events": db.query(func.count(ProgressEvent.id)).scalar(),
+            "pending": pending,
+            "oldest_pending": oldest.isoformat() if oldest else None
+        }
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain progress/attendance from the progress_event log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    parser.add_argument("--tenant", help="Work on the database holding this tenant (default: the primary)")
+    run_parser = commands.add_parser("run", help="Consume events continuously")
+    run_parser.add_argument("--batch-size", type=int, default=AGGREGATOR_BATCH_SIZE)
+    run_parser.add_argument("--once", action="store_true", help="Exit once the log is drained")
+    rebuild_parser = commands.add_parser("rebuild", help="Recompute the projections from the log")
+    rebuild_parser.add_argument("--since", type=date.fromisoformat, help="First day to recompute (default: all)")
+    rebuild_parser.add_argument("--batch-size", type=int, default=AGGREGATOR_REBUILD_BATCH_SIZE)
+    commands.add_parser("bootstrap", help="Seed an empty log from existing progress rows")
+    commands.add_parser("status", help="Show the checkpoint and pending events")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    bind = tenant_bind(args.tenant) if args.tenant else engine
+    if args.command == "run":
+        if args.once:
+            started = time.monotonic()
+            total = 0
+            while True:
+                count = run_batch(args.batch_size, bind)
+                total += count
+                if count < args.batch_size:
+                    break
+            seconds = time.monotonic() - started
+            print(f"Applied {total:,} events in {seconds:.2f}s ({round(total / seconds) if seconds > 0 else total:,} events/s)")
+        else:
+            # Without --tenant every database is consumed
+            run_forever(args.batch_size, binds=[bind] if args.tenant else None)
+    elif args.command == "rebuild":
+        started = time.monotonic()
+        total = rebuild(args.since, args.batch_size, progress=lambda applied: print(f"{applied:,} events replayed", flush=True), bind=bind)
+        seconds = time.monotonic() - started
+        print(f"Rebuilt from {total:,} events in {seconds:.2f}s ({round(total / seconds) if seconds > 0 else total:,} events/s)")
+    elif args.command == "bootstrap":
+        print(f"Seeded {bootstrap(bind=bind):,} events")
+    elif args.command == "status":
+        for key, value in status(bind).items():
+            print(f"{key}: {value}")
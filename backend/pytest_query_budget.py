@@ -0,0 +1,50 @@
+import pytest
+import query_budget
+
+# pytest plugin that fails a test when any request it makes exceeds its route's query
+# budget or repeats the same statement shape (likely N+1).
+# Enable with `pytest -p pytest_query_budget` from backend/ (or `pytest_plugins = ["pytest_query_budget"]`
+# in a conftest) and run the tests against seeded data so loops actually repeat.
+#   @pytest.mark.query_budget(5)     every request in the test may issue at most 5 queries
+#   @pytest.mark.query_budget(None)  don't check this test
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "query_budget(limit): cap queries per request in this test (None disables the check)"
+    )
+
+@pytest.fixture
+def query_reports():
+    """Reports ({route, queries, budget, repeated, over_budget}) for the requests made so far in the test"""
+    reports = []
+    query_budget.add_listener(reports.append)
+    yield reports
+    query_budget.remove_listener(reports.append)
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("query_budget")
+    if marker is not None and marker.args and marker.args[0] is None:
+        yield
+        return
+    limit = marker.args[0] if marker is not None and marker.args else None
+
+    reports = []
+    query_budget.add_listener(reports.append)
+    try:
+        outcome = yield
+    finally:
+        query_budget.remove_listener(reports.append)
+    if outcome.excinfo is not None:
+        return
+
+    failures = []
+    for report in reports:
+        budget = report["budget"] if limit is None else limit
+        if report["queries"] > budget:
+            failures.append(f"{report['route']}: {report['queries']} queries (budget {budget})")
+        for shape, count in report["repeated"]:
+            failures.append(f"{report['route']}: possible N+1, {count}x {shape[:200]}")
+    if failures:
+        outcome.force_exception(pytest.fail.Exception("Query budget exceeded:\n" + "\n".join(failures), pytrace=False))
@@ -0,0 +1,151 @@
+from collections import Counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+import logging
+import os
+import re
+import threading
+
+# Per-request query budgets and N+1 detection.
+# get_db/get_read_db attach a request-scoped QueryTracker to their sessions; every
+# statement run on a connection checked out by such a session is counted and its
+# shape (SQL with parameters and IN lists collapsed) recorded. When the request's
+# sessions close, the totals are checked against the route's budget and repeated
+# identical shapes are flagged as likely N+1 queries.
+
+logger = logging.getLogger(__name__)
+
+# "log" (default) logs violations, "off" disables tracking (the pytest plugin turns violations into failures)
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "log")
+
+# Queries allowed per request for routes without their own budget
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "20"))
+
+# The same statement shape this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+# Per-route budgets ("METHOD /route/template"); extend or override with
+# QUERY_BUDGETS="GET /attendance/me=3;POST /progress=12"
+ROUTE_QUERY_BUDGETS = {
+    "GET /courses": 2,
+    "GET /courses/{course_id}/videos": 2,
+    "GET /attendance/me": 3,
+    "GET /attendance/today": 3,
+    "GET /attendance/date/{attendance_date}": 8,
+    "GET /auth/users": 3,
+    "GET /auth/users/students": 3,
+    "POST /progress": 20,  # includes the one-off streak rebuild when a day first turns present
+}
+# The attendance handlers are also served under /progress/attendance/*
+for route, budget in list(ROUTE_QUERY_BUDGETS.items()):
+    method, _, path = route.partition(" ")
+    if path.startswith("/attendance/"):
+        ROUTE_QUERY_BUDGETS[f"{method} /progress{path}"] = budget
+for entry in filter(None, os.getenv("QUERY_BUDGETS", "").split(";")):
+    route, _, budget = entry.rpartition("=")
+    ROUTE_QUERY_BUDGETS[route.strip()] = int(budget)
+
+_PARAMETER = re.compile(r"%\(\w+\)s|%s|\?|(?<!:):\w+")
+_PARAMETER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+def statement_shape(statement: str) -> str:
+    """SQL with parameters replaced by ? and IN lists of any length collapsed to (?)"""
+    shape = _PARAMETER.sub("?", statement)
+    return " ".join(_PARAMETER_LIST.sub("(?)", shape).split())
+
+class QueryTracker:
+    """Statements run on behalf of one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.shapes = Counter()
+        self.sessions = 0
+        self.reported = False
+        self._lock = threading.Lock()
+
+    def record(self, statement: str):
+        shape = statement_shape(statement)
+        with self._lock:
+            self.queries += 1
+            self.shapes[shape] += 1
+
+    def repeated_shapes(self, threshold: int = None) -> list:
+        threshold = N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+def route_key(request) -> str:
+    route = request.scope.get("route")
+    return f"{request.method} {getattr(route, 'path', request.url.path)}"
+
+def budget_for(key: str) -> int:
+    return ROUTE_QUERY_BUDGETS.get(key, QUERY_BUDGET_DEFAULT)
+
+# Callbacks receiving every request report (used by the pytest plugin)
+_listeners = []
+
+def add_listener(callback):
+    _listeners.append(callback)
+
+def remove_listener(callback):
+    _listeners.remove(callback)
+
+def attach(db: Session, request):
+    """Count the statements run by this session towards the request's budget"""
+    if QUERY_BUDGET_MODE == "off" or request is None:
+        return
+    tracker = getattr(request.state, "query_tracker", None)
+    if tracker is None:
+        tracker = request.state.query_tracker = QueryTracker()
+    with tracker._lock:
+        tracker.sessions += 1
+    db.info["query_tracker"] = tracker
+
+def finish(db: Session, request):
+    """Called when a request's session closes; the last one to close checks the budget"""
+    tracker = db.info.pop("query_tracker", None)
+    if tracker is None:
+        return
+    with tracker._lock:
+        tracker.sessions -= 1
+        if tracker.sessions > 0 or tracker.reported:
+            return
+        tracker.reported = True
+
+    key = route_key(request)
+    report = {
+        "route": key,
+        "queries": tracker.queries,
+        "budget": budget_for(key),
+        "repeated": tracker.repeated_shapes(),
+    }
+    report["over_budget"] = report["queries"] > report["budget"]
+    for callback in list(_listeners):
+        callback(report)
+    if not (report["over_budget"] or report["repeated"]):
+        return
+
+    problems = []
+    if report["over_budget"]:
+        problems.append(f"{report['queries']} queries (budget {report['budget']})")
+    for shape, count in report["repeated"]:
+        problems.append(f"possible N+1: {count}x {shape[:200]}")
+    logger.warning(f"{key}: " + "; ".join(problems))
+
+@event.listens_for(Session, "after_begin")
+def _bind_tracker(session, transaction, connection):
+    tracker = session.info.get("query_tracker")
+    if tracker is not None:
+        connection.info["query_tracker"] = tracker
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    tracker = conn.info.get("query_tracker")
+    if tracker is not None:
+        tracker.record(statement)
+
+@event.listens_for(Pool, "checkin")
+def _unbind_tracker(dbapi_connection, connection_record):
+    # The connection goes back to the pool; later checkouts belong to other requests
+    connection_record.info.pop("query_tracker", None)
@@ -0,0 +1,226 @@
+from urllib.parse import urlparse
+from prometheus_client import Counter
+from auth import verify_token
+from database import DEFAULT_TENANT
+import json
+import math
+import os
+import re
+import threading
+import time
+
+# Token-bucket rate limiting for expensive routes.
+# Requests are matched on method + path before routing (no body parsing), keyed by
+# the user id of a valid bearer token or by client IP, and rejected with 429 and
+# Retry-After when their bucket is empty. Buckets live in-process by default; set
+# RATE_LIMIT_URL=redis://... to share them between instances (one Redis round trip
+# per limited request, falling back to the local buckets if Redis is unavailable).
+# Behind a proxy, set FORWARDED_ALLOW_IPS so the server sees real client addresses.
+
+# "memory://" (default, per process), "redis://host:6379/0" (shared) or "none://" (disabled)
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", "memory://")
+
+# Buckets kept in memory before idle (full) ones are dropped
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Per-route limits: "METHOD /route/template" -> (tokens per second, burst, key).
+# key "user" uses the bearer token's user id (falling back to IP), "ip" the client address.
+# Extend or override with RATE_LIMITS="POST /progress=2:20;POST /auth/login=0.5:30:ip"
+ROUTE_RATE_LIMITS = {
+    "POST /auth/login": (1.0, 30, "ip"),  # a classroom behind one NAT logs in together
+    "POST /auth/signup": (0.2, 10, "ip"),
+    "POST /progress": (2.0, 20, "user"),
+    "POST /videos/youtube-playlist": (0.05, 5, "user"),
+    "POST /courses/{course_id}/register": (1.0, 10, "user"),
+}
+for entry in filter(None, os.getenv("RATE_LIMITS", "").split(";")):
+    route, _, spec = entry.rpartition("=")
+    rate, burst, *key = spec.split(":")
+    ROUTE_RATE_LIMITS[route.strip()] = (float(rate), int(burst), key[0] if key else "user")
+
+RATE_LIMITED = Counter(
+    "edutrack_rate_limited_total", "Requests rejected by the rate limiter", ["route"]
+)
+
+class TokenBuckets:
+    """In-process token buckets; take() returns 0 when a token was taken, else seconds until one is available"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, updated_at, full_at)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                tokens = burst
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return wait
+
+    def _prune(self, now: float):
+        # Buckets that have refilled completely behave exactly like missing ones
+        for key in [key for key, bucket in self._buckets.items() if bucket[2] <= now]:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            # Too many active clients to track; start over rather than grow without bound
+            self._buckets.clear()
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+# Atomic token bucket on Redis (server clock, so instances with skewed clocks agree)
+_REDIS_TAKE = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated_at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class RedisTokenBuckets:
+    """Token buckets shared through Redis; errors fall back to in-process buckets"""
+
+    def __init__(self, client, prefix: str = "edutrack:ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self.script = client.register_script(_REDIS_TAKE)
+        self.fallback = TokenBuckets()
+        self.errors = 0
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        try:
+            return float(self.script(keys=[self.prefix + key], args=[rate, burst]))
+        except Exception:
+            self.errors += 1
+            return self.fallback.take(key, rate, burst)
+
+    def clear(self):
+        self.fallback.clear()
+
+def create_buckets(url: str):
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return TokenBuckets()
+    if scheme in ("redis", "rediss"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_URL points to Redis but the `redis` package is not installed")
+        return RedisTokenBuckets(redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05))
+    if scheme == "none":
+        return None
+    raise RuntimeError(f"Unsupported RATE_LIMIT_URL scheme: {scheme!r}")
+
+buckets = create_buckets(RATE_LIMIT_URL)
+
+class RouteTable:
+    """Maps "METHOD /route/template" keys to values and matches raw request paths against them"""
+
+    def __init__(self, routes: dict):
+        self.exact = {}
+        self.templates = []  # (method, pattern, route, value)
+        for route, value in routes.items():
+            method, _, path = route.partition(" ")
+            if "{" in path:
+                segments = ("[^/]+" if segment.startswith("{") else re.escape(segment) for segment in path.split("/"))
+                self.templates.append((method, re.compile("^" + "/".join(segments) + "/?$"), route, value))
+            else:
+                self.exact[(method, path.rstrip("/") or "/")] = (route, value)
+
+    def match(self, method: str, path: str):
+        """(route, value) for a request, or None when the route isn't listed"""
+        matched = self.exact.get((method, path.rstrip("/") or "/"))
+        if matched is not None:
+            return matched
+        for route_method, pattern, route, value in self.templates:
+            if route_method == method and pattern.match(path):
+                return route, value
+        return None
+
+_routes = RouteTable(ROUTE_RATE_LIMITS)
+
+_token_users = {}  # bearer token -> user id (None for invalid tokens), so each token is verified once
+MAX_CACHED_TOKENS = 10000
+
+def token_user_id(token: str):
+    try:
+        return _token_users[token]
+    except KeyError:
+        pass
+    payload = verify_token(token)
+    user_id = payload.get("user_id") if payload else None
+    if len(_token_users) >= MAX_CACHED_TOKENS:
+        _token_users.clear()
+    _token_users[token] = user_id
+    return user_id
+
+def client_key(scope, key_type: str) -> str:
+    if key_type == "user":
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                if value[:7].lower() == b"bearer ":
+                    user_id = token_user_id(value[7:].decode("latin-1"))
+                    if user_id is not None:
+                        # User ids are only unique within a tenant's database
+                        return f"u{scope.get('state', {}).get('tenant_id', DEFAULT_TENANT)}:{user_id}"
+                break
+    client = scope.get("client")
+    return f"ip{client[0] if client else 'unknown'}"
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After when a client exceeds a route's limit"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if buckets is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        matched = _routes.match(scope["method"], scope["path"])
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+
+        route, (rate, burst, key_type) = matched
+        wait = buckets.take(f"{route}|{client_key(scope, key_type)}", rate, burst)
+        if wait <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        RATE_LIMITED.labels(route).inc()
+        body = json.dumps({"detail": "Too many requests, please retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
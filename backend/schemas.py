@@ -20,10 +20,21 @@ class UserResponse(BaseModel):
     user_name: str
     role: str
     created_at: datetime
+    tenant_id: Optional[str] = None  # School (tenant) the user belongs to
     
     class Config:
         from_attributes = True
 
+class UserImportError(BaseModel):
+    row: int  # 1-based row number in the uploaded file
+    user_name: Optional[str] = None
+    detail: str
+
+class UserImportResponse(BaseModel):
+    total_rows: int
+    created: int
+    errors: list[UserImportError]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -33,6 +44,9 @@ class CourseResponse(BaseModel):
     id: int
     course_title: str
     link: Optional[str] = None
+    video_count: int = 0
+    enrolled_count: int = 0
+    total_duration_seconds: int = 0
     
     class Config:
         from_attributes = True
@@ -42,6 +56,7 @@ class CourseVideoResponse(BaseModel):
     course_id: int
     title: str
     video_link: Optional[str] = None
+    duration_seconds: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -61,7 +76,9 @@ class ProgressRequest(BaseModel):
     video_id: int
     start_time: Optional[str] = None  # Time as string "HH:MM:SS"
     end_time: Optional[str] = None     # Time as string "HH:MM:SS"
-    watchtime_seconds: Optional[int] = None  # Watchtime in seconds (converted to watch_time INTERVAL in DB)
+    watchtime_seconds: Optional[int] = None  # Watchtime in seconds (added to progress.watch_seconds)
+    position_start: Optional[float] = None  # Playhead position (seconds) where the watched segment began
+    position_end: Optional[float] = None    # Playhead position (seconds) where the watched segment ended
 
 class ProgressResponse(BaseModel):
     id: int
@@ -70,7 +87,7 @@ class ProgressResponse(BaseModel):
     date: str  # Date as string
     start_time: Optional[str] = None
     end_time: Optional[str] = None
-    watch_time: Optional[str] = None  # Interval as string (e.g., "00:05:30")
+    watch_time: Optional[str] = None  # Watch time as HH:MM:SS (e.g., "00:05:30")
     
     class Config:
         from_attributes = True
@@ -79,8 +96,34 @@ class AttendanceResponse(BaseModel):
     id: int
     user_id: int
     date: str  # Date as string
-    total_time: Optional[str] = None  # Interval as string (e.g., "03:00:00")
+    total_time: Optional[str] = None  # Total watch time as HH:MM:SS (e.g., "03:00:00")
     status: Optional[str] = None  # "in progress", "present", etc.
     
     class Config:
         from_attributes = True
+
+class AttendanceStatsResponse(BaseModel):
+    user_id: int
+    current_streak: int  # 0 unless the streak reaches today or yesterday
+    longest_streak: int
+    last_present_date: Optional[str] = None
+    total_present_days: int
+    year: int
+    present_days_in_year: int
+    monthly_present_days: list[int]  # 12 entries, January first
+    present_bitmap: str  # Base64 bitmap of present days in the year (bit n = day n + 1)
+
+class SearchResult(BaseModel):
+    type: str  # "course" or "video"
+    id: int
+    course_id: int
+    title: str
+    video_link: Optional[str] = None  # Videos only
+    rank: float
+
+class SearchResponse(BaseModel):
+    query: str
+    total: int  # Matches, capped at SEARCH_MAX_CANDIDATES per type
+    limit: int
+    offset: int
+    results: list[SearchResult]
@@ -0,0 +1,207 @@
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from bisect import bisect_left
+from models import Course, CourseVideo
+from schemas import SearchResponse
+from database import engine, request_tenant
+from dependencies import get_read_db
+from serialization import trusted_json, youtube_url
+import math
+import os
+import re
+import threading
+import time
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+# Course and video title search.
+# On PostgreSQL, course.search_vector and course_video.search_vector are generated
+# tsvector columns (so every insert keeps them current) with GIN indexes; queries match
+# every term as a prefix and rank with ts_rank_cd, course titles weighted above video
+# titles. Other databases (SQLite test runs) use an in-memory index rebuilt on change.
+# Results only include the requesting tenant's courses and their videos.
+
+# Matches per table considered for ranking; broad prefixes stop here to keep latency bounded
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+# Terms of a query beyond this are ignored
+SEARCH_MAX_TERMS = 8
+
+# Other instances rebuild their in-memory index at least this often
+SEARCH_INDEX_SECONDS = float(os.getenv("SEARCH_INDEX_SECONDS", "300"))
+
+# Serializes the search DDL across instances starting at the same time
+ADVISORY_LOCK_ID = 7_202_044
+
+SEARCH_DDL = [
+    """
+    ALTER TABLE course ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (setweight(to_tsvector('simple', coalesce(course_title, '')), 'A')) STORED
+    """,
+    """
+    ALTER TABLE course_video ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (setweight(to_tsvector('simple', coalesce(title, '')), 'B')) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_course_search_vector ON course USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS idx_course_video_search_vector ON course_video USING GIN (search_vector)",
+]
+
+SEARCH_SQL = text("""
+    WITH query AS (SELECT to_tsquery('simple', :tsquery) AS q),
+    matches AS (
+        (SELECT 'course' AS type, c.id, c.id AS course_id, c.course_title AS title, NULL AS video_link,
+                ts_rank_cd(c.search_vector, query.q, 1) AS rank
+         FROM course c, query WHERE c.search_vector @@ query.q AND c.tenant_id = :tenant_id LIMIT :candidates)
+        UNION ALL
+        (SELECT 'video', v.id, v.course_id, v.title, v.video_link,
+                ts_rank_cd(v.search_vector, query.q, 1)
+         FROM course_video v JOIN course c ON c.id = v.course_id, query
+         WHERE v.search_vector @@ query.q AND c.tenant_id = :tenant_id LIMIT :candidates)
+    )
+    SELECT type, id, course_id, title, video_link, rank, count(*) OVER () AS total
+    FROM matches
+    ORDER BY rank DESC, type, id
+    LIMIT :limit OFFSET :offset
+""")
+
+_TERM = re.compile(r"\w+")
+
+def query_terms(q: str) -> list:
+    """Lowercased word terms of a query (punctuation can't reach the tsquery parser)"""
+    return _TERM.findall(q.lower())[:SEARCH_MAX_TERMS]
+
+def ensure_search_index(bind=engine):
+    """Add the generated tsvector columns and GIN indexes (PostgreSQL only, idempotent)"""
+    if bind.dialect.name != "postgresql":
+        return
+    with bind.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        for statement in SEARCH_DDL:
+            connection.execute(text(statement))
+
+def result_dict(type: str, id: int, course_id: int, title: str, video_link, rank: float) -> dict:
+    return {
+        "type": type,
+        "id": id,
+        "course_id": course_id,
+        "title": title,
+        "video_link": youtube_url(video_link) if type == "video" else None,
+        "rank": round(float(rank), 6)
+    }
+
+def search_postgres(db: Session, tenant_id: str, terms: list, limit: int, offset: int) -> tuple:
+    rows = db.execute(SEARCH_SQL, {
+        "tsquery": " & ".join(f"{term}:*" for term in terms),
+        "tenant_id": tenant_id,
+        "candidates": SEARCH_MAX_CANDIDATES,
+        "limit": limit,
+        "offset": offset
+    }).all()
+    if not rows:
+        # Past the last page the window count isn't available; count the matches directly
+        total = 0 if offset == 0 else search_postgres(db, tenant_id, terms, 1, 0)[1]
+        return [], total
+    return [result_dict(*row[:6]) for row in rows], rows[0][6]
+
+class MemoryIndex:
+    """Inverted index of title terms with prefix lookups over a sorted term list"""
+
+    # Same relative weighting as the PostgreSQL ranking (A vs B)
+    WEIGHTS = {"course": 1.0, "video": 0.4}
+
+    def __init__(self, documents: list):
+        self.documents = {}  # (type, id) -> (course_id, title, video_link, term count)
+        self.postings = {}   # term -> set of (type, id)
+        for type, id, course_id, title, video_link in documents:
+            terms = query_terms(title or "")
+            self.documents[(type, id)] = (course_id, title, video_link, len(terms))
+            for term in terms:
+                self.postings.setdefault(term, set()).add((type, id))
+        self.terms = sorted(self.postings)
+
+    def _matching(self, prefix: str) -> dict:
+        """Documents containing a term starting with prefix -> 1.0 for exact, 0.5 for prefix matches"""
+        scores = {}
+        position = bisect_left(self.terms, prefix)
+        while position < len(self.terms) and self.terms[position].startswith(prefix):
+            term = self.terms[position]
+            score = 1.0 if term == prefix else 0.5
+            for key in self.postings[term]:
+                if scores.get(key, 0) < score:
+                    scores[key] = score
+            position += 1
+        return scores
+
+    def search(self, terms: list, limit: int, offset: int) -> tuple:
+        matched = None
+        for term in terms:
+            scores = self._matching(term)
+            if matched is None:
+                matched = scores
+            else:
+                matched = {key: matched[key] + score for key, score in scores.items() if key in matched}
+            if not matched:
+                return [], 0
+        ranked = []
+        for (type, id), score in matched.items():
+            course_id, title, video_link, length = self.documents[(type, id)]
+            rank = score * self.WEIGHTS[type] / (1 + math.log(max(length, 1)))
+            ranked.append((-rank, type, id, course_id, title, video_link, rank))
+        ranked.sort()
+        page = ranked[offset:offset + limit]
+        return [result_dict(type, id, course_id, title, video_link, rank) for _, type, id, course_id, title, video_link, rank in page], len(ranked)
+
+_memory = {}  # tenant id -> (index, monotonic build time)
+_memory_lock = threading.Lock()
+
+def invalidate_search_index(tenant_id: str = None):
+    """Drop a tenant's (default: every) in-memory index after courses or videos change (PostgreSQL indexes maintain themselves)"""
+    with _memory_lock:
+        if tenant_id is None:
+            _memory.clear()
+        else:
+            _memory.pop(tenant_id, None)
+
+def memory_index(db: Session, tenant_id: str) -> MemoryIndex:
+    with _memory_lock:
+        index, built_at = _memory.get(tenant_id, (None, 0.0))
+        if index is not None and time.monotonic() - built_at < SEARCH_INDEX_SECONDS:
+            return index
+    documents = [
+        ("course", id, id, title, None)
+        for id, title in db.query(Course.id, Course.course_title).filter(Course.tenant_id == tenant_id)
+    ]
+    documents += [
+        ("video", id, course_id, title, video_link)
+        for id, course_id, title, video_link in db.query(
+            CourseVideo.id, CourseVideo.course_id, CourseVideo.title, CourseVideo.video_link
+        ).join(Course, Course.id == CourseVideo.course_id).filter(Course.tenant_id == tenant_id)
+    ]
+    index = MemoryIndex(documents)
+    with _memory_lock:
+        _memory[tenant_id] = (index, time.monotonic())
+    return index
+
+@router.get("", response_model=SearchResponse)
+def search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_CANDIDATES),
+    db: Session = Depends(get_read_db)
+):
+    """Search course and video titles; every word matches as a prefix (public)"""
+    terms = query_terms(q)
+    tenant_id = request_tenant(request)
+    if not terms:
+        results, total = [], 0
+    elif db.get_bind().dialect.name == "postgresql":
+        results, total = search_postgres(db, tenant_id, terms, limit, offset)
+    else:
+        results, total = memory_index(db, tenant_id).search(terms, limit, offset)
+    return trusted_json({"query": q, "total": total, "limit": limit, "offset": offset, "results": results})
+
+@router.get("/health")
+def health_check():
+    return {"status": "healthy", "service": "search-service"}
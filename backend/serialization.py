@@ -0,0 +1,71 @@
+from fastapi.responses import ORJSONResponse
+from datetime import time
+from typing import Optional
+import re
+
+# Shared formatting for listing endpoints. Listings select plain column tuples,
+# format them here and return ORJSONResponse, which skips response_model
+# re-validation (the data comes straight from our own tables).
+# With ?compact=1 listings are column-oriented ({"field": [values...]}) so field names
+# aren't repeated per row, and videos carry only their YouTube id.
+
+YOUTUBE_WATCH_URL = "https://www.youtube.com/watch?v="
+_YOUTUBE_ID = re.compile(r"(?:[?&]v=|youtu\.be/|/embed/|/shorts/)([\w-]+)")
+
+def format_seconds(value: Optional[int]) -> Optional[str]:
+    """Format a number of seconds as HH:MM:SS (None when empty)"""
+    if not value:
+        return None
+    minutes, seconds = divmod(int(value), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+def format_time(value: Optional[time]) -> Optional[str]:
+    """Format a TIME as HH:MM:SS"""
+    return value.strftime("%H:%M:%S") if value else None
+
+def attendance_dict(id: int, user_id: int, day, total_seconds, status) -> dict:
+    """AttendanceResponse-shaped dict from attendance columns"""
+    return {
+        "id": id,
+        "user_id": user_id,
+        "date": day.isoformat(),
+        "total_time": format_seconds(total_seconds),
+        "status": status
+    }
+
+def progress_dict(id: int, user_id: int, video_id: int, day, start_time, end_time, watch_seconds) -> dict:
+    """ProgressResponse-shaped dict from progress columns"""
+    return {
+        "id": id,
+        "user_id": user_id,
+        "video_id": video_id,
+        "date": day.isoformat(),
+        "start_time": format_time(start_time),
+        "end_time": format_time(end_time),
+        "watch_time": format_seconds(watch_seconds)
+    }
+
+def trusted_json(content, status_code: int = 200) -> ORJSONResponse:
+    """Serialize already-shaped response data directly to JSON bytes"""
+    return ORJSONResponse(content, status_code=status_code)
+
+def youtube_video_id(link: Optional[str]) -> Optional[str]:
+    """YouTube video id from a watch/short/embed link (a bare id is returned as-is; None if unrecognized)"""
+    if not link:
+        return None
+    if "/" not in link and "?" not in link:
+        return link
+    match = _YOUTUBE_ID.search(link)
+    return match.group(1) if match else None
+
+def youtube_url(video_id: Optional[str]) -> Optional[str]:
+    """Watch URL for a stored video id (links that are already URLs pass through)"""
+    if not video_id or "://" in video_id:
+        return video_id
+    return YOUTUBE_WATCH_URL + video_id
+
+def columns(rows, fields: tuple) -> dict:
+    """Column-oriented form of row tuples: {field: [value per row]}"""
+    values = list(zip(*rows)) if rows else [()] * len(fields)
+    return {field: list(column) for field, column in zip(fields, values)}
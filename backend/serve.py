@@ -0,0 +1,114 @@
+import math
+import os
+import sys
+import tempfile
+
+# Production server entry point: gunicorn with uvicorn workers, one worker per CPU
+# the container may use (cgroup quota, falling back to the CPUs this process may run on).
+#   python serve.py                          (workers from the CPU quota, port from $PORT or 8000)
+#   WEB_CONCURRENCY=4 python serve.py        (explicit worker count)
+# The app is imported once in the master and forked into the workers (preload), so
+# anything holding connections or threads must be reset after fork (see database.py).
+# Without gunicorn (e.g. on Windows) it falls back to `uvicorn --workers`.
+
+# Upper bound for the derived worker count (each worker holds its own DB pool)
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))
+
+# Seconds a worker gets to finish in-flight requests and flush WebSocket buffers on shutdown
+GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "30"))
+
+def _read(path: str):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def cpu_quota():
+    """CPUs allowed by the cgroup CPU quota (None when unlimited or unknown)"""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    limit = _read("/sys/fs/cgroup/cpu.max")
+    if limit:
+        quota, _, period = limit.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    # cgroup v1
+    quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+def worker_count() -> int:
+    """WEB_CONCURRENCY if set, otherwise one worker per available CPU (capped at MAX_WORKERS).
+
+    Embedded SQLite deployments default to one worker: cache invalidations are only
+    relayed between processes through PostgreSQL.
+    """
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    if os.getenv("DATABASE_URL", "").startswith("sqlite"):
+        return 1
+    return max(1, min(available_cpus(), MAX_WORKERS))
+
+def prepare_multiprocess_metrics(workers: int):
+    """Give the workers a shared Prometheus directory so /metrics aggregates all of them.
+
+    Must run before prometheus_client is imported (i.e. before the app is loaded).
+    """
+    if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="edutrack-metrics-")
+
+def _child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+def run(host: str = "0.0.0.0", port: int = 8000, workers: int = None, before_load=None):
+    """Serve main:app with `workers` processes; before_load() runs in the master before the app is imported"""
+    workers = workers or worker_count()
+    prepare_multiprocess_metrics(workers)
+    if before_load is not None:
+        before_load()
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        import uvicorn
+        if workers > 1 and before_load is not None:
+            raise RuntimeError("before_load needs gunicorn with several workers (uvicorn workers re-import the app)")
+        uvicorn.run("main:app", host=host, port=port, workers=workers, timeout_graceful_shutdown=GRACEFUL_TIMEOUT_SECONDS)
+        return
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            self.cfg.set("preload_app", True)
+            self.cfg.set("graceful_timeout", GRACEFUL_TIMEOUT_SECONDS)
+            self.cfg.set("timeout", 120)
+            self.cfg.set("keepalive", 75)  # Longer than typical load balancer idle timeouts
+            self.cfg.set("child_exit", _child_exit)
+
+        def load(self):
+            from main import app
+            return app
+
+    Server().run()
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    run(port=int(os.getenv("PORT", "8000")))
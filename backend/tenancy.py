@@ -0,0 +1,139 @@
+from urllib.parse import parse_qs
+from typing import Optional
+from sqlalchemy import inspect, text
+from auth import verify_token
+from database import DEFAULT_TENANT, engine
+import json
+import os
+import re
+
+# Tenants (schools) sharing one deployment.
+# User, course, enrollment, progress and attendance rows carry a tenant_id, and every
+# request is resolved to one tenant before routing: the `tenant` claim of its bearer token
+# (header, or ?token= for WebSocket/SSE), else the X-Tenant header (login, signup and
+# public catalog/search), else the default tenant. Handlers scope their queries with
+# request_tenant(request); database.py routes tenants listed in TENANT_DATABASE_URLS to
+# their own database. Tokens issued before tenants existed belong to the default tenant.
+
+# Known tenants, comma-separated (unset = any well-formed tenant id is accepted)
+TENANTS = {tenant.strip() for tenant in os.getenv("TENANTS", "").split(",") if tenant.strip()}
+
+TENANT_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,49}$")
+
+# Tables carrying a tenant_id
+TENANT_TABLES = ("user", "course", "course_status", "progress", "attendance", "progress_event")
+
+# Tenant-scoped indexes, created on databases that predate tenants (create_all makes them on new ones)
+TENANT_INDEXES = {
+    "user": [
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_user_tenant_email ON "user" (tenant_id, email)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_user_tenant_user_name ON "user" (tenant_id, user_name)',
+        'CREATE INDEX IF NOT EXISTS idx_user_tenant_role ON "user" (tenant_id, role)',
+    ],
+    "course": ["CREATE INDEX IF NOT EXISTS ix_course_tenant_id ON course (tenant_id)"],
+    "course_status": ["CREATE INDEX IF NOT EXISTS ix_course_status_tenant_id ON course_status (tenant_id)"],
+    "progress": ["CREATE INDEX IF NOT EXISTS idx_progress_tenant_date ON progress (tenant_id, date)"],
+    "attendance": ["CREATE INDEX IF NOT EXISTS idx_attendance_tenant_date ON attendance (tenant_id, date)"],
+}
+
+# Serializes the tenant DDL across instances starting at the same time
+ADVISORY_LOCK_ID = 7_202_050
+
+_token_tenants = {}  # bearer token -> tenant id (None for invalid tokens), so each token is verified once
+MAX_CACHED_TOKENS = 10000
+
+def is_valid_tenant(tenant_id: str) -> bool:
+    if not TENANT_ID_PATTERN.match(tenant_id):
+        return False
+    return not TENANTS or tenant_id in TENANTS or tenant_id == DEFAULT_TENANT
+
+def token_tenant(token: Optional[str]) -> Optional[str]:
+    """Tenant of a valid token (None when the token is invalid)"""
+    if not token:
+        return None
+    try:
+        return _token_tenants[token]
+    except KeyError:
+        pass
+    payload = verify_token(token)
+    tenant_id = payload.get("tenant", DEFAULT_TENANT) if payload else None
+    if len(_token_tenants) >= MAX_CACHED_TOKENS:
+        _token_tenants.clear()
+    _token_tenants[token] = tenant_id
+    return tenant_id
+
+def resolve_tenant(scope) -> Optional[str]:
+    """Tenant of a request (None when the X-Tenant header names an unknown tenant)"""
+    token = header_tenant = None
+    for name, value in scope["headers"]:
+        if name == b"authorization" and value[:7].lower() == b"bearer ":
+            token = value[7:].decode("latin-1")
+        elif name == b"x-tenant":
+            header_tenant = value.decode("latin-1").strip().lower()
+    if token is None and scope.get("query_string"):
+        token = parse_qs(scope["query_string"].decode("latin-1")).get("token", [None])[0]
+    tenant_id = token_tenant(token)
+    if tenant_id is not None:
+        # A signed-in user can't reach another tenant through the header
+        return tenant_id
+    if header_tenant:
+        return header_tenant if is_valid_tenant(header_tenant) else None
+    return DEFAULT_TENANT
+
+class TenantMiddleware:
+    """ASGI middleware storing the request's tenant in request.state.tenant_id"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        tenant_id = resolve_tenant(scope)
+        if tenant_id is None:
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1008})
+                return
+            body = json.dumps({"detail": "Unknown tenant"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        scope.setdefault("state", {})["tenant_id"] = tenant_id
+        await self.app(scope, receive, send)
+
+def ensure_tenant_columns(bind=engine) -> list:
+    """Add tenant_id (existing rows join the default tenant) and the tenant indexes to databases
+    created before tenants, replacing the deployment-wide email/user name uniqueness with
+    per-tenant uniqueness (run before create_partitioned_tables and create_all)"""
+    with bind.begin() as connection:
+        if bind.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        inspector = inspect(connection)
+        missing = [
+            table for table in TENANT_TABLES
+            if inspector.has_table(table) and "tenant_id" not in {column["name"] for column in inspector.get_columns(table)}
+        ]
+        # Single-column unique constraints/indexes on email or user_name
+        global_unique = []
+        if "user" in missing:
+            for constraint in inspector.get_unique_constraints("user"):
+                if constraint["column_names"] in (["email"], ["user_name"]) and constraint.get("name"):
+                    global_unique.append(f'ALTER TABLE "user" DROP CONSTRAINT {constraint["name"]}')
+            for index in inspector.get_indexes("user"):
+                if index["unique"] and index["column_names"] in (["email"], ["user_name"]) and not index.get("duplicates_constraint"):
+                    global_unique.append(f"DROP INDEX {index['name']}")
+        for table in missing:
+            # A constant default doesn't rewrite the table on PostgreSQL 11+
+            connection.execute(text(
+                f"ALTER TABLE \"{table}\" ADD COLUMN tenant_id VARCHAR(50) NOT NULL DEFAULT '{DEFAULT_TENANT}'"
+            ))
+            for statement in TENANT_INDEXES.get(table, []):
+                connection.execute(text(statement))
+        for statement in global_unique:
+            connection.execute(text(statement))
+    return missing
@@ -0,0 +1,14 @@
+import os
+import sys
+
+# The suite runs on a throwaway database and the in-process fake Redis, never on DATABASE_URL.
+# TEST_DATABASE_URL picks another database (e.g. a scratch PostgreSQL); default: in-memory SQLite.
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", "sqlite://")
+os.environ["CACHE_URL"] = "fake://"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def pytest_configure(config):
+    # Every request a test makes is held to its route's query budget (see pytest_query_budget.py)
+    if not config.pluginmanager.has_plugin("pytest_query_budget"):
+        config.pluginmanager.import_plugin("pytest_query_budget")
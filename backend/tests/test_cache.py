@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy.orm import Session
+
+import cache
+from cache import MemoryCache, cached, get_or_load
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    cache.backend.clear()
+    for counter in cache._counters:
+        cache._counters[counter] = 0
+    yield
+    cache.backend.clear()
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for TTL tests"""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+def test_fake_backend_is_selected():
+    assert cache.backend.name == "fake"
+
+def test_miss_then_hit():
+    calls = []
+    def loader():
+        calls.append(1)
+        return {"id": 1, "title": "Algebra"}
+
+    assert get_or_load("course:1", loader) == {"id": 1, "title": "Algebra"}
+    assert get_or_load("course:1", loader) == {"id": 1, "title": "Algebra"}
+    assert len(calls) == 1
+    stats = cache.cache_stats()
+    assert (stats["misses"], stats["hits"]) == (1, 1)
+    assert stats["hit_rate"] == 0.5
+
+def test_values_round_trip_through_json():
+    get_or_load("pair", lambda: (1, 2))
+    # Same serialization path as Redis: tuples come back as lists
+    assert get_or_load("pair", lambda: None) == [1, 2]
+
+def test_none_is_not_cached():
+    calls = []
+    def loader():
+        calls.append(1)
+        return None
+
+    assert get_or_load("missing", loader) is None
+    assert get_or_load("missing", loader) is None
+    assert len(calls) == 2
+
+def test_entries_expire_after_ttl(clock):
+    get_or_load("short", lambda: "v1", ttl=5)
+    clock[0] += 4
+    assert get_or_load("short", lambda: "v2", ttl=5) == "v1"
+    clock[0] += 2
+    assert get_or_load("short", lambda: "v2", ttl=5) == "v2"
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCache(max_entries=2)
+    backend.set("a", 1, 60)
+    backend.set("b", 2, 60)
+    assert backend.get("a") == 1  # "b" is now least recently used
+    backend.set("c", 3, 60)
+    assert backend.get("b") is cache.MISSING
+    assert (backend.get("a"), backend.get("c")) == (1, 3)
+    assert backend.stats()["evictions"] == 1
+
+def test_memory_backend_expires_entries(clock):
+    backend = MemoryCache()
+    backend.set("a", 1, 10)
+    clock[0] += 10
+    assert backend.get("a") is cache.MISSING
+    assert backend.stats() == {"entries": 0, "max_entries": backend.max_entries, "evictions": 0, "expirations": 1}
+
+def test_concurrent_misses_load_once():
+    release = threading.Event()
+    calls = []
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return "loaded"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_or_load("hot", loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Let the followers queue up behind the leader before it finishes
+    deadline = time.monotonic() + 5
+    while cache.cache_stats()["coalesced"] < 7 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["loaded"] * 8
+    assert len(calls) == 1
+    stats = cache.cache_stats()
+    assert (stats["misses"], stats["coalesced"]) == (1, 7)
+
+def test_load_error_reaches_waiting_callers_and_is_not_cached():
+    release = threading.Event()
+    def failing():
+        release.wait(5)
+        raise RuntimeError("database down")
+
+    errors = []
+    def call():
+        try:
+            get_or_load("flaky", failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache.cache_stats()["coalesced"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["database down"] * 3
+    assert cache.cache_stats()["load_errors"] == 1
+    assert get_or_load("flaky", lambda: "recovered") == "recovered"
+
+def test_cached_ignores_sessions_and_invalidates():
+    calls = []
+
+    @cached("test:catalog", ttl=60)
+    def load_catalog(db, tenant_id):
+        calls.append(tenant_id)
+        return [f"course of {tenant_id}"]
+
+    assert load_catalog(Session(), "north") == ["course of north"]
+    # Another session, same key
+    assert load_catalog(Session(), "north") == ["course of north"]
+    assert load_catalog(Session(), "south") == ["course of south"]
+    assert calls == ["north", "south"]
+
+    load_catalog.invalidate("north")
+    load_catalog(Session(), "north")
+    load_catalog(Session(), "south")
+    assert calls == ["north", "south", "north"]
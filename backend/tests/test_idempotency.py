@@ -0,0 +1,134 @@
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+import idempotency
+from auth import create_access_token
+from database import SessionLocal
+from idempotency import IdempotencyMiddleware
+from models import IdempotencyKey
+from rate_limit import RouteTable
+
+# The middleware wraps a small app whose handlers count how often they actually run
+
+calls = []
+
+app = FastAPI()
+app.add_middleware(IdempotencyMiddleware)
+
+@app.post("/orders")
+async def create_order(request: Request):
+    calls.append(await request.json())
+    return {"order": len(calls)}
+
+@app.post("/broken")
+async def broken():
+    calls.append("broken")
+    raise HTTPException(status_code=503, detail="Try again")
+
+@pytest.fixture(autouse=True)
+def fresh_keys(monkeypatch):
+    monkeypatch.setattr(idempotency, "_routes", RouteTable({"POST /orders": 3600, "POST /broken": 3600}))
+    calls.clear()
+    idempotency._responses.clear()
+    db = SessionLocal()
+    db.query(IdempotencyKey).delete()
+    db.commit()
+    db.close()
+    yield
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+HEADERS = {"Authorization": "Bearer " + create_access_token({"sub": "buyer", "user_id": 41, "tenant": "default"})}
+
+def keyed(key: str) -> dict:
+    return {**HEADERS, "Idempotency-Key": key}
+
+def stored_key(route: str, key: str) -> bytes:
+    return hashlib.sha256(f"default\0{41}\0{route}\0".encode() + key.encode()).digest()[:16]
+
+def key_rows() -> list:
+    db = SessionLocal()
+    try:
+        return db.query(IdempotencyKey).all()
+    finally:
+        db.close()
+
+def test_retry_replays_the_stored_response(client):
+    first = client.post("/orders", json={"item": 1}, headers=keyed("k1"))
+    retry = client.post("/orders", json={"item": 1}, headers=keyed("k1"))
+    assert retry.json() == first.json() == {"order": 1}
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert len(calls) == 1
+
+def test_replay_survives_a_process_restart(client):
+    client.post("/orders", json={"item": 1}, headers=keyed("k1"))
+    idempotency._responses.clear()
+    retry = client.post("/orders", json={"item": 1}, headers=keyed("k1"))
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert len(calls) == 1
+
+def test_requests_without_a_key_always_run(client):
+    client.post("/orders", json={"item": 1}, headers=HEADERS)
+    client.post("/orders", json={"item": 1}, headers=HEADERS)
+    assert len(calls) == 2
+    assert key_rows() == []
+
+def test_same_key_with_a_different_body_is_rejected(client):
+    client.post("/orders", json={"item": 1}, headers=keyed("k1"))
+    response = client.post("/orders", json={"item": 2}, headers=keyed("k1"))
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+def test_retry_while_the_original_runs_elsewhere_gets_409(client):
+    # Another worker claimed the key and hasn't finished
+    assert idempotency.claim(stored_key("POST /orders", "k1"), hashlib.sha256(b'{"item":1}').digest()[:16]) is None
+    response = client.post("/orders", json={"item": 1}, headers=keyed("k1"))
+    assert response.status_code == 409
+    assert response.headers["retry-after"] == "1"
+    assert calls == []
+
+def test_claim_of_a_dead_worker_expires_after_the_lease(client, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LEASE_SECONDS", 0)
+    idempotency.claim(stored_key("POST /orders", "k1"), b"\0" * 16)
+    response = client.post("/orders", json={"item": 1}, headers=keyed("k1"))
+    assert response.status_code == 200
+    assert len(calls) == 1
+
+def test_completed_response_is_kept_for_the_route_ttl(client):
+    before = datetime.now(timezone.utc)
+    client.post("/orders", json={"item": 1}, headers=keyed("k1"))
+    [row] = key_rows()
+    expires_at = row.expires_at if row.expires_at.tzinfo else row.expires_at.replace(tzinfo=timezone.utc)
+    assert expires_at >= before + timedelta(seconds=3600 - 5)
+    assert row.status_code == 200
+
+def test_failed_request_releases_its_key(client):
+    first = client.post("/broken", json={}, headers=keyed("k1"))
+    retry = client.post("/broken", json={}, headers=keyed("k1"))
+    assert (first.status_code, retry.status_code) == (503, 503)
+    assert "idempotent-replayed" not in retry.headers
+    assert len(calls) == 2
+    assert key_rows() == []
+
+def test_purger_deletes_expired_keys(monkeypatch):
+    db = SessionLocal()
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        IdempotencyKey(key=b"expired".ljust(16, b"\0"), request_hash=b"\0" * 16, expires_at=now - timedelta(seconds=1)),
+        IdempotencyKey(key=b"current".ljust(16, b"\0"), request_hash=b"\0" * 16, expires_at=now + timedelta(hours=1)),
+    ])
+    db.commit()
+    db.close()
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_PURGE_SECONDS", 0.01)
+    idempotency.start_idempotency_purger()
+    deadline = time.monotonic() + 5
+    while len(key_rows()) > 1 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert [row.key.rstrip(b"\0") for row in key_rows()] == [b"current"]
@@ -0,0 +1,147 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cache
+import main
+from auth import create_access_token, get_password_hash
+from database import SessionLocal
+from models import Attendance, Course, CourseStatus, CourseVideo, Progress, User
+
+# Budgeted routes run against seeded data: enough students, videos and days that a
+# per-row query would repeat past N_PLUS_ONE_THRESHOLD and fail the test.
+
+STUDENTS = 12
+VIDEOS = 8
+DAYS = 7
+
+@pytest.fixture(scope="module")
+def seeded():
+    db = SessionLocal()
+    password = get_password_hash("pw")
+    admin = User(name="Admin", email="admin@school.test", user_name="admin", password=password, role="admin")
+    students = [
+        User(name=f"Student {n}", email=f"s{n}@school.test", user_name=f"s{n}", password=password, role="student")
+        for n in range(STUDENTS)
+    ]
+    db.add_all([admin, *students])
+    course = Course(course_title="Algebra", link="https://www.youtube.com/playlist?list=PLALGEBRA")
+    db.add(course)
+    db.flush()
+    videos = [
+        CourseVideo(course_id=course.id, title=f"Lecture {n}", video_link=f"algebra{n:04d}", duration_seconds=600)
+        for n in range(VIDEOS)
+    ]
+    db.add_all(videos)
+    db.flush()
+    today = date.today()
+    for student in students:
+        db.add(CourseStatus(user_id=student.id, course_id=course.id, enrolled=True))
+        for offset in range(1, DAYS + 1):
+            day = today - timedelta(days=offset)
+            db.add(Attendance(user_id=student.id, date=day, total_seconds=300, status="present" if offset % 2 else "absent"))
+            for video in videos[:3]:
+                db.add(Progress(user_id=student.id, video_id=video.id, date=day, start_time=time(9), end_time=time(9, 5), watch_seconds=100))
+    db.commit()
+    data = {
+        "course_id": course.id,
+        "video_ids": [video.id for video in videos],
+        "admin": token_headers(admin),
+        "students": [token_headers(student) for student in students],
+    }
+    db.close()
+    return data
+
+def token_headers(user: User) -> dict:
+    token = create_access_token({"sub": user.user_name, "user_id": user.id, "tenant": user.tenant_id})
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture
+def client(seeded):
+    # Cold caches: every request pays its full query cost
+    cache.backend.clear()
+    return TestClient(main.app)
+
+def checked(reports: list, route: str) -> dict:
+    """The report for the request to `route` (proves the request was measured)"""
+    matching = [report for report in reports if report["route"] == route]
+    assert matching, f"no query report for {route}"
+    return matching[-1]
+
+@pytest.mark.parametrize("path", ["/courses", "/courses/{course_id}/videos"])
+def test_catalog(client, seeded, query_reports, path):
+    response = client.get(path.format(course_id=seeded["course_id"]), headers=seeded["students"][0])
+    assert response.status_code == 200
+    checked(query_reports, f"GET {path}")
+
+@pytest.mark.parametrize("prefix", ["/attendance", "/progress/attendance"])
+@pytest.mark.parametrize("path", ["/me", "/today"])
+def test_student_attendance(client, seeded, query_reports, prefix, path):
+    client.post("/progress", json={"video_id": seeded["video_ids"][0], "start_time": "09:00:00"}, headers=seeded["students"][1])
+    response = client.get(prefix + path, headers=seeded["students"][1])
+    assert response.status_code == 200
+    report = checked(query_reports, f"GET {prefix}{path}")
+    assert report["budget"] == 3
+
+@pytest.mark.parametrize("prefix", ["/attendance", "/progress/attendance"])
+def test_attendance_by_date(client, seeded, query_reports, prefix):
+    day = date.today() - timedelta(days=1)
+    response = client.get(f"{prefix}/date/{day.isoformat()}", headers=seeded["admin"])
+    assert response.status_code == 200
+    assert len(response.json()) == STUDENTS
+    report = checked(query_reports, f"GET {prefix}/date/{{attendance_date}}")
+    assert report["budget"] == 8
+
+@pytest.mark.parametrize("path", ["/auth/users", "/auth/users/students"])
+def test_user_listings(client, seeded, query_reports, path):
+    response = client.get(path, headers=seeded["admin"])
+    assert response.status_code == 200
+    assert len(response.json()) >= STUDENTS
+    checked(query_reports, f"GET {path}")
+
+def test_heartbeats(client, seeded, query_reports):
+    headers = seeded["students"][2]
+    video_id = seeded["video_ids"][1]
+    responses = [
+        client.post("/progress", json={"video_id": video_id, "start_time": datetime.now().strftime("%H:%M:%S")}, headers=headers),
+        client.post("/progress", json={"video_id": video_id, "position_start": 0, "position_end": 4}, headers=headers),
+        client.post("/progress", json={"video_id": video_id, "position_start": 0, "position_end": 4}, headers=headers),
+    ]
+    assert [response.status_code for response in responses] == [201, 201, 201]
+    assert len([report for report in query_reports if report["route"] == "POST /progress"]) == 3
+
+def test_first_present_heartbeat(client, seeded, query_reports, monkeypatch):
+    # The heartbeat that turns the day present also rebuilds the student's streaks
+    import attendance_service
+    monkeypatch.setattr(attendance_service, "MINIMUM_ATTENDANCE_SECONDS", 1)
+    headers = seeded["students"][3]
+    response = client.post("/progress", json={"video_id": seeded["video_ids"][2], "watchtime_seconds": 3}, headers=headers)
+    assert response.status_code == 201
+    assert client.get("/attendance/today", headers=headers).json()["status"] == "present"
+    checked(query_reports, "POST /progress")
+
+class FakeYoutubeDL:
+    """yt_dlp stand-in returning a 25-video flat playlist without network access"""
+    def __init__(self, options):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def extract_info(self, url, download=False):
+        entries = [{"id": f"vid{n:08d}", "title": f"Part {n}", "duration": 300.4} for n in range(25)]
+        return {"title": "Geometry", "entries": entries}
+
+def test_youtube_playlist(client, seeded, query_reports, monkeypatch):
+    import video_service
+    monkeypatch.setattr(video_service.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    response = client.post(
+        "/videos/youtube-playlist",
+        json={"playlist_url": "https://www.youtube.com/playlist?list=PLGEOMETRY"},
+        headers=seeded["admin"]
+    )
+    assert response.status_code == 200
+    assert response.json()["video_count"] == 25
+    assert response.json()["total_duration_seconds"] == 25 * 300
+    checked(query_reports, "POST /videos/youtube-playlist")
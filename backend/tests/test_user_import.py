@@ -0,0 +1,113 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+
+import auth_service
+import main
+from auth import BCRYPT_ROUNDS, IMPORT_BCRYPT_ROUNDS, create_access_token, get_password_hash
+from auth_service import detect_role, hash_import_passwords, parse_import_rows
+from database import SessionLocal
+from models import User
+
+CSV_HEADER = "name,email,user_name,password,role\n"
+
+def test_parse_csv_with_byte_order_mark():
+    rows = parse_import_rows(("﻿" + CSV_HEADER + "Ada,ada@school.edu,ada,pw,\n").encode(), "roster.csv", "text/csv")
+    assert rows == [{"name": "Ada", "email": "ada@school.edu", "user_name": "ada", "password": "pw", "role": ""}]
+
+def test_parse_ndjson_keeps_slots_for_bad_lines():
+    raw = b'{"name": "Ada"}\n\nnot json\n{"name": "Bob"}\n'
+    assert parse_import_rows(raw, "roster.ndjson") == [{"name": "Ada"}, None, {"name": "Bob"}]
+    assert parse_import_rows(raw, "upload", "application/x-ndjson")[1] is None
+
+def test_detect_role():
+    assert detect_role("ada@school.edu") == "student"
+    assert detect_role("ada@school.edu", "student") == "student"
+    assert detect_role("Admin.Office@school.edu", "student") == "admin"
+    assert detect_role("ada@school.edu", "teacher") == "teacher"
+
+def test_import_hashes_verify_and_are_upgraded_on_login():
+    [hashed] = hash_import_passwords(["secret"])
+    assert CryptContext(schemes=["bcrypt"]).verify("secret", hashed)
+    assert f"$2b${IMPORT_BCRYPT_ROUNDS:02d}$" in hashed
+    assert IMPORT_BCRYPT_ROUNDS < BCRYPT_ROUNDS
+
+def test_hash_pool_uses_spawned_workers(monkeypatch):
+    monkeypatch.setattr(auth_service.os, "cpu_count", lambda: 2)
+    monkeypatch.setattr(auth_service, "_hash_pool", None)
+    hashed = hash_import_passwords(["one", "two", "three"])
+    pool = auth_service._hash_pool
+    try:
+        assert pool._mp_context.get_start_method() == "spawn"
+        assert [CryptContext(schemes=["bcrypt"]).verify(password, value) for password, value in zip(["one", "two", "three"], hashed)] == [True] * 3
+    finally:
+        pool.shutdown()
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    db = SessionLocal()
+    admin = User(name="Registrar", email="registrar-admin@school.edu", user_name="registrar", password=get_password_hash("pw"), role="admin")
+    existing = User(name="Taken", email="Taken@School.edu", user_name="taken", password=get_password_hash("pw"), role="student")
+    db.add_all([admin, existing])
+    db.commit()
+    token = create_access_token({"sub": admin.user_name, "user_id": admin.id, "tenant": admin.tenant_id})
+    db.close()
+    return {"Authorization": f"Bearer {token}"}
+
+def upload(client, headers, content: str, filename: str = "roster.csv"):
+    return client.post("/auth/users/import", files={"file": (filename, content.encode(), "text/csv")}, headers=headers)
+
+def test_import_reports_each_bad_row(admin_headers):
+    client = TestClient(main.app)
+    content = CSV_HEADER + "\n".join([
+        "Ann,ann@school.edu,ann,pw,",                     # 1 created
+        "Ann Again,ANN@school.edu,ann2,pw,",              # 2 duplicate email in file (case-insensitive)
+        "Ann Twin,twin@school.edu,ann,pw,",               # 3 duplicate user name in file
+        "Other,taken@school.edu,other,pw,",               # 4 email already registered
+        "Someone,someone@school.edu,taken,pw,",           # 5 user name already registered
+        "Broken,not-an-email,broken,pw,",                  # 6 invalid email
+        "Ragged,ragged@school.edu,ragged,pw,,extra",      # 7 malformed
+        "Office,office-admin@school.edu,office,pw,",      # 8 created as admin
+        "Tutor,tutor@school.edu,tutor,pw,teacher",        # 9 created with its role
+    ]) + "\n"
+    response = upload(client, admin_headers, content)
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["total_rows"], body["created"]) == (9, 3)
+    assert [(error["row"], error["detail"]) for error in body["errors"]] == [
+        (2, "Duplicate email in file"),
+        (3, "Duplicate username in file"),
+        (4, "Email already registered"),
+        (5, "Username already taken"),
+        (6, "Invalid fields: email"),
+        (7, "Malformed row"),
+    ]
+    db = SessionLocal()
+    try:
+        roles = dict(db.query(User.user_name, User.role).filter(User.user_name.in_(["ann", "office", "tutor"])))
+    finally:
+        db.close()
+    assert roles == {"ann": "student", "office": "admin", "tutor": "teacher"}
+
+def test_imported_user_logs_in_and_gets_a_full_cost_hash(admin_headers):
+    client = TestClient(main.app)
+    row = {"name": "Lee", "email": "lee@school.edu", "user_name": "lee", "password": "secret"}
+    assert upload(client, admin_headers, json.dumps(row) + "\n", "roster.ndjson").json()["created"] == 1
+    assert client.post("/auth/login", json={"user_name": "lee", "password": "secret"}).status_code == 200
+    db = SessionLocal()
+    try:
+        hashed = db.query(User.password).filter(User.user_name == "lee").scalar()
+    finally:
+        db.close()
+    assert f"$2b${BCRYPT_ROUNDS}$" in hashed
+
+def test_import_requires_an_admin(admin_headers):
+    client = TestClient(main.app)
+    db = SessionLocal()
+    student = db.query(User).filter(User.user_name == "taken").one()
+    token = create_access_token({"sub": student.user_name, "user_id": student.id, "tenant": student.tenant_id})
+    db.close()
+    response = upload(client, {"Authorization": f"Bearer {token}"}, CSV_HEADER + "X,x@school.edu,x,pw,\n")
+    assert response.status_code == 403
@@ -0,0 +1,129 @@
+from datetime import date, datetime, time, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import attendance_service
+import main
+from attendance_service import apply_heartbeat
+from auth import create_access_token, get_password_hash
+from database import SessionLocal
+from models import Attendance, Course, CourseVideo, Progress, User
+from watch_intervals import covered_seconds, dump_intervals, load_intervals, merge_interval
+
+NOW = datetime(2026, 3, 2, 10, 0, tzinfo=timezone.utc)
+
+def merged(*segments):
+    intervals = []
+    for start, end in segments:
+        intervals, _ = merge_interval(intervals, start, end)
+    return intervals
+
+def test_merge_keeps_disjoint_intervals_sorted():
+    assert merged((50, 60), (0, 10), (20, 30)) == [[0, 10], [20, 30], [50, 60]]
+
+def test_merge_joins_overlapping_and_touching_ranges():
+    assert merged((0, 10), (5, 20)) == [[0, 20]]
+    assert merged((0, 10), (10, 20)) == [[0, 20]]
+    assert merged((0, 10), (20, 30), (40, 50), (5, 45)) == [[0, 50]]
+
+def test_merge_reports_covered_ranges_unchanged():
+    intervals = merged((0, 30))
+    assert merge_interval(intervals, 5, 25) == ([[0, 30]], False)
+    assert merge_interval(intervals, 0, 30) == ([[0, 30]], False)
+
+def test_merge_ignores_empty_and_reversed_ranges():
+    assert merge_interval([[0, 10]], 20, 20) == ([[0, 10]], False)
+    assert merge_interval([[0, 10]], 30, 20) == ([[0, 10]], False)
+
+def test_covered_seconds_counts_the_union():
+    assert covered_seconds(merged((0, 10), (5, 15), (100, 101.5))) == 16.5
+    assert covered_seconds([]) == 0
+
+def test_intervals_round_trip_and_tolerate_bad_json():
+    intervals = merged((0, 1.23456), (5, 6))
+    assert load_intervals(dump_intervals(intervals)) == [[0, 1.235], [5, 6]]
+    assert load_intervals(None) == []
+    assert load_intervals("not json") == []
+
+def test_replayed_and_overlapping_segments_count_once():
+    # Two tabs on the same video report overlapping segments, then one replays
+    progress = Progress()
+    assert apply_heartbeat(progress, segments=[(0, 40)])
+    assert apply_heartbeat(progress, segments=[(30, 60)])
+    assert not apply_heartbeat(progress, segments=[(0, 60)])
+    assert progress.watch_seconds == 60
+
+def test_segments_are_clamped_to_the_video_duration():
+    progress = Progress()
+    apply_heartbeat(progress, segments=[(550, 900)], duration_seconds=600)
+    assert progress.watch_seconds == 50
+    assert not apply_heartbeat(progress, segments=[(700, 800)], duration_seconds=600)
+
+def test_segment_credit_is_capped_by_the_server_clock():
+    progress = Progress()
+    # Playback started at NOW; ten seconds later a heartbeat claims an hour
+    apply_heartbeat(progress, start_time_obj=time(10), heartbeat_at=NOW)
+    apply_heartbeat(progress, segments=[(0, 3600)], heartbeat_at=NOW + timedelta(seconds=10))
+    assert progress.watch_seconds == 10 + attendance_service.HEARTBEAT_GRACE_SECONDS
+    assert progress.credited_until == NOW + timedelta(seconds=progress.watch_seconds)
+
+def test_delta_credit_is_capped_by_the_server_clock():
+    progress = Progress()
+    apply_heartbeat(progress, start_time_obj=time(10), heartbeat_at=NOW)
+    apply_heartbeat(progress, watch_seconds_delta=36000, heartbeat_at=NOW + timedelta(seconds=20))
+    assert progress.watch_seconds == 20 + attendance_service.HEARTBEAT_GRACE_SECONDS
+
+def test_idle_time_before_playback_cannot_be_claimed():
+    progress = Progress(credited_until=NOW)
+    apply_heartbeat(progress, start_time_obj=time(11), heartbeat_at=NOW + timedelta(hours=1))
+    apply_heartbeat(progress, segments=[(0, 3600)], heartbeat_at=NOW + timedelta(hours=1, seconds=5))
+    assert progress.watch_seconds == 5 + attendance_service.HEARTBEAT_GRACE_SECONDS
+
+def test_segments_do_not_discard_delta_credit():
+    progress = Progress()
+    apply_heartbeat(progress, watch_seconds_delta=300)
+    apply_heartbeat(progress, segments=[(0, 10)])
+    assert progress.watch_seconds == 310
+    apply_heartbeat(progress, watch_seconds_delta=20)
+    apply_heartbeat(progress, segments=[(5, 15)])
+    assert progress.watch_seconds == 335
+    assert progress.delta_seconds == 320
+
+def test_rows_from_before_delta_seconds_keep_their_credit():
+    progress = Progress(watch_seconds=250, watched_intervals=dump_intervals([[0, 50]]))
+    apply_heartbeat(progress, segments=[(100, 110)])
+    assert progress.delta_seconds == 200
+    assert progress.watch_seconds == 260
+
+@pytest.fixture(scope="module")
+def student():
+    db = SessionLocal()
+    user = User(name="Mixed", email="mixed@school.test", user_name="mixed", password=get_password_hash("pw"), role="student")
+    course = Course(course_title="Mixed modes", link="https://www.youtube.com/playlist?list=PLMIXED")
+    db.add_all([user, course])
+    db.flush()
+    video = CourseVideo(course_id=course.id, title="Lecture", video_link="mixed000001", duration_seconds=3600)
+    db.add(video)
+    db.commit()
+    token = create_access_token({"sub": user.user_name, "user_id": user.id, "tenant": user.tenant_id})
+    data = {"user_id": user.id, "video_id": video.id, "headers": {"Authorization": f"Bearer {token}"}}
+    db.close()
+    return data
+
+def test_mixed_mode_heartbeats_add_up(student, monkeypatch):
+    # A pause after a backward seek sends only a delta; later segments must not undo it
+    monkeypatch.setattr(attendance_service, "HEARTBEAT_GRACE_SECONDS", 3600)
+    client = TestClient(main.app)
+    post = lambda body: client.post("/progress", json={"video_id": student["video_id"], **body}, headers=student["headers"])
+    assert post({"start_time": "09:00:00"}).status_code == 201
+    assert post({"watchtime_seconds": 300}).status_code == 201
+    assert post({"position_start": 0, "position_end": 10}).status_code == 201
+    db = SessionLocal()
+    try:
+        progress = db.query(Progress).filter(Progress.user_id == student["user_id"], Progress.date == date.today()).one()
+        attendance = db.query(Attendance).filter(Attendance.user_id == student["user_id"], Attendance.date == date.today()).one()
+        assert progress.watch_seconds == 310
+        assert attendance.total_seconds == 310
+    finally:
+        db.close()
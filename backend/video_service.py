@@ -4,8 +4,15 @@ from models import CourseVideo, Course, User
 from schemas import CourseVideoResponse, YouTubePlaylistRequest, CourseResponse
 from database import get_db
 from dependencies import get_current_user
+from course_service import load_catalog
+from search_service import invalidate_search_index
+from metrics import PLAYLIST_EXTRACT_SECONDS
+from serialization import youtube_video_id
+from sqlalchemy import update, bindparam, insert
+from database import engine
 import yt_dlp
 import re
+import time
 
 router = APIRouter(prefix="/videos", tags=["Videos"])
 
@@ -73,12 +80,15 @@ def add_youtube_playlist(
         
         last_error = None
         for attempt_opts in extraction_attempts:
+            extract_started = time.perf_counter()
             try:
                 with yt_dlp.YoutubeDL(attempt_opts) as ydl:
                     playlist_info = ydl.extract_info(playlist_url, download=False)
-                    if playlist_info:
-                        break
+                PLAYLIST_EXTRACT_SECONDS.labels("success" if playlist_info else "empty").observe(time.perf_counter() - extract_started)
+                if playlist_info:
+                    break
             except Exception as e:
+                PLAYLIST_EXTRACT_SECONDS.labels("error").observe(time.perf_counter() - extract_started)
                 last_error = e
                 # If it's a 403 error, try next method
                 if '403' in str(e) or 'Forbidden' in str(e):
@@ -101,8 +111,11 @@ def add_youtube_playlist(
             playlist_title = playlist_info.get('title', 'Untitled Playlist')
             
             new_course = Course(
+                tenant_id=current_user.tenant_id,
                 course_title=playlist_title,
-                link=playlist_url
+                link=playlist_url,
+                video_count=0,
+                total_duration_seconds=0
             )
             db.add(new_course)
             db.flush()
@@ -115,35 +128,40 @@ def add_youtube_playlist(
                     detail="No videos found in playlist. The playlist may be empty, private, or the URL may be incorrect."
                 )
             
+            rows = []
             for entry in entries:
                 if entry:
                     # With extract_flat=True, we get basic info
                     video_title = entry.get('title', 'Untitled Video')
+                    # Only the YouTube id is stored; clients and responses rebuild the watch URL
                     video_id = entry.get('id')
-                    
-                    # Try to get video URL from various sources
-                    if video_id:
-                        video_url = f"https://www.youtube.com/watch?v={video_id}"
-                    else:
+                    if not video_id:
                         # Try to extract from URL or webpage_url
                         webpage_url = entry.get('webpage_url') or entry.get('url') or ''
                         if 'youtube.com/watch' in webpage_url or 'youtu.be' in webpage_url:
-                            video_url = webpage_url.split('&')[0].split('?si=')[0]
-                        else:
-                            # Skip if we can't get a valid URL
-                            continue
+                            video_id = youtube_video_id(webpage_url)
                     
-                    # Only add if we have a valid video URL
-                    if video_url:
-                        new_video = CourseVideo(
-                            course_id=new_course.id,
-                            title=video_title,
-                            video_link=video_url
-                        )
-                        db.add(new_video)
+                    # Skip if we can't get a valid video id
+                    if video_id:
+                        # Flat playlist entries carry the duration in seconds (missing for some videos)
+                        duration = entry.get('duration')
+                        rows.append({
+                            "course_id": new_course.id,
+                            "title": video_title,
+                            "video_link": video_id,
+                            "duration_seconds": round(duration) if duration else None
+                        })
+            
+            # One multi-row INSERT for the whole playlist instead of one per video
+            if rows:
+                db.execute(insert(CourseVideo), rows)
+            new_course.video_count = len(rows)
+            new_course.total_duration_seconds = sum(row["duration_seconds"] or 0 for row in rows)
             
             db.commit()
             db.refresh(new_course)
+            load_catalog.invalidate(current_user.tenant_id)
+            invalidate_search_index(current_user.tenant_id)
             
             return new_course
             
@@ -178,3 +196,23 @@ def add_youtube_playlist(
 @router.get("/health")
 def health_check():
     return {"status": "healthy", "service": "video-service"}
+
+def shorten_video_links(bind=engine) -> int:
+    """Rewrite video links stored as full YouTube URLs (before ids were stored) to bare ids"""
+    with bind.begin() as connection:
+        rows = connection.execute(
+            CourseVideo.__table__.select().with_only_columns(CourseVideo.id, CourseVideo.video_link)
+            .where(CourseVideo.video_link.like("%://%"))
+        ).all()
+        changes = [
+            {"row_id": id, "video_id": youtube_video_id(video_link)}
+            for id, video_link in rows if youtube_video_id(video_link)
+        ]
+        if changes:
+            connection.execute(
+                update(CourseVideo.__table__)
+                .where(CourseVideo.__table__.c.id == bindparam("row_id"))
+                .values(video_link=bindparam("video_id")),
+                changes
+            )
+    return len(changes)
@@ -0,0 +1,46 @@
+# Watched ranges of a video (playhead seconds) are kept as a sorted list of
+# disjoint [start, end] pairs; watch time is the length of their union, so
+# replays and duplicate heartbeats from several tabs are only counted once.
+from bisect import bisect_left, bisect_right
+import json
+
+def load_intervals(raw):
+    """Decode intervals stored on a progress record (JSON text) into a list of [start, end]"""
+    if not raw:
+        return []
+    try:
+        return [[float(start), float(end)] for start, end in json.loads(raw)]
+    except (ValueError, TypeError):
+        return []
+
+def dump_intervals(intervals) -> str:
+    """Encode intervals compactly for storage"""
+    return json.dumps([[round(start, 3), round(end, 3)] for start, end in intervals], separators=(",", ":"))
+
+def merge_interval(intervals, start: float, end: float):
+    """Insert [start, end] into sorted disjoint intervals, merging overlapping/touching ranges.
+
+    Returns (intervals, changed) where changed is False if the range was already covered.
+    """
+    if end <= start:
+        return intervals, False
+
+    starts = [interval[0] for interval in intervals]
+    ends = [interval[1] for interval in intervals]
+    # First interval that ends at or after start, and first interval that starts after end
+    lo = bisect_left(ends, start)
+    hi = bisect_right(starts, end)
+
+    if lo < hi and intervals[lo][0] <= start and intervals[hi - 1][1] >= end and hi - lo == 1:
+        # Fully contained in an existing interval (duplicate heartbeat)
+        return intervals, False
+
+    if lo < hi:
+        start = min(start, intervals[lo][0])
+        end = max(end, intervals[hi - 1][1])
+
+    return intervals[:lo] + [[start, end]] + intervals[hi:], True
+
+def covered_seconds(intervals) -> float:
+    """Total length of the union of the intervals"""
+    return sum(end - start for start, end in intervals)
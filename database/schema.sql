@@ -1,9 +1,10 @@
 -- Create User table
 CREATE TABLE "user" (
     id SERIAL PRIMARY KEY,
+    tenant_id VARCHAR(50) NOT NULL DEFAULT 'default',  -- School the row belongs to
     name VARCHAR(255) NOT NULL,
-    email VARCHAR(255) NOT NULL UNIQUE,
-    user_name VARCHAR(100) NOT NULL UNIQUE,
+    email VARCHAR(255) NOT NULL,
+    user_name VARCHAR(100) NOT NULL,
     password VARCHAR(255) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     role VARCHAR(50) default 'student'
@@ -12,32 +13,45 @@ CREATE TABLE "user" (
 -- Create Course table
 CREATE TABLE course (
     id SERIAL PRIMARY KEY,
+    tenant_id VARCHAR(50) NOT NULL DEFAULT 'default',
     course_title VARCHAR(255) NOT NULL,
-    link TEXT
+    link TEXT,
+    -- Denormalized counters (maintained by the API, reconciled periodically)
+    video_count INTEGER NOT NULL DEFAULT 0,
+    enrolled_count INTEGER NOT NULL DEFAULT 0,
+    total_duration_seconds INTEGER NOT NULL DEFAULT 0
 );
 
--- Create Attendance table
+-- Create Attendance table (range-partitioned by month on date;
+-- monthly partitions are created by backend/partitions.py)
 CREATE TABLE attendance (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
+    tenant_id VARCHAR(50) NOT NULL DEFAULT 'default',
     user_ID INTEGER NOT NULL,
     date DATE NOT NULL,
-    total_time INTERVAL,
+    total_seconds INTEGER NOT NULL DEFAULT 0,  -- Sum of the day's watch_seconds
     status VARCHAR(50),
+    PRIMARY KEY (id, date),
     CONSTRAINT fk_attendance_user 
         FOREIGN KEY (user_ID) 
         REFERENCES "user"(id) 
         ON DELETE CASCADE
-);
+) PARTITION BY RANGE (date);
 
--- Create Progress table
+-- Create Progress table (range-partitioned by month on date)
 CREATE TABLE progress (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
+    tenant_id VARCHAR(50) NOT NULL DEFAULT 'default',
     user_id INTEGER NOT NULL,
     video_id INTEGER NOT NULL,
     date DATE NOT NULL,
     start_time TIME,
     end_time TIME,
-    watch_time INTERVAL,
+    watch_seconds INTEGER NOT NULL DEFAULT 0,  -- Served as watch_time HH:MM:SS
+    watched_intervals TEXT,
+    credited_until TIMESTAMPTZ,  -- Server time watch credit has reached
+    delta_seconds INTEGER,  -- Watch time credited without a segment (added to the segment union)
+    PRIMARY KEY (id, date),
     CONSTRAINT fk_progress_user 
         FOREIGN KEY (user_id) 
         REFERENCES "user"(id) 
@@ -45,12 +59,15 @@ CREATE TABLE progress (
     CONSTRAINT fk_progress_video 
         FOREIGN KEY (video_id) 
         REFERENCES course_video(id) 
-        ON DELETE CASCADE
-);
+        ON DELETE CASCADE,
+    CONSTRAINT unique_progress_user_video_date 
+        UNIQUE (user_id, video_id, date)
+) PARTITION BY RANGE (date);
 
 -- Create Course_Status table
 CREATE TABLE course_status (
     id SERIAL PRIMARY KEY,
+    tenant_id VARCHAR(50) NOT NULL DEFAULT 'default',
     user_id INTEGER NOT NULL,
     course_ID INTEGER NOT NULL,
     enrolled BOOLEAN DEFAULT FALSE,
@@ -72,13 +89,74 @@ CREATE TABLE course_video (
     id SERIAL PRIMARY KEY,
     course_id INTEGER NOT NULL,
     title VARCHAR(255) NOT NULL,
-    video_link TEXT,
+    video_link TEXT,  -- YouTube video id (full URLs from older imports are shortened at startup)
+    duration_seconds INTEGER,  -- From the playlist metadata at import
     CONSTRAINT fk_course_video_course 
         FOREIGN KEY (course_id) 
         REFERENCES course(id) 
         ON DELETE CASCADE
 );
 
+-- Create Attendance_Streak table (current/longest streaks per user)
+CREATE TABLE attendance_streak (
+    user_id INTEGER PRIMARY KEY,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    longest_streak INTEGER NOT NULL DEFAULT 0,
+    last_present_date DATE,
+    total_present_days INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT fk_attendance_streak_user 
+        FOREIGN KEY (user_id) 
+        REFERENCES "user"(id) 
+        ON DELETE CASCADE
+);
+
+-- Create Attendance_History table (one bitmap of present days per user and year)
+CREATE TABLE attendance_history (
+    user_id INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    present_bitmap BYTEA NOT NULL,
+    present_days INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, year),
+    CONSTRAINT fk_attendance_history_user 
+        FOREIGN KEY (user_id) 
+        REFERENCES "user"(id) 
+        ON DELETE CASCADE
+);
+
+-- Create Idempotency_Key table (stored responses for retried writes, purged after expiry)
+CREATE TABLE idempotency_key (
+    key BYTEA PRIMARY KEY,
+    request_hash BYTEA NOT NULL,
+    status_code SMALLINT,
+    content_type VARCHAR(100),
+    body BYTEA,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Create Progress_Event table (append-only heartbeat log, PROGRESS_WRITE_MODE=outbox)
+CREATE TABLE progress_event (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id VARCHAR(50) NOT NULL DEFAULT 'default',
+    txid BIGINT NOT NULL DEFAULT 0,
+    user_id INTEGER NOT NULL,
+    video_id INTEGER NOT NULL,
+    date DATE NOT NULL,
+    start_time TIME,
+    end_time TIME,
+    watch_seconds INTEGER,
+    position_start DOUBLE PRECISION,
+    position_end DOUBLE PRECISION,
+    recorded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create Projection_Checkpoint table (last progress_event applied to progress/attendance)
+CREATE TABLE projection_checkpoint (
+    name VARCHAR(50) PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT 0,
+    event_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for better query performance
 CREATE INDEX idx_attendance_user_id ON attendance(user_ID);
 CREATE INDEX idx_attendance_date ON attendance(date);
@@ -88,13 +166,32 @@ CREATE INDEX idx_progress_date ON progress(date);
 CREATE INDEX idx_course_status_user_id ON course_status(user_id);
 CREATE INDEX idx_course_status_course_id ON course_status(course_ID);
 CREATE INDEX idx_course_video_course_id ON course_video(course_id);
-CREATE INDEX idx_user_email ON "user"(email);
-CREATE INDEX idx_user_user_name ON "user"(user_name);
+-- Email and user name are unique per tenant (school), not across the deployment
+CREATE UNIQUE INDEX uq_user_tenant_email ON "user"(tenant_id, email);
+CREATE UNIQUE INDEX uq_user_tenant_user_name ON "user"(tenant_id, user_name);
+CREATE INDEX idx_user_tenant_role ON "user"(tenant_id, role);
+CREATE INDEX idx_course_tenant_id ON course(tenant_id);
+CREATE INDEX idx_course_status_tenant_id ON course_status(tenant_id);
+CREATE INDEX idx_progress_tenant_date ON progress(tenant_id, date);
+CREATE INDEX idx_attendance_tenant_date ON attendance(tenant_id, date);
+CREATE INDEX idx_idempotency_key_expires_at ON idempotency_key(expires_at);
+CREATE INDEX idx_progress_event_txid_id ON progress_event(txid, id);
+
+-- Full-text search on titles (generated tsvector columns, kept current on every insert/update)
+ALTER TABLE course ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (setweight(to_tsvector('simple', coalesce(course_title, '')), 'A')) STORED;
+ALTER TABLE course_video ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (setweight(to_tsvector('simple', coalesce(title, '')), 'B')) STORED;
+CREATE INDEX idx_course_search_vector ON course USING GIN (search_vector);
+CREATE INDEX idx_course_video_search_vector ON course_video USING GIN (search_vector);
 
 -- Add comments for documentation
 COMMENT ON TABLE "user" IS 'Stores user account information';
 COMMENT ON TABLE course IS 'Stores course information';
 COMMENT ON TABLE attendance IS 'Tracks user attendance records';
+COMMENT ON TABLE attendance_streak IS 'Precomputed attendance streaks per user';
+COMMENT ON TABLE attendance_history IS 'Yearly bitmaps of present days per user';
 COMMENT ON TABLE progress IS 'Tracks user progress on courses';
 COMMENT ON TABLE course_status IS 'Tracks user enrollment status for courses';
 COMMENT ON TABLE course_video IS 'Stores video information for courses';
+COMMENT ON TABLE progress_event IS 'Append-only log of progress heartbeats (outbox mode)';
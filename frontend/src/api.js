@@ -2,6 +2,8 @@ import axios from 'axios';
 
 // RIGHT: Use the env var or default to the real URL string
 const API_URL = process.env.REACT_APP_API_URL || "http://localhost:8000";
+// School (tenant) this build serves; signed-in requests use the tenant in their token
+const TENANT_ID = process.env.REACT_APP_TENANT_ID;
 
 const api = axios.create({
     baseURL: API_URL,
@@ -17,6 +19,9 @@ api.interceptors.request.use((config) => {
     if (token) {
         config.headers.Authorization = `Bearer ${token}`;
     }
+    if (TENANT_ID) {
+        config.headers['X-Tenant'] = TENANT_ID;
+    }
     return config;
 });
 
@@ -33,6 +38,48 @@ api.interceptors.response.use(
     }
 );
 
+// Listings are requested with ?compact=1: the API returns columns ({ id: [...], title: [...] })
+// instead of repeating field names per row, and videos carry only their YouTube id
+const YOUTUBE_WATCH_URL = 'https://www.youtube.com/watch?v=';
+
+const fromColumns = (data, fields) => {
+    const count = data[fields[0]] ? data[fields[0]].length : 0;
+    const rows = [];
+    for (let i = 0; i < count; i++) {
+        const row = {};
+        fields.forEach((field) => { row[field] = data[field][i]; });
+        rows.push(row);
+    }
+    return rows;
+};
+
+// Writes that are retried on timeout send an Idempotency-Key, so the server answers the
+// retry with the original response instead of registering or importing twice
+const newIdempotencyKey = () => (
+    window.crypto && window.crypto.randomUUID
+        ? window.crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+);
+
+const isTimeout = (error) => error.code === 'ECONNABORTED' || error.message === 'Network Error';
+
+const postIdempotent = async (url, data, config = {}) => {
+    const headers = { ...(config.headers || {}), 'Idempotency-Key': newIdempotencyKey() };
+    const request = () => api.post(url, data, { ...config, headers });
+    try {
+        return await request();
+    } catch (error) {
+        if (isTimeout(error)) {
+            return request();
+        }
+        throw error;
+    }
+};
+
+export const youtubeUrl = (videoId) => (
+    videoId && !videoId.includes('://') ? `${YOUTUBE_WATCH_URL}${videoId}` : videoId
+);
+
 // Auth Service API
 export const signup = async (userData) => {
     const response = await api.post('/auth/signup', userData);
@@ -50,8 +97,8 @@ export const getCurrentUser = async () => {
 };
 
 export const getAllStudents = async () => {
-    const response = await api.get('/auth/users/students');
-    return response.data;
+    const response = await api.get('/auth/users/students', { params: { compact: 1 } });
+    return fromColumns(response.data, ['id', 'name', 'email', 'user_name', 'role', 'created_at']);
 };
 
 // Course Service API
@@ -76,19 +123,29 @@ export const getCourseRegistration = async (courseId) => {
 };
 
 export const registerForCourse = async (courseId) => {
-    const response = await api.post(`/courses/${courseId}/register`);
+    const response = await postIdempotent(`/courses/${courseId}/register`);
+    return response.data;
+};
+
+// Search Service API
+export const searchCatalog = async (query, { limit = 50, offset = 0 } = {}) => {
+    const response = await api.get('/search', { params: { q: query, limit, offset } });
     return response.data;
 };
 
 // Video Service API
 export const getCourseVideos = async (courseId) => {
-    const response = await api.get(`/courses/${courseId}/videos`);
-    return response.data;
+    const response = await api.get(`/courses/${courseId}/videos`, { params: { compact: 1 } });
+    return fromColumns(response.data, ['id', 'title', 'video_id', 'duration_seconds']).map((video) => ({
+        ...video,
+        course_id: response.data.course_id,
+        video_link: youtubeUrl(video.video_id),
+    }));
 };
 
 export const addYouTubePlaylist = async (playlistUrl) => {
     // Use a longer timeout for playlist extraction (2 minutes)
-    const response = await api.post('/videos/youtube-playlist', {
+    const response = await postIdempotent('/videos/youtube-playlist', {
         playlist_url: playlistUrl,
     }, {
         timeout: 120000, // 2 minutes timeout for playlist extraction
@@ -97,9 +154,17 @@ export const addYouTubePlaylist = async (playlistUrl) => {
 };
 
 // Progress Service API
+// Heartbeats are safe to resend without a key: the server merges the same segment again
+// and caps credited time by its own clock
 export const trackProgress = async (progressData) => {
-    const response = await api.post('/progress', progressData);
-    return response.data;
+    try {
+        return (await api.post('/progress', progressData)).data;
+    } catch (error) {
+        if (isTimeout(error)) {
+            return (await api.post('/progress', progressData)).data;
+        }
+        throw error;
+    }
 };
 
 export const getVideoProgress = async (videoId) => {
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { Link } from 'react-router-dom';
-import { getCourses, addYouTubePlaylist, getCourseVideos, getCurrentUser, getCourseRegistration, registerForCourse } from '../api';
+import { getCourses, addYouTubePlaylist, getCourseVideos, getCurrentUser, getCourseRegistration, registerForCourse, searchCatalog } from '../api';
 
 const CourseCatalog = () => {
     const [courses, setCourses] = useState([]);
@@ -12,6 +12,7 @@ const CourseCatalog = () => {
     const [playlistUrl, setPlaylistUrl] = useState('');
     const [adding, setAdding] = useState(false);
     const [searchTerm, setSearchTerm] = useState('');
+    const [searchMatches, setSearchMatches] = useState(null);
     const [expandedCourses, setExpandedCourses] = useState([]);
     const [courseRegistrations, setCourseRegistrations] = useState({});
     const [registeringCourseId, setRegisteringCourseId] = useState(null);
@@ -243,6 +244,9 @@ const CourseCatalog = () => {
                 ...prev,
                 [courseId]: true
             }));
+            setCourses(prev => prev.map(course => (
+                course.id === courseId ? { ...course, enrolled_count: course.enrolled_count + 1 } : course
+            )));
         } catch (err) {
             console.error('Error registering for course:', err);
             alert(err.response?.data?.detail || 'Failed to register for course. Please try again.');
@@ -335,14 +339,52 @@ const CourseCatalog = () => {
         return `Dive deep into ${mainTopic} with this comprehensive course. Learn essential concepts, practical skills, and real-world applications through structured video tutorials designed for all skill levels.`;
     };
 
+    const formatDuration = (seconds) => {
+        const hours = Math.floor(seconds / 3600);
+        const minutes = Math.round((seconds % 3600) / 60);
+        return hours > 0 ? `${hours}h ${minutes}m` : `${minutes}m`;
+    };
+
     const handleSearchChange = (e) => {
         setSearchTerm(e.target.value);
     };
 
-    // Filter courses based on search term
-    const filteredCourses = courses.filter(course =>
-        course.course_title.toLowerCase().includes(searchTerm.toLowerCase())
-    );
+    // Search course and video titles on the server once typing pauses
+    useEffect(() => {
+        const query = searchTerm.trim();
+        if (!query) {
+            setSearchMatches(null);
+            return undefined;
+        }
+        let cancelled = false;
+        const timer = setTimeout(async () => {
+            try {
+                const data = await searchCatalog(query);
+                if (cancelled) return;
+                // Courses in rank order, whether the course itself or one of its videos matched
+                const ranked = [];
+                data.results.forEach((result) => {
+                    if (!ranked.includes(result.course_id)) ranked.push(result.course_id);
+                });
+                setSearchMatches(ranked);
+            } catch (err) {
+                if (!cancelled) setSearchMatches(null);
+            }
+        }, 250);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [searchTerm]);
+
+    // Filter courses based on search term (locally until server results arrive, or if search fails)
+    const filteredCourses = !searchTerm.trim()
+        ? courses
+        : searchMatches
+            ? searchMatches.map(id => courses.find(course => course.id === id)).filter(Boolean)
+            : courses.filter(course =>
+                course.course_title.toLowerCase().includes(searchTerm.toLowerCase())
+            );
 
 
     if (loading) {
@@ -479,6 +521,11 @@ const CourseCatalog = () => {
                                 </div>
                                 <div className="course-card-body">
                                     <h3 className="course-title">{course.course_title}</h3>
+                                    <p className="course-meta">
+                                        {course.video_count} videos
+                                        {course.total_duration_seconds > 0 && ` · ${formatDuration(course.total_duration_seconds)}`}
+                                        {` · ${course.enrolled_count} students enrolled`}
+                                    </p>
                                     {isExpanded && (
                                         <div
                                             className="course-description"
@@ -43,6 +43,7 @@ const CourseDetail = () => {
     const hasPlayedTodayRef = useRef(false);
     const hasPausedTodayRef = useRef(false);
     const sessionStartTimeRef = useRef(null);
+    const sessionStartPositionRef = useRef(null); // Playhead position (seconds) when the current play session started
     const selectedVideoRef = useRef(null);
 
     useEffect(() => {
@@ -227,6 +228,18 @@ const CourseDetail = () => {
         return endSeconds - startSeconds;
     };
 
+    // Helper function to read the current playhead position in seconds (null if the player isn't ready)
+    const getPlayerPosition = () => {
+        try {
+            if (youtubePlayerRef.current && youtubePlayerRef.current.getCurrentTime) {
+                return youtubePlayerRef.current.getCurrentTime();
+            }
+        } catch (e) {
+            // Player destroyed or not ready
+        }
+        return null;
+    };
+
     const saveProgress = useCallback(async (mode, watchTimeSeconds = null) => {
         if (!selectedVideoRef.current || !user || user.role !== 'student') return;
 
@@ -242,6 +255,7 @@ const CourseDetail = () => {
                 // Update both state and ref immediately
                 setSessionStartTime(currentTime);
                 sessionStartTimeRef.current = currentTime;
+                sessionStartPositionRef.current = getPlayerPosition();
             } else if (mode === 'pause_with_watchtime') {
                 // Send end_time and watchtime_seconds when video is paused
                 const startTime = sessionStartTimeRef.current;
@@ -265,9 +279,18 @@ const CourseDetail = () => {
                     }
                 }
 
+                // Send the watched segment so the server can de-duplicate replays
+                const startPosition = sessionStartPositionRef.current;
+                const endPosition = getPlayerPosition();
+                if (startPosition !== null && endPosition !== null && endPosition > startPosition) {
+                    progressData.position_start = startPosition;
+                    progressData.position_end = endPosition;
+                }
+
                 // Clear session start time after pause
                 setSessionStartTime(null);
                 sessionStartTimeRef.current = null;
+                sessionStartPositionRef.current = null;
             }
 
             await trackProgress(progressData);
@@ -704,7 +727,9 @@ const CourseDetail = () => {
                                     const videoId = extractVideoId(video.video_link);
                                     const isSelected = selectedVideo && selectedVideo.id === video.id;
                                     const progress = videoProgress[video.id] || { watchTime: 0 };
-                                    const progressPercentage = progress.watchTime > 0 ? Math.min((progress.watchTime / 600) * 100, 100) : 0;
+                                    // Videos imported before durations were recorded assume 10 minutes
+                                    const duration = video.duration_seconds || 600;
+                                    const progressPercentage = progress.watchTime > 0 ? Math.min((progress.watchTime / duration) * 100, 100) : 0;
 
                                     return (
                                         <div